@@ -118,6 +118,23 @@ def init(site, sites_path=None, new_site=False):
 	if not sites_path:
 		sites_path = '.'
 
+	local.site = site
+	local.sites_path = sites_path
+	local.site_path = os.path.join(sites_path, site)
+	local.flags = _dict(new_site=new_site)
+
+	local.conf = _dict(get_site_config())
+	local.module_app = None
+	local.app_modules = None
+
+	reset_local(new_site=new_site)
+	setup_module_map()
+
+	local.initialised = True
+
+def reset_local(new_site=False):
+	"""Reset the state of `frappe.local` for a new request or job, except for the site,
+	its config and module map (set by `init`) and the database connection"""
 	local.error_log = []
 	local.message_log = []
 	local.debug_log = []
@@ -139,20 +156,12 @@ def init(site, sites_path=None, new_site=False):
 	local.rollback_observers = []
 	local.test_objects = {}
 
-	local.site = site
-	local.sites_path = sites_path
-	local.site_path = os.path.join(sites_path, site)
-
 	local.request_ip = None
 	local.response = _dict({"docs":[]})
 	local.task_id = None
 
-	local.conf = _dict(get_site_config())
 	local.lang = local.conf.lang or "en"
 	local.lang_full_dict = None
-
-	local.module_app = None
-	local.app_modules = None
 	local.system_settings = _dict()
 
 	local.user = None
@@ -171,10 +180,6 @@ def init(site, sites_path=None, new_site=False):
 	local.form_dict = _dict()
 	local.session = _dict()
 
-	setup_module_map()
-
-	local.initialised = True
-
 def connect(site=None, db_name=None):
 	"""Connect to site database instance.
 
@@ -252,6 +257,10 @@ def destroy():
 	if db:
 		db.close()
 
+	if getattr(local, "replica_dbs", None):
+		from frappe.database.replica import close_replica_connections
+		close_replica_connections()
+
 	release_local(local)
 
 # memcache
@@ -502,21 +511,16 @@ def whitelist(allow_guest=False, xss_safe=False):
 	return innerfn
 
 def read_only():
+	"""Decorator: route plain `SELECT` queries of the method to a read replica, if
+	`read_from_replica` is set. Reads after a write stay on the primary.
+	See `frappe.database.replica`."""
 	def innfn(fn):
 		def wrapper_fn(*args, **kwargs):
-			if conf.read_from_replica:
-				connect_replica()
+			from frappe.database.replica import route_reads_to_replica
 
-			try:
-				retval = fn(*args, **get_newargs(fn, kwargs))
-			except:
-				raise
-			finally:
-				if local and hasattr(local, 'primary_db'):
-					local.db.close()
-					local.db = local.primary_db
+			with route_reads_to_replica():
+				return fn(*args, **get_newargs(fn, kwargs))
 
-			return retval
 		return wrapper_fn
 	return innfn
 
@@ -673,6 +677,10 @@ def set_value(doctype, docname, fieldname, value=None):
 	return frappe.client.set_value(doctype, docname, fieldname, value)
 
 def get_cached_doc(*args, **kwargs):
+	"""Same as `get_doc`, but the document is served from (and stored in) the bounded
+	document cache. See `frappe.utils.document_cache`."""
+	from frappe.utils import document_cache
+
 	if args and len(args) > 1 and isinstance(args[1], text_type):
 		key = get_document_cache_key(args[0], args[1])
 		# local cache
@@ -681,12 +689,20 @@ def get_cached_doc(*args, **kwargs):
 			return doc
 
 		# redis cache
-		doc = cache().hget('document_cache', key)
+		doc = document_cache.get_doc(args[0], args[1])
 		if doc:
 			doc = get_doc(doc)
 			local.document_cache[key] = doc
 			return doc
 
+		# database
+		doc = get_doc(*args, **kwargs)
+		if not document_cache.is_cached_doctype(args[0]):
+			# cached doctypes are already set by get_doc
+			document_cache.set_doc(args[0], args[1], doc.as_dict())
+
+		return doc
+
 	# database
 	doc = get_doc(*args, **kwargs)
 
@@ -696,11 +712,13 @@ def get_document_cache_key(doctype, name):
 	return '{0}::{1}'.format(doctype, name)
 
 def clear_document_cache(doctype, name):
+	from frappe.utils import document_cache
+
 	cache().hdel("last_modified", doctype)
 	key = get_document_cache_key(doctype, name)
 	if key in local.document_cache:
 		del local.document_cache[key]
-	cache().hdel('document_cache', key)
+	document_cache.delete_doc(doctype, name)
 
 def get_cached_value(doctype, name, fieldname, as_dict=False):
 	doc = get_cached_doc(doctype, name)
@@ -737,10 +755,23 @@ def get_doc(*args, **kwargs):
 	if args and len(args) > 1:
 		key = get_document_cache_key(args[0], args[1])
 		local.document_cache[key] = doc
-		cache().hset('document_cache', key, doc.as_dict())
+
+		# only doctypes that opt in are written to redis on every load
+		from frappe.utils import document_cache
+		if isinstance(args[1], string_types) and document_cache.is_cached_doctype(args[0]):
+			document_cache.set_doc(args[0], args[1], doc.as_dict())
 
 	return doc
 
+def get_docs(doctype, names):
+	"""Return a list of `frappe.model.document.Document` objects of the given DocType and names,
+	loaded in bulk (one query for parents and one per child DocType).
+
+	:param doctype: DocType name as string.
+	:param names: List of document names."""
+	import frappe.model.document
+	return frappe.model.document.get_docs(doctype, names)
+
 def get_last_doc(doctype):
 	"""Get last created document of this type."""
 	d = get_all(doctype, ["name"], order_by="creation desc", limit_page_length=1)
@@ -1259,9 +1290,18 @@ def get_list(doctype, *args, **kwargs):
 
 		# filter as a list of dicts
 		frappe.get_list("ToDo", fields="*", filters = {"description": ("like", "test%")})
+
+	Permission checked lists are read from a replica, if `read_from_replica` is set
+	(see `frappe.database.replica`).
 	"""
 	import frappe.model.db_query
-	return frappe.model.db_query.DatabaseQuery(doctype).execute(None, *args, **kwargs)
+	from frappe.database.replica import route_reads_to_replica
+
+	if kwargs.get("ignore_permissions"):
+		return frappe.model.db_query.DatabaseQuery(doctype).execute(None, *args, **kwargs)
+
+	with route_reads_to_replica():
+		return frappe.model.db_query.DatabaseQuery(doctype).execute(None, *args, **kwargs)
 
 def get_all(doctype, *args, **kwargs):
 	"""List database query via `frappe.model.db_query`. Will **not** check for permissions.
@@ -116,6 +116,11 @@ def init_request(request):
 
 	frappe.local.http_request = frappe.auth.HTTPRequest()
 
+	if request.method in ("GET", "HEAD"):
+		# plain reads of GET requests go to read replicas (if configured), sessions
+		# are read from the primary while authenticating
+		frappe.local.flags.read_from_replica = True
+
 def make_form_dict(request):
 	import json
 
@@ -33,7 +33,7 @@ def clear_user_cache(user=None):
 	if user:
 		for name in user_cache_keys:
 			cache.hdel(name, user)
-		cache.delete_keys("user:" + user)
+		cache.delete_user_keys(user)
 		clear_defaults_cache(user)
 	else:
 		for name in user_cache_keys:
@@ -57,8 +57,10 @@ def clear_defaults_cache(user=None):
 		frappe.cache().delete_key("defaults")
 
 def clear_document_cache():
+	from frappe.utils import document_cache
+
 	frappe.local.document_cache = {}
-	frappe.cache().delete_key("document_cache")
+	document_cache.clear()
 
 def clear_doctype_cache(doctype=None):
 	cache = frappe.cache()
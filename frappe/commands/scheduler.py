@@ -153,9 +153,23 @@ def start_scheduler():
 @click.command('worker')
 @click.option('--queue', type=str)
 @click.option('--quiet', is_flag = True, default = False, help = 'Hide Log Outputs')
-def start_worker(queue, quiet = False):
+@click.option('--processes', type=int, help='Number of pre-forked worker processes that run jobs without forking')
+@click.option('--max-jobs', type=int, help='Jobs after which a pre-forked process is replaced')
+@click.option('--max-memory', type=int, help='Memory (MB) after which a pre-forked process is replaced')
+def start_worker(queue, quiet = False, processes=None, max_jobs=None, max_memory=None):
 	from frappe.utils.background_jobs import start_worker
-	start_worker(queue, quiet = quiet)
+	start_worker(queue, quiet = quiet, processes=processes, max_jobs=max_jobs, max_memory=max_memory)
+
+@click.command('worker-benchmark')
+@click.option('--jobs', type=int, default=1000, help='Number of jobs to run in each mode')
+@pass_context
+def worker_benchmark(context, jobs=1000):
+	"Compare jobs per second with the site initialised for every job and kept between jobs (pre-forked workers)"
+	from frappe.utils.worker_pool import benchmark
+	site = get_site(context)
+	results = benchmark(site, jobs)
+	print("initialised for every job: {0:.1f} jobs/s".format(results.cold))
+	print("kept between jobs: {0:.1f} jobs/s ({1:.1f}x)".format(results.warm, results.warm / results.cold))
 
 @click.command('ready-for-migration')
 @click.option('--site', help='site name')
@@ -193,4 +207,5 @@ commands = [
 	start_scheduler,
 	start_worker,
 	trigger_scheduler_event,
+	worker_benchmark,
 ]
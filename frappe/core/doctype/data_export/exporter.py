@@ -6,8 +6,9 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 import frappe.permissions
-import re, csv, os
-from frappe.utils.csvutils import UnicodeWriter
+import re, csv
+from frappe.model.db_query import DatabaseQuery
+from frappe.utils.export import ExportWriter, enqueue_export, BATCH_SIZE
 from frappe.utils import cstr, formatdate, format_datetime, parse_json, cint
 from frappe.core.doctype.data_import.importer import get_data_keys
 from six import string_types
@@ -70,42 +71,43 @@ class DataExporter:
 				self.child_doctypes.append(dict(doctype=df.options, parentfield=df.fieldname))
 
 	def build_response(self):
-		self.writer = UnicodeWriter()
+		if self.with_data and enqueue_export("frappe.core.doctype.data_export.exporter.export_data",
+			self.doctype, filters=self.filters):
+			return
+
+		# values of the Excel file are text, as they are for the CSV file
+		self.writer = ExportWriter(self.file_type, "Data Import Template" if self.template else "Data Export",
+			quoting=csv.QUOTE_NONNUMERIC, strip_html=False, as_text=self.file_type == 'Excel')
 		self.name_field = 'parent' if self.parent_doctype != self.doctype else 'name'
 
-		if self.template:
-			self.add_main_header()
+		with self.writer:
+			if self.template:
+				self.add_main_header()
 
-		self.writer.writerow([''])
-		self.tablerow = [self.data_keys.doctype]
-		self.labelrow = [_("Column Labels:")]
-		self.fieldrow = [self.data_keys.columns]
-		self.mandatoryrow = [_("Mandatory:")]
-		self.typerow = [_('Type:')]
-		self.inforow = [_('Info:')]
-		self.columns = []
+			self.writer.writerow([''])
+			self.tablerow = [self.data_keys.doctype]
+			self.labelrow = [_("Column Labels:")]
+			self.fieldrow = [self.data_keys.columns]
+			self.mandatoryrow = [_("Mandatory:")]
+			self.typerow = [_('Type:')]
+			self.inforow = [_('Info:')]
+			self.columns = []
 
-		self.build_field_columns(self.doctype)
+			self.build_field_columns(self.doctype)
 
-		if self.all_doctypes:
-			for d in self.child_doctypes:
-				self.append_empty_field_column()
-				if (self.select_columns and self.select_columns.get(d['doctype'], None)) or not self.select_columns:
-					# if atleast one column is selected for this doctype
-					self.build_field_columns(d['doctype'], d['parentfield'])
-
-		self.add_field_headings()
-		self.add_data()
-		if self.with_data and not self.data:
-			frappe.respond_as_web_page(_('No Data'), _('There is no data to be exported'), indicator_color='orange')
-
-		if self.file_type == 'Excel':
-			self.build_response_as_excel()
-		else:
-			# write out response as a type csv
-			frappe.response['result'] = cstr(self.writer.getvalue())
-			frappe.response['type'] = 'csv'
-			frappe.response['doctype'] = self.doctype
+			if self.all_doctypes:
+				for d in self.child_doctypes:
+					self.append_empty_field_column()
+					if (self.select_columns and self.select_columns.get(d['doctype'], None)) or not self.select_columns:
+						# if atleast one column is selected for this doctype
+						self.build_field_columns(d['doctype'], d['parentfield'])
+
+			self.add_field_headings()
+			self.add_data()
+			if self.with_data and not self.data_count:
+				frappe.respond_as_web_page(_('No Data'), _('There is no data to be exported'), indicator_color='orange')
+
+			self.writer.set_response(self.doctype)
 
 	def add_main_header(self):
 		self.writer.writerow([_('Data Import Template')])
@@ -261,47 +263,70 @@ class DataExporter:
 		table_columns = frappe.db.get_table_columns(self.parent_doctype)
 		if 'lft' in table_columns and 'rgt' in table_columns:
 			order_by = '`tab{doctype}`.`lft` asc'.format(doctype=self.parent_doctype)
-		# get permitted data only
-		self.data = frappe.get_list(self.doctype, fields=["*"], filters=self.filters, limit_page_length=None, order_by=order_by)
-
-		for doc in self.data:
-			op = self.docs_to_export.get("op")
-			names = self.docs_to_export.get("name")
-
-			if names and op:
-				if op == '=' and doc.name not in names:
-					continue
-				elif op == '!=' and doc.name in names:
-					continue
-			elif names:
-				try:
-					sflags = self.docs_to_export.get("flags", "I,U").upper()
-					flags = 0
-					for a in re.split('\W+',sflags):
-						flags = flags | reflags.get(a,0)
-
-					c = re.compile(names, flags)
-					m = c.match(doc.name)
-					if not m:
-						continue
-				except Exception:
-					if doc.name not in names:
-						continue
-			# add main table
-			rows = []
-
-			self.add_data_row(rows, self.doctype, None, doc, 0)
-
-			if self.all_doctypes:
-				# add child tables
-				for c in self.child_doctypes:
-					for ci, child in enumerate(frappe.db.sql("""select * from `tab{0}`
-						where parent=%s and parentfield=%s order by idx""".format(c['doctype']),
-						(doc.name, c['parentfield']), as_dict=1)):
-						self.add_data_row(rows, c['doctype'], c['parentfield'], child, ci)
-
-			for row in rows:
-				self.writer.writerow(row)
+		# get permitted data only, in batches
+		self.data_count = 0
+		for batch in DatabaseQuery(self.doctype).iterate(batch_size=BATCH_SIZE, fields=["*"],
+			filters=self.filters, order_by=order_by):
+			self.data_count += len(batch)
+			docs = [doc for doc in batch if self.is_selected(doc)]
+			children = self.get_children(docs) if self.all_doctypes else {}
+
+			for doc in docs:
+				# add main table
+				rows = []
+
+				self.add_data_row(rows, self.doctype, None, doc, 0)
+
+				if self.all_doctypes:
+					# add child tables
+					for c in self.child_doctypes:
+						for ci, child in enumerate(children.get((c['doctype'], c['parentfield'], doc.name), [])):
+							self.add_data_row(rows, c['doctype'], c['parentfield'], child, ci)
+
+				for row in rows:
+					self.writer.writerow(row)
+
+	def is_selected(self, doc):
+		"""Check the name of the document against `docs_to_export`"""
+		op = self.docs_to_export.get("op")
+		names = self.docs_to_export.get("name")
+
+		if names and op:
+			if op == '=' and doc.name not in names:
+				return False
+			elif op == '!=' and doc.name in names:
+				return False
+		elif names:
+			try:
+				sflags = self.docs_to_export.get("flags", "I,U").upper()
+				flags = 0
+				for a in re.split('\W+',sflags):
+					flags = flags | reflags.get(a,0)
+
+				c = re.compile(names, flags)
+				m = c.match(doc.name)
+				if not m:
+					return False
+			except Exception:
+				if doc.name not in names:
+					return False
+
+		return True
+
+	def get_children(self, docs):
+		"""Returns rows of child tables by (doctype, parentfield, parent), one query per table"""
+		children = {}
+		names = [doc.name for doc in docs]
+		if not names:
+			return children
+
+		for c in self.child_doctypes:
+			for child in frappe.db.sql("""select * from `tab{0}`
+				where parentfield=%s and parent in ({1}) order by idx""".format(c['doctype'],
+				", ".join(["%s"] * len(names))), [c['parentfield']] + names, as_dict=1):
+				children.setdefault((c['doctype'], c['parentfield'], child.parent), []).append(child)
+
+		return children
 
 	def add_data_row(self, rows, dt, parentfield, doc, rowidx):
 		d = doc.copy()
@@ -328,24 +353,6 @@ class DataExporter:
 
 				row[_column_start_end.start + i + 1] = value
 
-	def build_response_as_excel(self):
-		filename = frappe.generate_hash("", 10)
-		with open(filename, 'wb') as f:
-			f.write(cstr(self.writer.getvalue()).encode('utf-8'))
-		f = open(filename)
-		reader = csv.reader(f)
-
-		from frappe.utils.xlsxutils import make_xlsx
-		xlsx_file = make_xlsx(reader, "Data Import Template" if self.template else 'Data Export')
-
-		f.close()
-		os.remove(filename)
-
-		# write out response as a xlsx type
-		frappe.response['filename'] = self.doctype + '.xlsx'
-		frappe.response['filecontent'] = xlsx_file.getvalue()
-		frappe.response['type'] = 'binary'
-
 	def _append_name_column(self, dt=None):
 		self.append_field_column(frappe._dict({
 			"fieldname": "name" if dt else self.name_field,
@@ -3,7 +3,7 @@
 # For license information, please see license.txt
 
 from __future__ import unicode_literals
-import frappe, os
+import frappe, os, shutil
 from frappe import _
 import frappe.modules.import_file
 from frappe.model.document import Document
@@ -103,8 +103,14 @@ def export_json(doctype, path, filters=None, or_filters=None, name=None, order_b
 
 def export_csv(doctype, path):
 	from frappe.core.doctype.data_export.exporter import export_data
+	export_data(doctype=doctype, all_doctypes=True, template=True, with_data=True)
+
+	if frappe.response.type == "file":
+		# large exports are written to a temporary file
+		shutil.move(frappe.response.filepath, path)
+		return
+
 	with open(path, "wb") as csvfile:
-		export_data(doctype=doctype, all_doctypes=True, template=True, with_data=True)
 		csvfile.write(frappe.response.result.encode("utf-8"))
 
 
@@ -20,6 +20,9 @@ import shutil
 import requests
 import requests.exceptions
 import imghdr
+import mmap
+import tempfile
+import time
 
 from frappe.utils import get_hook_method, get_files_path, random_string, encode, cstr, call_hook_method, cint
 from frappe import _
@@ -32,6 +35,15 @@ from six.moves.urllib.parse import unquote
 from six import text_type, PY2
 import zipfile
 
+# attachments of a file url: cached for `FILE_URL_CACHE_TTL` seconds, cleared when a
+# File with the url is saved or deleted
+FILE_URL_CACHE_KEY = "file_url::{0}"
+FILE_URL_CACHE_TTL = 300
+
+# download permission of a user for a file url, see `has_download_permission`
+DOWNLOAD_PERMISSION_KEY = "download_permission::{0}"
+DOWNLOAD_PERMISSION_TTL = 60
+
 class MaxFileSizeReachedError(frappe.ValidationError):
 	pass
 
@@ -40,6 +52,12 @@ class FolderNotEmpty(frappe.ValidationError): pass
 
 exclude_from_linked_with = True
 
+# bytes read at a time when hashing or writing files
+CHUNK_SIZE = 1024 * 1024
+
+# uploads still being written, or left behind, older than this (seconds) are removed
+STALE_UPLOAD_AGE = 24 * 60 * 60
+
 
 class File(NestedSet):
 	nsm_parent_field = 'folder'
@@ -52,6 +70,21 @@ class File(NestedSet):
 		self.decode = self.get("decode", False)
 		if self.content:
 			self.save_file(content=self.content, decode=self.decode)
+		else:
+			self.validate_private_file_url()
+
+	def validate_private_file_url(self):
+		"""A private file of other Files can only be referred to by users that can download it"""
+		if self.flags.ignore_permissions or not (self.file_url or "").startswith("/private/files/"):
+			return
+
+		try:
+			allowed = has_download_permission(self.file_url)
+		except frappe.DoesNotExistError:
+			return
+
+		if not allowed:
+			frappe.throw(_("You don't have permission to access this file"), frappe.PermissionError)
 
 	def get_name_based_on_parent_folder(self):
 		if self.folder:
@@ -100,6 +133,7 @@ class File(NestedSet):
 			self.generate_content_hash()
 
 		self.set_folder_size()
+		self.update_folder_size_on_change()
 		self.validate_url()
 
 		if frappe.db.exists('File', {'name': self.name, 'is_folder': 0}):
@@ -137,13 +171,9 @@ class File(NestedSet):
 
 
 	def set_folder_size(self):
-		"""Set folder size if folder"""
+		"""Set folder size if folder, as it is updated incrementally in the database"""
 		if self.is_folder and not self.is_new():
-			self.file_size = cint(self.get_folder_size())
-			self.db_set('file_size', self.file_size)
-
-			for folder in self.get_ancestors():
-				frappe.db.set_value("File", folder, "file_size", self.get_folder_size(folder))
+			self.file_size = cint(frappe.db.get_value("File", self.name, "file_size"))
 
 	def get_folder_size(self, folder=None):
 		"""Returns folder size for current folder"""
@@ -157,8 +187,22 @@ class File(NestedSet):
 
 	def update_parent_folder_size(self):
 		"""Update size of parent folder"""
-		if self.folder and not self.is_folder: # it not home
-			frappe.get_doc("File", self.folder).set_folder_size()
+		add_to_folder_size(self.folder, cint(self.file_size))
+
+	def update_folder_size_on_change(self):
+		"""Move the size from the previous folder if moved, or update the folder if the
+		size of the file has changed"""
+		previous = self.get_doc_before_save()
+		if self.is_new() or not previous:
+			return
+
+		size = cint(self.file_size)
+		previous_size = size if self.is_folder else cint(previous.file_size)
+		if previous.folder != self.folder:
+			add_to_folder_size(previous.folder, -previous_size)
+			add_to_folder_size(self.folder, size)
+		elif size != previous_size:
+			add_to_folder_size(self.folder, size - previous_size)
 
 	def set_folder_name(self):
 		"""Make parent folders if not exists based on reference doctype and name"""
@@ -209,15 +253,28 @@ class File(NestedSet):
 		if self.file_url.startswith("/files/"):
 			try:
 				with open(get_files_path(self.file_name.lstrip("/")), "rb") as f:
-					self.content_hash = get_content_hash(f.read())
+					self.content_hash = get_content_hash(f)
 			except IOError:
 				frappe.msgprint(_("File {0} does not exist").format(self.file_url))
 				raise
 
+	def on_update(self):
+		super(File, self).on_update()
+		self.clear_file_url_cache()
+
+	def clear_file_url_cache(self):
+		previous = self.get_doc_before_save()
+		for file_url in set([self.file_url, previous and previous.file_url]):
+			if file_url:
+				frappe.cache().delete_value(FILE_URL_CACHE_KEY.format(file_url))
+
 	def on_trash(self):
 		if self.is_home_folder or self.is_attachments_folder:
 			frappe.throw(_("Cannot delete Home and Attachments folders"))
+		self.clear_file_url_cache()
 		self.check_folder_is_empty()
+		if not self.flags.on_rollback:
+			add_to_folder_size(self.folder, -cint(self.file_size))
 		super(File, self).on_trash()
 		self.call_delete_file()
 		if not self.is_folder:
@@ -260,9 +317,6 @@ class File(NestedSet):
 
 			return thumbnail_url
 
-	def after_delete(self):
-		self.update_parent_folder_size()
-
 	def check_folder_is_empty(self):
 		"""Throw exception if folder is not empty"""
 		files = frappe.get_all("File", filters={"folder": self.name}, fields=("name", "file_name"))
@@ -292,7 +346,7 @@ class File(NestedSet):
 		base_url = os.path.dirname(self.file_url)
 
 		files = []
-		with zipfile.ZipFile(zip_path) as zf:
+		with zipfile.ZipFile(zip_path) as zf, bulk_folder_size_update():
 			zf.extractall(os.path.dirname(zip_path))
 			for info in zf.infolist():
 				if not info.filename.startswith('__MACOSX'):
@@ -377,6 +431,25 @@ class File(NestedSet):
 
 		return content
 
+	def open_content(self, memory_map=False):
+		"""Returns the content as a binary file object, or a read-only memory map with
+		`memory_map`, so that it is not read in memory at once. To be closed by the caller"""
+		if self.get('content'):
+			content = self.content
+			return io.BytesIO(content.encode() if isinstance(content, text_type) else content)
+
+		f = io.open(encode(self.get_full_path()), mode='rb')
+		if not memory_map:
+			return f
+
+		try:
+			return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			# empty file
+			return io.BytesIO(b"")
+		finally:
+			f.close()
+
 	def get_full_path(self):
 		"""Returns file path from given file name"""
 
@@ -467,6 +540,13 @@ class File(NestedSet):
 
 
 	def save_file(self, content=None, decode=False):
+		if hasattr(content, "read") and not get_hook_method('write_file'):
+			return self.save_file_from_stream(content)
+
+		if hasattr(content, "read"):
+			# custom storage gets the content in memory
+			content = content.read()
+
 		file_exists = False
 		self.content = content
 		if decode:
@@ -499,8 +579,41 @@ class File(NestedSet):
 			return self.save_file_on_filesystem()
 
 
-	def save_file_on_filesystem(self):
-		fpath = self.write_file()
+	def save_file_from_stream(self, stream):
+		"""Write the content of a file-like object to disk in chunks, hashing it on the way.
+		If a file with the same content exists, it is used instead"""
+		self.content = None
+		if not self.is_private:
+			self.is_private = 0
+		self.content_type = mimetypes.guess_type(self.file_name)[0]
+
+		folder = get_files_path(is_private=self.is_private)
+		frappe.create_folder(folder)
+
+		temp_path, self.file_size, self.content_hash = write_stream(stream, get_uploads_path())
+		try:
+			_file = frappe.get_value("File", {"content_hash": self.content_hash}, ["file_url"])
+			if _file:
+				self.file_url = _file
+				return
+
+			if os.path.exists(encode(os.path.join(folder, self.file_name))):
+				self.file_name = get_file_name(self.file_name, self.content_hash[-6:])
+
+			call_hook_method("before_write_file", file_size=self.file_size)
+			os.rename(temp_path, encode(os.path.join(folder, self.file_name)))
+			temp_path = None
+		finally:
+			if temp_path:
+				os.remove(temp_path)
+
+		return self.save_file_on_filesystem(written=True)
+
+	def save_file_on_filesystem(self, written=False):
+		if written:
+			fpath = get_files_path(self.file_name, is_private=self.is_private)
+		else:
+			fpath = self.write_file()
 
 		if self.is_private:
 			self.file_url = "/private/files/{0}".format(self.file_name)
@@ -571,6 +684,8 @@ class File(NestedSet):
 def on_doctype_update():
 	frappe.db.add_index("File", ["attached_to_doctype", "attached_to_name"])
 	frappe.db.add_index("File", ["lft", "rgt"])
+	# to look up private files on download, the url is text in MariaDB
+	frappe.db.add_index("File", ["file_url" if frappe.db.db_type == "postgres" else "file_url(255)"])
 
 def make_home_folder():
 	home = frappe.get_doc({
@@ -613,12 +728,104 @@ def move_file(file_list, new_parent, old_parent):
 	if isinstance(file_list, string_types):
 		file_list = json.loads(file_list)
 
-	for file_obj in file_list:
-		setup_folder_path(file_obj.get("name"), new_parent)
+	with bulk_folder_size_update():
+		for file_obj in file_list:
+			setup_folder_path(file_obj.get("name"), new_parent)
+
+class bulk_folder_size_update(object):
+	"""Context manager that adds up changes in folder sizes within it, to update each
+	folder (and its ancestors) once at the end"""
+	def __enter__(self):
+		self.nested = frappe.flags.folder_size_deltas is not None
+		if not self.nested:
+			frappe.flags.folder_size_deltas = {}
+
+	def __exit__(self, type, value, traceback):
+		if self.nested:
+			return
+
+		deltas = frappe.flags.folder_size_deltas
+		frappe.flags.folder_size_deltas = None
+		if not type:
+			update_folder_sizes(deltas)
+
+def add_to_folder_size(folder, delta):
+	"""Add `delta` to the size of the folder and its ancestors"""
+	if not folder or not delta:
+		return
 
-	# recalculate sizes
-	frappe.get_doc("File", old_parent).save()
-	frappe.get_doc("File", new_parent).save()
+	deltas = frappe.flags.folder_size_deltas
+	if deltas is not None:
+		deltas[folder] = deltas.get(folder, 0) + delta
+	else:
+		update_folder_sizes({folder: delta})
+
+def update_folder_sizes(deltas):
+	for folder, delta in deltas.items():
+		if not delta:
+			continue
+
+		values = frappe.db.get_value("File", folder, ["lft", "rgt"])
+		if values and values[0] and values[1]:
+			frappe.db.sql("""update tabFile set file_size = coalesce(file_size, 0) + %s
+				where is_folder = 1 and lft <= %s and rgt >= %s""", (delta, values[0], values[1]))
+			continue
+
+		# lft, rgt not set yet (bulk tree update), follow parents
+		ancestors = set()
+		while folder and folder not in ancestors:
+			ancestors.add(folder)
+			frappe.db.sql("""update tabFile set file_size = coalesce(file_size, 0) + %s
+				where name = %s""", (delta, folder))
+			folder = frappe.db.get_value("File", folder, "folder")
+
+def reconcile_folder_sizes():
+	"""Set sizes of folders that have drifted to the total size of the files in them"""
+	folders, current = {}, {}
+	for name, parent, file_size in frappe.db.sql("""select name, folder, file_size
+		from tabFile where is_folder = 1"""):
+		folders[name] = parent
+		current[name] = cint(file_size)
+
+	sizes = dict.fromkeys(folders, 0)
+	for folder, file_size in frappe.db.sql("""select folder, sum(file_size)
+		from tabFile where is_folder = 0 group by folder"""):
+		ancestors = set()
+		while folder in sizes and folder not in ancestors:
+			ancestors.add(folder)
+			sizes[folder] += cint(file_size)
+			folder = folders[folder]
+
+	for folder, size in sizes.items():
+		if size != current[folder]:
+			# skip folders updated since they were read
+			frappe.db.sql("""update tabFile set file_size = %s
+				where name = %s and coalesce(file_size, 0) = %s""", (size, folder, current[folder]))
+
+def get_uploads_path():
+	"""Returns the folder for uploads being written, private and on the same filesystem
+	as the site's files so that they can be moved there"""
+	path = frappe.get_site_path("private", "uploads")
+	frappe.create_folder(path)
+	return path
+
+def remove_stale_uploads():
+	"""Remove uploads left behind by workers that died while writing them"""
+	folders = [get_uploads_path(), get_files_path(is_private=0), get_files_path(is_private=1)]
+	expiry = time.time() - STALE_UPLOAD_AGE
+
+	for folder in folders:
+		if not os.path.exists(folder):
+			continue
+
+		for fname in os.listdir(folder):
+			path = os.path.join(folder, fname)
+			if fname.startswith(".upload-") and os.path.getmtime(path) < expiry:
+				try:
+					os.remove(path)
+				except OSError:
+					# removed by another process
+					pass
 
 def setup_folder_path(filename, new_parent):
 	file = frappe.get_doc("File", filename)
@@ -753,6 +960,72 @@ def remove_all(dt, dn, from_delete=False):
 		if e.args[0]!=1054: raise # (temp till for patched)
 
 
+def has_download_permission(file_url):
+	"""Returns True if the session user can download the private file at `file_url`.
+
+	The decision is cached per user for `download_permission_ttl` seconds (site config,
+	default 60, 0 to disable), so a revoked permission still allows downloads until then.
+	Raises `frappe.DoesNotExistError` if there is no File with this url."""
+	ttl = cint(frappe.local.conf.get("download_permission_ttl", DOWNLOAD_PERMISSION_TTL))
+	key = DOWNLOAD_PERMISSION_KEY.format(file_url)
+
+	if ttl > 0:
+		allowed = frappe.cache().get_value(key, user=True, expires=True)
+		if allowed is not None:
+			return bool(allowed)
+
+	try:
+		allowed = check_download_permission(get_file_url_attachments(file_url))
+	except frappe.DoesNotExistError:
+		# the cached document may have been renamed or deleted since
+		allowed = check_download_permission(get_file_url_attachments(file_url, cached=False),
+			allow_missing=True)
+
+	if ttl > 0:
+		frappe.cache().set_value(key, int(allowed), user=True, expires_in_sec=ttl)
+
+	return allowed
+
+def check_download_permission(attachments, allow_missing=False):
+	"""Returns True if any private File with the url is attached to a document the user can
+	read (the same content is shared by Files with the same url). Raises
+	`frappe.DoesNotExistError` if an attached document does not exist, unless `allow_missing`."""
+	for d in attachments:
+		if not (d.attached_to_doctype and d.attached_to_name):
+			# as `has_permission`
+			return True
+
+		try:
+			ref_doc = frappe.get_doc(d.attached_to_doctype, d.attached_to_name)
+		except frappe.DoesNotExistError:
+			if not allow_missing:
+				raise
+			# as `has_permission`, the document may not be created yet
+			return True
+
+		if ref_doc.has_permission("read"):
+			return True
+
+	return False
+
+def get_file_url_attachments(file_url, cached=True):
+	"""Returns `attached_to_doctype` and `attached_to_name` of private Files with this url
+	(public Files do not give access to private files). Raises `frappe.DoesNotExistError`
+	if there are none."""
+	key = FILE_URL_CACHE_KEY.format(file_url)
+	attachments = frappe.cache().get_value(key, expires=True) if cached else None
+
+	if attachments is None:
+		attachments = frappe.db.sql("""select attached_to_doctype, attached_to_name
+			from `tabFile` where file_url=%s and is_private=1 order by creation""", (file_url,), as_dict=True)
+		if attachments:
+			frappe.cache().set_value(key, attachments, expires_in_sec=FILE_URL_CACHE_TTL)
+
+	if not attachments:
+		raise frappe.DoesNotExistError(_("File {0} not found").format(file_url))
+
+	return attachments
+
 def has_permission(doc, ptype=None, user=None):
 	permission = True
 
@@ -794,9 +1067,56 @@ def remove_file_by_url(file_url, doctype=None, name=None):
 
 
 def get_content_hash(content):
-	if isinstance(content, text_type):
-		content = content.encode()
-	return hashlib.md5(content).hexdigest() #nosec
+	"""Returns the MD5 hash of content (bytes, text or a file-like object, read in chunks)"""
+	if not hasattr(content, "read"):
+		if isinstance(content, text_type):
+			content = content.encode()
+		return hashlib.md5(content).hexdigest() #nosec
+
+	content_hash = hashlib.md5() #nosec
+	while True:
+		chunk = content.read(CHUNK_SIZE)
+		if not chunk:
+			break
+		content_hash.update(chunk.encode() if isinstance(chunk, text_type) else chunk)
+
+	return content_hash.hexdigest()
+
+def write_stream(stream, folder):
+	"""Write a file-like object to a temporary file in `folder` in chunks. Returns the
+	path, size and content hash of the file"""
+	max_file_size = get_max_file_size()
+	content_hash = hashlib.md5() #nosec
+	file_size = 0
+
+	fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".upload-")
+	try:
+		with os.fdopen(fd, "wb") as f:
+			while True:
+				chunk = stream.read(CHUNK_SIZE)
+				if not chunk:
+					break
+
+				if isinstance(chunk, text_type):
+					chunk = chunk.encode()
+
+				file_size += len(chunk)
+				if file_size > max_file_size:
+					frappe.msgprint(_("File size exceeded the maximum allowed size of {0} MB").format(
+						max_file_size / 1048576), raise_exception=MaxFileSizeReachedError)
+
+				content_hash.update(chunk)
+				f.write(chunk)
+
+		# mkstemp creates files only readable by the owner
+		umask = os.umask(0)
+		os.umask(umask)
+		os.chmod(temp_path, 0o666 & ~umask)
+	except Exception:
+		os.remove(temp_path)
+		raise
+
+	return temp_path, file_size, content_hash.hexdigest()
 
 
 def get_file_name(fname, optional_suffix):
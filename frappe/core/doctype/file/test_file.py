@@ -253,6 +253,132 @@ class TestFile(unittest.TestCase):
 		self.assertEqual(d.folder, "Home")
 
 
+	def test_bulk_tree_update(self):
+		from frappe.utils.nestedset import bulk_update, rebuild_tree
+
+		with bulk_update("File", "folder"):
+			for i in range(5):
+				self.get_folder("Test Bulk Folder {0}".format(i), "Home")
+
+		get_tree = lambda: dict(frappe.db.sql("select name, rgt - lft from tabFile where lft > 0"))
+		home = frappe.db.get_value("File", "Home", ["lft", "rgt"], as_dict=True)
+		folder = frappe.db.get_value("File", _("Home/Test Bulk Folder 4"), ["lft", "rgt"], as_dict=True)
+		self.assertTrue(home.lft < folder.lft and folder.rgt == folder.lft + 1 and folder.rgt < home.rgt)
+
+		tree = get_tree()
+		rebuild_tree("File", "folder")
+		self.assertEqual(tree, get_tree())
+
+	def test_folder_size_updates(self):
+		from frappe.core.doctype.file.file import bulk_folder_size_update, reconcile_folder_sizes
+
+		folder = _("Home/Test Folder 1")
+		file_size = frappe.db.get_value("File", self.saved_name, "file_size")
+
+		with bulk_folder_size_update():
+			for i in range(3):
+				frappe.get_doc({
+					"doctype": "File",
+					"file_name": "bulk_{0}.txt".format(i),
+					"folder": folder,
+					"content": "Testing bulk upload {0}.".format(i)}).insert()
+
+			self.assertEqual(frappe.db.get_value("File", folder, "file_size"), file_size)
+
+		total = frappe.db.sql("select sum(file_size) from tabFile where folder=%s", folder)[0][0]
+		self.assertEqual(frappe.db.get_value("File", folder, "file_size"), total)
+
+		frappe.db.set_value("File", folder, "file_size", 0)
+		reconcile_folder_sizes()
+		self.assertEqual(frappe.db.get_value("File", folder, "file_size"), total)
+
+	def test_save_from_stream(self):
+		import io
+		from frappe.core.doctype.file.file import get_content_hash
+
+		content = b"Testing streamed upload. " * 1000
+		streamed = frappe.get_doc({
+			"doctype": "File",
+			"file_name": "streamed.txt",
+			"folder": _("Home/Test Folder 1"),
+			"content": io.BytesIO(content)}).insert()
+
+		self.assertEqual(streamed.content_hash, get_content_hash(content))
+		self.assertEqual(streamed.content_hash, get_content_hash(io.BytesIO(content)))
+		with open(streamed.get_full_path(), "rb") as f:
+			self.assertEqual(f.read(), content)
+
+		# same content is not written again
+		duplicate = frappe.get_doc({
+			"doctype": "File",
+			"file_name": "streamed_copy.txt",
+			"folder": _("Home/Test Folder 1"),
+			"content": io.BytesIO(content)}).insert()
+		self.assertEqual(duplicate.file_url, streamed.file_url)
+
+		duplicate.reload()
+		with duplicate.open_content() as f:
+			self.assertEqual(f.read(), content)
+
+		content_map = duplicate.open_content(memory_map=True)
+		self.assertEqual(content_map[:25], content[:25])
+		content_map.close()
+
+	def test_remove_stale_uploads(self):
+		import time
+		from frappe.core.doctype.file.file import get_uploads_path, remove_stale_uploads, STALE_UPLOAD_AGE
+
+		stale, recent = [os.path.join(get_uploads_path(), name) for name in (".upload-stale", ".upload-recent")]
+		for path in (stale, recent):
+			with open(path, "w") as f:
+				f.write("partial upload")
+
+		modified = time.time() - STALE_UPLOAD_AGE - 60
+		os.utime(stale, (modified, modified))
+
+		remove_stale_uploads()
+		self.assertFalse(os.path.exists(stale))
+		self.assertTrue(os.path.exists(recent))
+		os.remove(recent)
+
+	def test_download_permission(self):
+		from frappe.core.doctype.file.file import (has_download_permission, get_file_url_attachments,
+			FILE_URL_CACHE_KEY)
+
+		todo = frappe.get_doc({"doctype": "ToDo", "description": "Private attachment"}).insert()
+		_file = frappe.get_doc({
+			"doctype": "File",
+			"file_name": "private_attachment.txt",
+			"is_private": 1,
+			"attached_to_doctype": "ToDo",
+			"attached_to_name": todo.name,
+			"content": b"Testing download permission"}).insert()
+
+		self.assertEqual(get_file_url_attachments(_file.file_url)[0].attached_to_name, todo.name)
+		self.assertTrue(has_download_permission(_file.file_url))
+
+		frappe.set_user("Guest")
+		try:
+			self.assertFalse(has_download_permission(_file.file_url))
+		finally:
+			frappe.set_user("Administrator")
+
+		# a public File with the url does not give access
+		frappe.get_doc({
+			"doctype": "File",
+			"file_name": "public_copy.txt",
+			"file_url": _file.file_url,
+			"is_private": 0}).insert()
+		self.assertEqual(len(get_file_url_attachments(_file.file_url, cached=False)), 1)
+
+		# attachments of the url are cleared from cache on save
+		_file.attached_to_name = None
+		_file.save()
+		self.assertEqual(frappe.cache().get_value(FILE_URL_CACHE_KEY.format(_file.file_url),
+			expires=True), None)
+
+		self.assertRaises(frappe.DoesNotExistError, has_download_permission, "/private/files/missing.txt")
+
 	def test_on_delete(self):
 		file = frappe.get_doc("File", {"file_name": "file_copy.txt"})
 		file.delete()
@@ -7,6 +7,8 @@ from __future__ import unicode_literals
 import base64
 import json
 import io
+import heapq
+from itertools import islice
 
 import frappe
 from frappe.model.document import Document
@@ -15,10 +17,14 @@ from frappe.desk.query_report import generate_report_result, get_columns_dict
 from frappe.core.doctype.file.file import remove_all
 from frappe.utils.csvutils import to_csv, read_csv_content_from_attached_file
 from frappe.desk.form.load import get_attachments
-from frappe.utils import gzip_compress, gzip_decompress
-from six import PY2
+from frappe import _
+from frappe.utils import gzip_compress, gzip_decompress, cint, cstr
+from six import PY2, string_types
 from frappe.utils import encode
 
+# rows per file of a prepared report result
+CHUNK_SIZE = 10000
+
 class PreparedReport(Document):
 
 	def before_insert(self):
@@ -32,7 +38,7 @@ class PreparedReport(Document):
 		)
 
 	def on_trash(self):
-		remove_all("PreparedReport", self.name, from_delete=True)
+		remove_all("Prepared Report", self.name, from_delete=True)
 
 
 def run_background(prepared_report):
@@ -49,10 +55,11 @@ def run_background(prepared_report):
 			report.custom_columns = custom_report_doc.json
 
 		result = generate_report_result(report, filters=instance.filters, user=instance.owner)
-		create_json_gz_file(result['result'], 'Prepared Report', instance.name)
+		chunks = create_result_chunks(result['result'], 'Prepared Report', instance.name)
 
 		instance.status = "Completed"
 		instance.columns = json.dumps(result["columns"])
+		instance.result_chunks = json.dumps(chunks)
 		instance.report_end_time = frappe.utils.now()
 		instance.save(ignore_permissions=True)
 
@@ -87,8 +94,182 @@ def create_json_gz_file(data, dt, dn):
 	})
 	_file.save()
 
+def create_result_chunks(data, dt, dn):
+	"""Store the rows as gzipped, line delimited JSON (one row per line), in files of
+	`CHUNK_SIZE` rows, so that neither writing nor reading a page needs the whole result
+	as one string. Returns a list of [File name, row count]."""
+	timestamp = frappe.utils.data.format_datetime(frappe.utils.now(), "Y-m-d-H:M")
+	chunks = []
+	data = iter(data)
+	while True:
+		rows = list(islice(data, CHUNK_SIZE))
+		if not rows:
+			break
+
+		content = "\n".join(frappe.as_json(row, indent=None) for row in rows)
+		_file = frappe.get_doc({
+			"doctype": "File",
+			"file_name": "{0}-{1:05d}.jsonl.gz".format(timestamp, len(chunks)),
+			"attached_to_doctype": dt,
+			"attached_to_name": dn,
+			"content": gzip_compress(frappe.safe_encode(content))
+		})
+		_file.save()
+		chunks.append([_file.name, len(rows)])
+
+	return chunks
+
+def get_chunk_rows(file_name):
+	content = gzip_decompress(frappe.get_doc("File", file_name).get_content())
+	return [json.loads(frappe.safe_decode(line)) for line in content.splitlines() if line]
+
+def iter_rows(chunks):
+	for file_name, count in chunks:
+		for row in get_chunk_rows(file_name):
+			yield row
+
+def get_rows(doc, start=0, page_length=None, sort_by=None, sort_order="asc", filters=None):
+	"""Returns a page of rows of the result and the total number of (matching) rows.
+
+	Without sorting and filters only the files of the page are read. Otherwise the files
+	are read one by one, holding at most `start + page_length` rows.
+
+	:param filters: dict of fieldname: value, or list of [fieldname, operator, value]"""
+	chunks = json.loads(doc.result_chunks or "[]")
+	start = cint(start)
+	end = (start + cint(page_length)) if page_length else None
+	total = sum(count for file_name, count in chunks)
+
+	if not (sort_by or filters):
+		rows, offset = [], 0
+		for file_name, count in chunks:
+			if end is not None and offset >= end:
+				break
+			if offset + count > start:
+				rows.extend(get_chunk_rows(file_name)[max(start - offset, 0):
+					None if end is None else end - offset])
+			offset += count
+
+		return rows, total
+
+	fieldindex = dict((col.fieldname, idx) for idx, col in
+		get_columns_dict(json.loads(doc.columns or "[]")).items() if isinstance(idx, int))
+
+	def get_value(row, fieldname):
+		if isinstance(row, dict):
+			return row.get(fieldname)
+		idx = fieldindex.get(fieldname)
+		return row[idx] if idx is not None and idx < len(row) else None
+
+	rows = iter_rows(chunks)
+	if filters:
+		filters = get_row_filters(filters)
+		rows = (row for row in rows if all(compare(get_value(row, fieldname), operator, value)
+			for fieldname, operator, value in filters))
+
+	if sort_by:
+		def key(row):
+			# values of different types (numbers, text, None) are never compared with each other
+			value = get_value(row, sort_by)
+			return (value is None, isinstance(value, string_types), value)
+
+		reverse = (sort_order or "").lower() == "desc"
+
+		matching = RowCounter(rows)
+		if end is None:
+			rows = sorted(matching, key=key, reverse=reverse)
+		else:
+			rows = (heapq.nlargest if reverse else heapq.nsmallest)(end, matching, key=key)
+
+		return rows[start:end], matching.count
+
+	matching = RowCounter(rows)
+	page = list(islice(matching, start, end))
+	# count the remaining matches
+	for row in matching:
+		pass
+
+	return page, matching.count
+
+class RowCounter(object):
+	"""Iterator that counts the rows passing through it"""
+	def __init__(self, rows):
+		self.rows = iter(rows)
+		self.count = 0
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		row = next(self.rows)
+		self.count += 1
+		return row
+
+	next = __next__
+
+operators = {
+	"=": lambda a, b: a == b,
+	"!=": lambda a, b: a != b,
+	">": lambda a, b: a is not None and a > b,
+	"<": lambda a, b: a is not None and a < b,
+	">=": lambda a, b: a is not None and a >= b,
+	"<=": lambda a, b: a is not None and a <= b,
+	"like": lambda a, b: cstr(b).strip("%").lower() in cstr(a).lower(),
+	"in": lambda a, b: a in b,
+	"not in": lambda a, b: a not in b
+}
+
+def get_row_filters(filters):
+	if isinstance(filters, string_types):
+		filters = json.loads(filters)
+
+	if isinstance(filters, dict):
+		return [(fieldname, "=", value) for fieldname, value in filters.items()]
+
+	out = []
+	for f in filters:
+		fieldname, operator, value = f[-3:] if len(f) > 3 else f
+		if operator not in operators:
+			frappe.throw(_("Invalid filter operator {0}").format(operator))
+		if operator in ("in", "not in") and isinstance(value, string_types):
+			value = [v.strip() for v in value.split(",")]
+		out.append((fieldname, operator, value))
+
+	return out
+
+def compare(value, operator, filter_value):
+	try:
+		return operators[operator](value, filter_value)
+	except TypeError:
+		# not comparable, like None or a string with a number
+		return False
+
+@frappe.whitelist()
+def get_prepared_report_rows(dn, start=0, page_length=500, sort_by=None, sort_order="asc", filters=None):
+	"""Returns a page of the result of a Prepared Report, with the total number of matching rows"""
+	doc = frappe.get_doc("Prepared Report", dn)
+	doc.check_permission("read")
+
+	rows, total = get_rows(doc, start, page_length, sort_by, sort_order, filters)
+	return {
+		"columns": json.loads(doc.columns or "[]"),
+		"result": rows,
+		"total_rows": total
+	}
+
 @frappe.whitelist()
 def download_attachment(dn):
+	doc = frappe.get_doc("Prepared Report", dn)
+	if doc.result_chunks:
+		doc.check_permission("read")
+		chunks = json.loads(doc.result_chunks)
+		# same .json file as results stored in a single file
+		file_name = frappe.db.get_value("File", chunks[0][0], "file_name") if chunks else doc.name
+		frappe.local.response.filename = "{0}.json".format(file_name.rsplit("-", 1)[0])
+		frappe.local.response.filecontent = frappe.safe_encode(frappe.as_json(list(iter_rows(chunks))))
+		frappe.local.response.type = "binary"
+		return
+
 	attachment = get_attachments("Prepared Report", dn)[0]
 	frappe.local.response.filename = attachment.file_name[:-2]
 	attached_file = frappe.get_doc('File', attachment.name)
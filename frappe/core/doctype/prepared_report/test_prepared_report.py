@@ -32,3 +32,33 @@ class TestPreparedReport(unittest.TestCase):
 	def test_for_creation(self):
 		self.assertTrue('QUEUED' == self.prepared_report_doc.status.upper())
 		self.assertTrue(self.prepared_report_doc.report_start_time)
+
+	def test_result_chunks(self):
+		from frappe.core.doctype.prepared_report import prepared_report
+		from frappe.core.doctype.prepared_report.prepared_report import create_result_chunks, get_rows
+
+		doc = self.prepared_report_doc
+		data = [{"name": "row-{0}".format(i), "value": i % 4} for i in range(10)]
+		doc.columns = json.dumps([{"fieldname": "name", "label": "Name"},
+			{"fieldname": "value", "label": "Value"}])
+
+		prepared_report.CHUNK_SIZE = 3
+		try:
+			doc.result_chunks = json.dumps(create_result_chunks(data, doc.doctype, doc.name))
+		finally:
+			prepared_report.CHUNK_SIZE = 10000
+
+		self.assertEqual(len(json.loads(doc.result_chunks)), 4)
+
+		# page across files
+		rows, total = get_rows(doc, 4, 3)
+		self.assertEqual([r["name"] for r in rows], ["row-4", "row-5", "row-6"])
+		self.assertEqual(total, 10)
+
+		rows, total = get_rows(doc, 0, 2, sort_by="value", sort_order="desc", filters=[["value", "<", 3]])
+		self.assertEqual([r["value"] for r in rows], [2, 2])
+		self.assertEqual(total, 8)
+
+		rows, total = get_rows(doc, filters={"value": 1})
+		self.assertEqual([r["name"] for r in rows], ["row-1", "row-5", "row-9"])
+		self.assertEqual(total, 3)
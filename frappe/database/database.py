@@ -15,10 +15,15 @@ import frappe.model.meta
 
 from frappe import _
 from time import time
+from itertools import islice
 from frappe.utils import now, getdate, cast_fieldtype
-from frappe.utils.background_jobs import execute_job, get_queue
+from frappe.utils.background_jobs import execute_job, get_queue, add_to_job_index
 from frappe.model.utils.link_count import flush_local_link_count
 from frappe.utils import cint
+from frappe.database.statement_cache import statement_cache, MAX_QUERY_LENGTH
+from frappe.database.replica import get_replica_for_query
+from frappe.database import pool
+from frappe.desk.report_cache import flush_invalidations as flush_report_cache_invalidations
 
 # imports - compatibility imports
 from six import (
@@ -63,6 +68,10 @@ class Database(object):
 		self.transaction_writes = 0
 		self.auto_commit_on_many_writes = 0
 
+		# see frappe.database.replica
+		self.is_replica = False
+		self.has_writes = False
+
 		self.password = password or frappe.conf.db_password
 		self.value_cache = {}
 
@@ -72,7 +81,7 @@ class Database(object):
 	def connect(self):
 		"""Connects to a database as set in `site_config.json`."""
 		self.cur_db_name = self.user
-		self._conn = self.get_connection()
+		self._conn = pool.get_connection(self)
 		self._cursor = self._conn.cursor()
 		frappe.local.rollback_observers = []
 
@@ -83,9 +92,19 @@ class Database(object):
 	def get_connection(self):
 		pass
 
+	def reset_connection(self, conn):
+		"""Reset session state of a pooled connection on checkout. Must raise if the
+		connection is not usable."""
+		pass
+
 	def get_database_size(self):
 		pass
 
+	def get_replication_lag(self):
+		"""Returns seconds this replica is behind the primary, None if not replicating (or
+		not permitted to check). Raises if the replica is not reachable."""
+		pass
+
 	def sql(self, query, values=(), as_dict = 0, as_list = 0, formatted = 0,
 		debug=0, ignore_ddl=0, as_utf8=0, auto_commit=0, update=None, explain=False):
 		"""Execute a SQL query and fetch all rows.
@@ -114,9 +133,16 @@ class Database(object):
 				{"name": "a%", "owner":"test@example.com"})
 
 		"""
-		if re.search(r'ifnull\(', query, flags=re.IGNORECASE):
-			# replaces ifnull in query with coalesce
-			query = re.sub(r'ifnull\(', 'coalesce(', query, flags=re.IGNORECASE)
+		replica = get_replica_for_query(self, query)
+		if replica:
+			return replica.sql(query, values, as_dict=as_dict, as_list=as_list, formatted=formatted,
+				debug=debug, ignore_ddl=ignore_ddl, as_utf8=as_utf8, auto_commit=auto_commit,
+				update=update, explain=explain)
+
+		if len(query) > MAX_QUERY_LENGTH:
+			query = self.prepare_query(query)
+		else:
+			query = statement_cache.get(("sql", self.db_type, query), lambda: self.prepare_query(query))
 
 		if not self._conn:
 			self.connect()
@@ -210,6 +236,15 @@ class Database(object):
 		else:
 			return self._cursor.fetchall()
 
+	def prepare_query(self, query):
+		"""Returns the query text to be executed. Results are cached per distinct query
+		text in `statement_cache`, so this does not run on every call."""
+		if re.search(r'ifnull\(', query, flags=re.IGNORECASE):
+			# replaces ifnull in query with coalesce
+			query = re.sub(r'ifnull\(', 'coalesce(', query, flags=re.IGNORECASE)
+
+		return query
+
 	def explain_query(self, query, values=None):
 		"""Print `EXPLAIN` in error log."""
 		try:
@@ -735,6 +770,7 @@ class Database(object):
 		self.flush_realtime_log()
 		enqueue_jobs_after_commit()
 		flush_local_link_count()
+		flush_report_cache_invalidations()
 
 	@staticmethod
 	def flush_realtime_log():
@@ -883,7 +919,7 @@ class Database(object):
 		"""Close database connection."""
 		if self._conn:
 			# self._cursor.close()
-			self._conn.close()
+			pool.release_connection(self, self._conn)
 			self._cursor = None
 			self._conn = None
 
@@ -926,6 +962,46 @@ class Database(object):
 		else:
 			frappe.throw('No conditions provided')
 
+	def bulk_insert(self, doctype, fields, values, ignore_duplicates=False, chunk_size=10000):
+		"""Insert rows in `tab{doctype}` using multi-row `INSERT` statements.
+
+		:param doctype: DocType of the table.
+		:param fields: List of column names.
+		:param values: Iterable of rows, each a list / tuple of values in the order of `fields`.
+		:param ignore_duplicates: Skip rows that violate a primary or unique key.
+		:param chunk_size: Maximum number of rows in one statement.
+
+		Example:
+
+			frappe.db.bulk_insert("ToDo", ["name", "description"],
+				[["todo-1", "first"], ["todo-2", "second"]])
+		"""
+		def get_parts():
+			ignore, on_conflict = self.get_insert_ignore_clauses() if ignore_duplicates else ("", "")
+			prefix = "INSERT {ignore}INTO `tab{doctype}` ({fields}) VALUES ".format(
+				ignore=ignore,
+				doctype=doctype,
+				fields=", ".join(["`" + f + "`" for f in fields]))
+			return prefix, "({0})".format(", ".join(["%s"] * len(fields))), on_conflict
+
+		# only the parts are cached, statements of many rows are too large to keep
+		prefix, row, on_conflict = statement_cache.get(("bulk_insert", doctype, tuple(fields),
+			ignore_duplicates), get_parts)
+
+		values = iter(values)
+		while True:
+			chunk = list(islice(values, chunk_size))
+			if not chunk:
+				break
+
+			query = prefix + ", ".join([row] * len(chunk)) + on_conflict
+			self.sql(query, [v for r in chunk for v in r])
+
+	@staticmethod
+	def get_insert_ignore_clauses():
+		"""Returns the (prefix, suffix) of an `INSERT` that skips duplicate rows"""
+		return "IGNORE ", ""
+
 	def log_touched_tables(self, query, values=None):
 		if values:
 			query = frappe.safe_decode(self._cursor.mogrify(query, values))
@@ -959,8 +1035,9 @@ def enqueue_jobs_after_commit():
 	if frappe.flags.enqueue_after_commit and len(frappe.flags.enqueue_after_commit) > 0:
 		for job in frappe.flags.enqueue_after_commit:
 			q = get_queue(job.get("queue"), is_async=job.get("is_async"))
-			q.enqueue_call(execute_job, timeout=job.get("timeout"),
+			rq_job = q.enqueue_call(execute_job, timeout=job.get("timeout"),
 							kwargs=job.get("queue_args"))
+			add_to_job_index(rq_job, job.get("queue"), job.get("queue_args"))
 		frappe.flags.enqueue_after_commit = []
 
 # Helpers
@@ -8,7 +8,7 @@ from pymysql.times import TimeDelta
 from pymysql.constants 	import ER, FIELD_TYPE
 from pymysql.converters import conversions
 
-from frappe.utils import get_datetime, cstr
+from frappe.utils import get_datetime, cstr, cint
 from markdown2 import UnicodeWithAttrs
 from frappe.database.database import Database
 from six import PY2, binary_type, text_type, string_types
@@ -97,6 +97,11 @@ class MariaDBDatabase(Database):
 
 		return conn
 
+	def reset_connection(self, conn):
+		conn.autocommit(False)
+		with conn.cursor() as cursor:
+			cursor.execute("SET SESSION tx_isolation = @@GLOBAL.tx_isolation")
+
 	def get_database_size(self):
 		''''Returns database size in MB'''
 		db_size = self.sql('''
@@ -107,6 +112,18 @@ class MariaDBDatabase(Database):
 
 		return db_size[0].get('database_size')
 
+	def get_replication_lag(self):
+		try:
+			status = self.sql("SHOW SLAVE STATUS", as_dict=True)
+		except pymysql.err.MySQLError as e:
+			# needs the REPLICATION CLIENT privilege
+			if e.args[0] == ER.SPECIFIC_ACCESS_DENIED_ERROR:
+				return None
+			raise
+
+		if status and status[0].get("Seconds_Behind_Master") is not None:
+			return cint(status[0].get("Seconds_Behind_Master"))
+
 	@staticmethod
 	def escape(s, percent=True):
 		"""Excape quotes and percent in given string."""
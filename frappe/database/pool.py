@@ -0,0 +1,146 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Per process pool of database connections.
+
+When `db_connection_pool` is set in site config, `Database.close` returns the
+connection to the pool instead of closing it, and `Database.connect` checks out
+an idle connection for the same host, port, user and database, so that requests
+and jobs served by a long lived process (gunicorn worker, pre-forked background
+worker) skip the TCP and auth handshake.
+
+On checkout a connection is reset (rollback, autocommit off, default isolation
+level); this also serves as the health check, connections that fail it are
+discarded. At most `db_connection_pool_size` (default 5) idle connections are
+kept per key, extra connections are closed when released.
+
+The pool is bound to the process that created it, connections are never shared
+with forked children.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import threading
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_POOL_SIZE = 5
+
+_pools = {}
+_pid = [None]
+_lock = threading.Lock()
+_stats = {}
+
+# set in processes that always pool, like pre-forked background workers
+_enabled_for_process = [None]
+
+def is_enabled(db):
+	conf = getattr(frappe.local, "conf", None) or {}
+	enabled = conf.get("db_connection_pool") or _enabled_for_process[0] == os.getpid()
+	# root connections are used for setup and switch databases, never pool them
+	return bool(enabled) and db.user != "root"
+
+def enable_for_process():
+	"""Pool connections in this process regardless of site config"""
+	_enabled_for_process[0] = os.getpid()
+
+def get_pool_size():
+	return cint(frappe.local.conf.db_connection_pool_size) or DEFAULT_POOL_SIZE
+
+def get_pool_key(db):
+	return (db.host, db.port, db.user, db.password, db.db_type)
+
+def get_connection(db):
+	"""Returns an idle, reset connection from the pool or a new connection"""
+	if not is_enabled(db):
+		return db.get_connection()
+
+	key = get_pool_key(db)
+	while True:
+		with _lock:
+			check_pid()
+			idle = _pools.get(key)
+			conn = idle.pop() if idle else None
+
+		if not conn:
+			break
+
+		try:
+			db.reset_connection(conn)
+			incr_stat("reused")
+			return conn
+		except Exception:
+			incr_stat("discarded")
+			close_quietly(conn)
+
+	incr_stat("created")
+	return db.get_connection()
+
+def release_connection(db, conn):
+	"""Returns the connection to the pool, or closes it if the pool is full or disabled"""
+	if not is_enabled(db):
+		conn.close()
+		return
+
+	try:
+		# do not hold locks or snapshots while idle in the pool
+		conn.rollback()
+	except Exception:
+		incr_stat("discarded")
+		close_quietly(conn)
+		return
+
+	key = get_pool_key(db)
+	with _lock:
+		check_pid()
+		idle = _pools.setdefault(key, [])
+		if len(idle) < get_pool_size():
+			idle.append(conn)
+			conn = None
+
+	if conn:
+		incr_stat("closed")
+		close_quietly(conn)
+	else:
+		incr_stat("released")
+
+def check_pid():
+	"""Drop pools inherited from the parent process (after a fork), without closing
+	them as the parent still uses them"""
+	if _pid[0] != os.getpid():
+		_pools.clear()
+		_stats.clear()
+		_pid[0] = os.getpid()
+
+def close_quietly(conn):
+	try:
+		conn.close()
+	except Exception:
+		pass
+
+def close_all():
+	"""Close all idle connections of this process"""
+	with _lock:
+		check_pid()
+		for idle in _pools.values():
+			for conn in idle:
+				close_quietly(conn)
+		_pools.clear()
+
+def incr_stat(stat):
+	with _lock:
+		_stats[stat] = _stats.get(stat, 0) + 1
+
+def get_stats():
+	"""Returns counts of created, reused, discarded (failed health check), released and
+	closed (pool full) connections, and the number of idle connections per key"""
+	with _lock:
+		check_pid()
+		stats = frappe._dict((stat, _stats.get(stat, 0))
+			for stat in ("created", "reused", "discarded", "released", "closed"))
+		stats.idle = dict(("{0}@{1}:{2}".format(key[2], key[0], key[1]), len(idle))
+			for key, idle in _pools.items())
+
+	return stats
@@ -72,6 +72,12 @@ class PostgresDatabase(Database):
 
 		return conn
 
+	def reset_connection(self, conn):
+		conn.reset()
+		conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+		with conn.cursor() as cursor:
+			cursor.execute("SELECT 1")
+
 	def escape(self, s, percent=True):
 		"""Excape quotes and percent in given string."""
 		if isinstance(s, bytes):
@@ -90,17 +96,21 @@ class PostgresDatabase(Database):
 			self.db_name, as_dict=True)
 		return db_size[0].get('database_size')
 
-	# pylint: disable=W0221
-	def sql(self, *args, **kwargs):
-		if len(args):
-			# since tuple is immutable
-			args = list(args)
-			args[0] = modify_query(args[0])
-			args = tuple(args)
-		elif kwargs.get('query'):
-			kwargs['query'] = modify_query(kwargs.get('query'))
+	def get_replication_lag(self):
+		try:
+			lag = self.sql("""SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+				ELSE EXTRACT (EPOCH FROM now() - pg_last_xact_replay_timestamp()) END""")
+		except psycopg2.Error as e:
+			if self.is_access_denied(e):
+				self.sql("rollback")
+				return None
+			raise
+
+		if lag and lag[0][0] is not None:
+			return int(lag[0][0])
 
-		return super(PostgresDatabase, self).sql(*args, **kwargs)
+	def prepare_query(self, query):
+		return modify_query(super(PostgresDatabase, self).prepare_query(query))
 
 	def get_tables(self):
 		return [d[0] for d in self.sql("""select table_name
@@ -237,6 +247,10 @@ class PostgresDatabase(Database):
 			key=key
 		)
 
+	@staticmethod
+	def get_insert_ignore_clauses():
+		return "", " ON CONFLICT DO NOTHING"
+
 	def check_transaction_status(self, query):
 		pass
 
@@ -0,0 +1,173 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Routing of reads to read replicas.
+
+While routing is enabled (GET requests after authentication, `@frappe.read_only()`
+methods and `frappe.get_list`), plain `SELECT` queries run via `frappe.db.sql` are
+sent to a replica. The replica is chosen once per request, so reads of a request do
+not go back in time. Once the primary connection has executed a write, all later
+reads in the request stay on the primary, so that a request always reads its own
+writes.
+
+Site config options:
+
+- `read_from_replica`: enable routing
+- `replica_host`: host of the replica, or `replica_hosts`: list of hosts
+- `replica_db_name`, `replica_db_password`: credentials, if
+  `different_credentials_for_replica` is set
+- `replica_policy`: `round_robin` (default) or `least_lag`
+- `replica_max_lag`: replicas lagging behind the primary by more than these many
+  seconds are skipped (default 10, 0 to skip the lag check)
+
+The lag of each replica is measured at most every `LAG_CHECK_INTERVAL` seconds per
+process. Replicas that cannot be connected to are skipped. Measuring the lag needs
+the `REPLICATION CLIENT` privilege on MariaDB; without it, the replica is used
+anyway (after replicas with a known lag for `least_lag`) and a warning is logged
+once per process.
+"""
+
+from __future__ import unicode_literals
+
+import time
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_MAX_LAG = 10
+
+# seconds for which the measured lag of a replica is kept
+LAG_CHECK_INTERVAL = 5
+
+# lag of a replica that is reachable, but not permitted to check it
+UNKNOWN_LAG = -1
+
+WRITE_STATEMENTS = ("insert", "update", "delete", "replace", "alter", "create", "drop", "truncate")
+
+# round robin position, shared by all requests of the process
+_next_replica = [0]
+
+# measured lag of replicas in this process: host -> (lag, time measured), lag is None
+# if the replica could not be reached
+_lags = {}
+
+class route_reads_to_replica(object):
+	"""Context manager that routes plain `SELECT` queries to a replica"""
+	def __enter__(self):
+		self.routing = frappe.local.flags.read_from_replica
+		frappe.local.flags.read_from_replica = True
+
+	def __exit__(self, type, value, traceback):
+		frappe.local.flags.read_from_replica = self.routing
+
+def get_replica_hosts():
+	conf = frappe.local.conf
+	if not conf.read_from_replica:
+		return []
+
+	return conf.replica_hosts or ([conf.replica_host] if conf.replica_host else [])
+
+def get_replica_for_query(db, query):
+	"""Returns the replica `Database` on which `query` should run, or None for the primary.
+	Marks the primary as written to if `query` is a write."""
+	if getattr(db, "is_replica", False):
+		return None
+
+	statement = query.lstrip()[:8].lower()
+	if statement.startswith(WRITE_STATEMENTS):
+		db.has_writes = True
+		return None
+
+	if (getattr(db, "has_writes", False)
+		or not frappe.local.flags.read_from_replica
+		or not statement.startswith("select")):
+		return None
+
+	lowered = query.lower()
+	if "for update" in lowered or "lock in share mode" in lowered:
+		return None
+
+	return get_replica()
+
+def get_replica():
+	"""Returns the replica `Database` of this request, None for the primary"""
+	if getattr(frappe.local, "replica_host", None) is None:
+		frappe.local.replica_host = choose_replica() or ""
+
+	return get_replica_db(frappe.local.replica_host) if frappe.local.replica_host else None
+
+def choose_replica():
+	"""Returns a replica host as per `replica_policy`, skipping replicas that are not
+	reachable or lag behind"""
+	hosts = get_replica_hosts()
+	if not hosts:
+		return None
+
+	max_lag = frappe.local.conf.replica_max_lag
+	max_lag = DEFAULT_MAX_LAG if max_lag is None else cint(max_lag)
+
+	def is_usable(lag):
+		return lag is not None and (lag == UNKNOWN_LAG or not max_lag or lag <= max_lag)
+
+	if frappe.local.conf.replica_policy == "least_lag":
+		lags = [(get_lag(host), host) for host in hosts]
+		lags = [(lag == UNKNOWN_LAG, lag, host) for lag, host in lags if is_usable(lag)]
+		return min(lags)[2] if lags else None
+
+	for i in range(len(hosts)):
+		host = hosts[(_next_replica[0] + i) % len(hosts)]
+		if is_usable(get_lag(host)):
+			_next_replica[0] = (_next_replica[0] + i + 1) % len(hosts)
+			return host
+
+	return None
+
+def get_lag(host):
+	"""Returns replication lag of the replica in seconds (measured at most every
+	`LAG_CHECK_INTERVAL` seconds), `UNKNOWN_LAG` if it is not permitted to check, or
+	None if the replica is not reachable"""
+	lag, measured = _lags.get(host, (None, 0))
+	if time.time() - measured < LAG_CHECK_INTERVAL:
+		return lag
+
+	db = get_replica_db(host)
+	try:
+		lag = db.get_replication_lag()
+		if lag is None:
+			lag = UNKNOWN_LAG
+			if host not in _lags:
+				frappe.logger(__name__).warning("Replication lag of replica {0} could not be "
+					"determined, using it without the lag check".format(host))
+	except Exception:
+		lag = None
+		db.close()
+		frappe.local.replica_dbs.pop(host, None)
+
+	_lags[host] = (lag, time.time())
+	return lag
+
+def get_replica_db(host):
+	"""Returns the connection to the replica for this request"""
+	from frappe.database import get_db
+
+	if not getattr(frappe.local, "replica_dbs", None):
+		frappe.local.replica_dbs = {}
+
+	if host not in frappe.local.replica_dbs:
+		conf = frappe.local.conf
+		user, password = conf.db_name, conf.db_password
+		if conf.different_credentials_for_replica:
+			user, password = conf.replica_db_name, conf.replica_db_password
+
+		db = get_db(host=host, user=user, password=password)
+		db.is_replica = True
+		frappe.local.replica_dbs[host] = db
+
+	return frappe.local.replica_dbs[host]
+
+def close_replica_connections():
+	for db in (getattr(frappe.local, "replica_dbs", None) or {}).values():
+		db.close()
+
+	frappe.local.replica_dbs = {}
+	frappe.local.replica_host = None
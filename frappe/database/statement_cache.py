@@ -0,0 +1,78 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Process wide cache of finished SQL statement text.
+
+Statements are keyed by what they are built from, for example
+`("insert", doctype, columns)` for `db_insert`, or `("sql", query)` for the
+rewritten text of a query passed to `frappe.db.sql`. The text does not depend
+on the site, so the cache is shared by all sites served by the process.
+
+Neither PyMySQL nor psycopg2 expose server side prepared statements, so only
+the statement text is cached; values are always sent as query parameters.
+"""
+
+from __future__ import unicode_literals
+
+from time import time
+from collections import OrderedDict
+from six import string_types
+
+import frappe
+
+# queries longer than this are usually built with inlined values and are
+# unlikely to be repeated, so they are prepared without being cached
+MAX_QUERY_LENGTH = 4096
+
+class StatementCache(object):
+	def __init__(self, maxsize=2048):
+		self.maxsize = maxsize
+		self.statements = OrderedDict()
+		self.reset_stats()
+
+	def get(self, key, build):
+		"""Returns the statement for `key`, calling `build()` to create it on a miss.
+		Statements longer than `MAX_QUERY_LENGTH` are not kept."""
+		try:
+			# move to the end (most recently used)
+			statement = self.statements.pop(key)
+			self.statements[key] = statement
+			self.hits += 1
+			return statement
+		except KeyError:
+			pass
+
+		start = time()
+		statement = build()
+		self.build_time += time() - start
+		self.misses += 1
+
+		if isinstance(statement, string_types) and len(statement) > MAX_QUERY_LENGTH:
+			return statement
+
+		self.statements[key] = statement
+		if len(self.statements) > self.maxsize:
+			self.statements.popitem(last=False)
+
+		return statement
+
+	def clear(self):
+		self.statements.clear()
+
+	def reset_stats(self):
+		self.hits = self.misses = 0
+		self.build_time = 0.0
+
+	def get_stats(self):
+		"""Returns hits, misses, cached statement count and the estimated time saved (in seconds),
+		i.e. the average time taken to build a statement times the number of hits."""
+		average_build_time = (self.build_time / self.misses) if self.misses else 0.0
+		return frappe._dict(
+			hits=self.hits,
+			misses=self.misses,
+			statements=len(self.statements),
+			build_time=self.build_time,
+			time_saved=average_build_time * self.hits
+		)
+
+statement_cache = StatementCache()
@@ -1,41 +1,96 @@
 import json
 import frappe
 
+from frappe import _
 from frappe.utils import cstr
+from six import string_types
+from frappe.model.base_document import bulk_db_insert
 
 queue_prefix = 'insert_queue_for_'
 
+# set of doctypes with a queue, so that queues can be found without scanning keys
+queue_registry = 'insert_queue_doctypes'
+
+# doctypes that any user can log, inserted with multi-row statements without validations
+# (other doctypes need create permission and are inserted with `doc.insert`)
+bulk_insert_doctypes = ('Route History',)
+
 @frappe.whitelist()
 def deferred_insert(doctype, records):
-	frappe.cache().rpush(queue_prefix + doctype, records)
+	if doctype not in bulk_insert_doctypes and not frappe.has_permission(doctype, 'create'):
+		raise frappe.PermissionError
+
+	if isinstance(records, string_types):
+		records = json.loads(records)
+	if isinstance(records, dict):
+		records = [records]
+
+	for record in records:
+		# records are inserted by the scheduler, as Administrator
+		record['doctype'] = doctype
+		record['owner'] = frappe.session.user
+
+	frappe.cache().rpush(queue_prefix + doctype, json.dumps(records))
+	frappe.cache().sadd(queue_registry, doctype)
 
 def save_to_db():
-	queue_keys = frappe.cache().get_keys(queue_prefix)
-	for key in queue_keys:
+	for doctype in get_queued_doctypes():
 		record_count = 0
-		queue_key = get_key_name(key)
-		doctype = get_doctype_name(key)
+		queue_key = queue_prefix + doctype
+		records_to_insert = []
 		while frappe.cache().llen(queue_key) > 0 and record_count <= 500:
 			records = frappe.cache().lpop(queue_key)
 			records = json.loads(records.decode('utf-8'))
 			if isinstance(records, dict):
-				record_count += 1
-				insert_record(records, doctype)
-				continue
-			for record in records:
-				record_count += 1
-				insert_record(record, doctype)
+				records = [records]
+			record_count += len(records)
+			records_to_insert.extend(records)
+
+		insert_records(records_to_insert, doctype)
 
 	frappe.db.commit()
 
-def insert_record(record, doctype):
-	if not record.get('doctype'):
+def insert_records(records, doctype):
+	"""Insert records of `bulk_insert_doctypes` in multi-row statements, falling back to
+	inserting them one by one (with validations) if that fails"""
+	if doctype not in bulk_insert_doctypes:
+		for record in records:
+			insert_record(record, doctype)
+		return
+
+	docs = []
+	for record in records:
 		record['doctype'] = doctype
+		doc = frappe.get_doc(record)
+		doc.owner = doc.owner or frappe.session.user
+		doc.docstatus = doc.docstatus or 0
+		docs.append(doc)
+
+	if not docs:
+		return
+
+	try:
+		# single statement, so that nothing is inserted if it fails
+		bulk_db_insert(docs, chunk_size=len(docs))
+	except Exception:
+		for record in records:
+			insert_record(record, doctype)
+
+def insert_record(record, doctype):
+	record['doctype'] = doctype
 	try:
 		doc = frappe.get_doc(record)
 		doc.insert()
-	except Exception as e:
-		print(e, doctype)
+	except Exception:
+		frappe.log_error(title=_('Deferred insert of {0} failed').format(doctype))
+
+def get_queued_doctypes():
+	doctypes = set(frappe.safe_decode(d) for d in frappe.cache().smembers(queue_registry))
+	if not doctypes:
+		# queues created before the registry existed
+		doctypes = set(get_doctype_name(key) for key in frappe.cache().get_keys(queue_prefix))
+
+	return doctypes
 
 def get_key_name(key):
 	return cstr(key).split('|')[1]
@@ -13,7 +13,7 @@ from frappe.utils.user import get_system_managers
 from frappe.utils import cstr, getdate, split_emails, add_days, today, get_last_day, get_first_day
 from frappe.model.document import Document
 from frappe.core.doctype.communication.email import make
-from frappe.utils.background_jobs import get_jobs
+from frappe.utils.background_jobs import is_job_queued
 
 month_map = {'Monthly': 1, 'Quarterly': 3, 'Half-yearly': 6, 'Yearly': 12}
 
@@ -156,9 +156,7 @@ def get_next_schedule_date(start_date, frequency, repeat_on_day):
 
 def make_auto_repeat_entry(date=None):
 	enqueued_method = 'frappe.desk.doctype.auto_repeat.auto_repeat.create_repeated_entries'
-	jobs = get_jobs()
-
-	if not jobs or enqueued_method not in jobs[frappe.local.site]:
+	if not is_job_queued(enqueued_method):
 		date = date or today()
 		for data in get_auto_repeat_entries(date):
 			frappe.enqueue(enqueued_method, data=data)
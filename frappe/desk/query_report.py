@@ -12,11 +12,15 @@ from frappe.utils import flt, cint, get_html_format, cstr, get_url_to_form
 from frappe.model.utils import render_include
 from frappe.translate import send_translations
 import frappe.desk.reportview
+from frappe.desk import report_cache
 from frappe.permissions import get_role_permissions
 from six import string_types, iteritems
 from datetime import timedelta
 from frappe.utils import gzip_decompress
 
+# rows of a prepared report result sent with the report, see `get_prepared_report_result`
+PREPARED_REPORT_MAX_ROWS = 100000
+
 def get_report_doc(report_name):
 	doc = frappe.get_doc("Report", report_name)
 	doc.custom_columns = []
@@ -197,7 +201,7 @@ def run(report_name, filters=None, user=None):
 			dn = ""
 		result = get_prepared_report_result(report, filters, dn, user)
 	else:
-		result = generate_report_result(report, filters, user)
+		result = report_cache.get_result(report, filters, user, generate_report_result)
 
 	result["add_total_row"] = report.add_total_row
 
@@ -254,7 +258,25 @@ def get_prepared_report_result(report, filters, dn="", user=None):
 			# Get latest
 			doc = frappe.get_doc("Prepared Report", doc_list[0])
 
-	if doc:
+	if doc and doc.result_chunks:
+		from frappe.core.doctype.prepared_report.prepared_report import get_rows
+
+		# only the first rows of very large results are sent, the rest can be paged
+		# through with `get_prepared_report_rows`
+		max_rows = cint(frappe.conf.prepared_report_max_rows) or PREPARED_REPORT_MAX_ROWS
+		data, total_rows = get_rows(doc, 0, max_rows)
+		columns = json.loads(doc.columns) if doc.columns else []
+		for column in columns:
+			if isinstance(column, dict):
+				column["label"] = _(column["label"])
+
+		latest_report_data = {
+			"columns": columns,
+			"result": data,
+			"total_rows": total_rows
+		}
+
+	elif doc:
 		try:
 			# Prepared Report data is stored in a GZip compressed JSON file
 			attached_file_name = frappe.db.get_value("File", {"attached_to_doctype": doc.doctype, "attached_to_name":doc.name}, "name")
@@ -478,12 +500,19 @@ def get_filtered_data(ref_doctype, columns, data, user):
 	if_owner = role_permissions.get("if_owner", {}).get("report")
 
 	if match_filters_per_doctype:
+		# sets, as they are looked up for every cell
+		shared = set(shared)
+		match_filters_per_doctype = dict((doctype, [dict((dt, set(values)) for dt, values in match_filters.items())
+			for match_filters in filter_list]) for doctype, filter_list in match_filters_per_doctype.items())
+		existing_values = get_existing_values(linked_doctypes, match_filters_per_doctype, data)
+
 		for row in data:
 			# Why linked_doctypes.get(ref_doctype)? because if column is empty, linked_doctypes[ref_doctype] is removed
 			if linked_doctypes.get(ref_doctype) and shared and row[linked_doctypes[ref_doctype]] in shared:
 				result.append(row)
 
-			elif has_match(row, linked_doctypes, match_filters_per_doctype, ref_doctype, if_owner, columns_dict, user):
+			elif has_match(row, linked_doctypes, match_filters_per_doctype, ref_doctype, if_owner, columns_dict, user,
+				existing_values):
 				result.append(row)
 	else:
 		result = list(data)
@@ -491,7 +520,71 @@ def get_filtered_data(ref_doctype, columns, data, user):
 	return result
 
 
-def has_match(row, linked_doctypes, doctype_match_filters, ref_doctype, if_owner, columns_dict, user):
+def get_existing_values(linked_doctypes, doctype_match_filters, data):
+	"""Returns a dict of doctype: set of values in its link column that exist as documents,
+	for the doctypes restricted by user permissions. Checks the distinct values with one
+	query per doctype (per 1000 values), instead of `frappe.db.exists` per cell."""
+	restricted = set(dt for filter_list in doctype_match_filters.values()
+		for match_filters in filter_list for dt in match_filters)
+
+	existing_values = {}
+	for dt, idx in linked_doctypes.items():
+		if dt not in restricted:
+			continue
+
+		values = set()
+		for row in data:
+			if row:
+				value = get_cell_value(row, idx)
+				if value is not None and not isinstance(value, (list, dict)):
+					values.add(value)
+
+		existing_values[dt] = get_existing_names(dt, values)
+
+	return existing_values
+
+def get_existing_names(doctype, values):
+	names = set(v for v in values if v and isinstance(v, string_types))
+	if frappe.get_meta(doctype).issingle:
+		names = set()
+
+	# same semantics as `frappe.db.exists` for singles, and values that are not names
+	existing = set(value for value in values - names if frappe.db.exists(doctype, value))
+	names = list(names)
+
+	# names are compared case and trailing space insensitive by mariadb
+	normalize = (lambda v: v.lower().rstrip()) if frappe.db.db_type == "mariadb" else (lambda v: v)
+
+	for i in range(0, len(names), 1000):
+		batch = names[i:i + 1000]
+		try:
+			found = set(normalize(name) for name in frappe.db.sql_list("""select name from `tab{0}`
+				where name in ({1})""".format(doctype, ", ".join(["%s"] * len(batch))), batch))
+		except Exception as e:
+			# as `frappe.db.exists`, which is falsy if the table does not exist
+			if frappe.db.is_table_missing(e):
+				continue
+			raise
+
+		existing.update(name for name in batch if normalize(name) in found)
+
+	return existing
+
+def get_cell_value(row, idx):
+	if isinstance(row, dict):
+		return row.get(idx)
+	elif isinstance(row, list):
+		return row[idx]
+
+def is_in(value, values):
+	try:
+		return value in values
+	except TypeError:
+		# unhashable value, looked up in a set
+		return False
+
+def has_match(row, linked_doctypes, doctype_match_filters, ref_doctype, if_owner, columns_dict, user,
+	existing_values=None):
 	"""Returns True if after evaluating permissions for each linked doctype
 		- There is an owner match for the ref_doctype
 		- `and` There is a user permission match for all linked doctypes
@@ -528,15 +621,17 @@ def has_match(row, linked_doctypes, doctype_match_filters, ref_doctype, if_owner
 					if dt=="User" and columns_dict[idx]==columns_dict.get("owner"):
 						continue
 
-					cell_value = None
-					if isinstance(row, dict):
-						cell_value = row.get(idx)
-					elif isinstance(row, list):
-						cell_value = row[idx]
+					cell_value = get_cell_value(row, idx)
+
+					if dt in match_filters and not is_in(cell_value, match_filters.get(dt)):
+						if existing_values is not None and dt in existing_values:
+							exists = is_in(cell_value, existing_values[dt])
+						else:
+							exists = frappe.db.exists(dt, cell_value)
 
-					if dt in match_filters and cell_value not in match_filters.get(dt) and frappe.db.exists(dt, cell_value):
-						match = False
-						break
+						if exists:
+							match = False
+							break
 
 				# each doctype could have multiple conflicting user permission doctypes, hence using OR
 				# so that even if one of the sets allows a match, it is true
@@ -0,0 +1,148 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Result cache for Script and Query Reports.
+
+Reports listed in `report_cache` (site config) are served from cache when run
+again with the same filters by a user with the same roles and user permissions:
+
+	"report_cache": {
+		"General Ledger": {"ttl": 600, "depends_on": ["Account"]},
+		"Stock Balance": 300
+	}
+
+A value can be the TTL in seconds (default 300), or a dict with `ttl` and
+`depends_on`, DocTypes other than the report's `ref_doctype` that the result
+depends on. A list of report names caches them with the default TTL.
+
+Every cached result includes a version of each of these DocTypes. The version is
+incremented whenever a document of the DocType (or of its child tables) is saved
+or deleted, so cached results are never served after such a change, and expire
+with the TTL. Changes made directly in the database (`frappe.db.set_value`, SQL)
+do not invalidate the cache.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import hashlib
+import redis
+
+import frappe
+from frappe.utils import cint, now_datetime
+from six import string_types
+
+DEFAULT_TTL = 300
+
+# hash of DocType -> version
+VERSIONS_KEY = "report_cache_versions"
+
+def get_settings(report_name):
+	"""Returns `ttl` and `depends_on` if results of the report are cached, else None"""
+	conf = frappe.local.conf.report_cache
+	if not conf:
+		return None
+
+	if isinstance(conf, (list, tuple)):
+		settings = DEFAULT_TTL if report_name in conf else None
+	else:
+		settings = conf.get(report_name)
+
+	if not settings:
+		return None
+
+	if not isinstance(settings, dict):
+		settings = {"ttl": settings}
+
+	return frappe._dict(ttl=cint(settings.get("ttl")) or DEFAULT_TTL,
+		depends_on=settings.get("depends_on") or [])
+
+def get_result(report, filters, user, generate):
+	"""Returns the cached result, or calls `generate(report, filters, user)` and caches its result.
+	Sets `cached` (and `cached_on`) in the result."""
+	settings = get_settings(report.get("custom_report") or report.name)
+	if not settings:
+		return generate(report, filters, user)
+
+	if filters and isinstance(filters, string_types):
+		filters = json.loads(filters)
+
+	doctypes = get_dependencies(report, settings)
+	key = get_cache_key(report, filters, user, doctypes)
+
+	result = frappe.cache().get_value(key, expires=True)
+	if result is not None:
+		result["cached"] = True
+		return result
+
+	result = generate(report, filters, user)
+	if result.get("status") != "error":
+		result["cached_on"] = now_datetime()
+		frappe.cache().set_value(key, result, expires_in_sec=settings.ttl)
+
+	result["cached"] = False
+	return result
+
+def get_dependencies(report, settings):
+	return [report.ref_doctype] + [d for d in settings.depends_on if d != report.ref_doctype]
+
+def get_cache_key(report, filters, user, doctypes):
+	if isinstance(filters, dict):
+		# unset filters are not sent consistently by the client
+		filters = dict((k, v) for k, v in filters.items() if v not in (None, "", []))
+
+	key = json.dumps([
+		report.name,
+		report.get("custom_report"),
+		filters or None,
+		get_permission_fingerprint(user),
+		get_versions(doctypes)
+	], sort_keys=True, default=str)
+
+	return "report_cache::{0}::{1}".format(report.name,
+		hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+def get_permission_fingerprint(user):
+	"""Returns a hash of the roles and user permissions of the user, as results are filtered by them"""
+	from frappe.permissions import get_user_permissions
+
+	return hashlib.sha1(json.dumps([sorted(frappe.get_roles(user)), get_user_permissions(user)],
+		sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def get_versions(doctypes):
+	cache = frappe.cache()
+	try:
+		versions = redis.Redis.hmget(cache, cache.make_key(VERSIONS_KEY), doctypes)
+	except redis.exceptions.ConnectionError:
+		versions = []
+
+	return [cint(v) for v in versions]
+
+def invalidate(*doctypes):
+	"""Increment the versions of these DocTypes, so that cached results that depend on them
+	are not served anymore. Incremented again after commit, so that a result generated by
+	another request before the commit is not served either."""
+	if not frappe.local.conf.report_cache:
+		return
+
+	incr_versions(doctypes)
+
+	if frappe.flags.report_cache_invalidated is None:
+		frappe.flags.report_cache_invalidated = set()
+	frappe.flags.report_cache_invalidated.update(doctypes)
+
+def flush_invalidations():
+	"""Called after commit"""
+	if frappe.flags.report_cache_invalidated:
+		incr_versions(frappe.flags.report_cache_invalidated)
+		frappe.flags.report_cache_invalidated = None
+
+def incr_versions(doctypes):
+	cache = frappe.cache()
+	try:
+		pipe = cache.pipeline()
+		for doctype in doctypes:
+			pipe.hincrby(cache.make_key(VERSIONS_KEY), doctype, 1)
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
@@ -9,7 +9,7 @@ from six.moves import range
 import frappe.permissions
 from frappe.model.db_query import DatabaseQuery
 from frappe import _
-from six import text_type, string_types, StringIO
+from six import string_types
 
 @frappe.whitelist()
 @frappe.read_only()
@@ -136,59 +136,62 @@ def export_query():
 		form_params["filters"] = {"name": ("in", si)}
 		del form_params["selected_items"]
 
-	db_query = DatabaseQuery(doctype)
-	ret = db_query.execute(**form_params)
+	if file_format_type not in ("CSV", "Excel"):
+		return
 
-	if add_totals_row:
-		ret = append_totals_row(ret)
+	from frappe.utils.export import ExportWriter, enqueue_export, BATCH_SIZE
 
-	data = [['Sr'] + get_labels(db_query.fields, doctype)]
-	for i, row in enumerate(ret):
-		data.append([i+1] + list(row))
+	if enqueue_export("frappe.desk.reportview.export_query", doctype,
+		filters=form_params.get("filters"), or_filters=form_params.get("or_filters")):
+		return
 
-	if file_format_type == "CSV":
+	# rows are written as they are read, Excel in write-only mode
+	with ExportWriter(file_format_type, doctype) as writer:
+		db_query = DatabaseQuery(doctype)
+		count, totals = 0, None
 
-		# convert to csv
-		import csv
-		from frappe.utils.xlsxutils import handle_html
+		for batch in db_query.iterate(batch_size=BATCH_SIZE, **form_params):
+			if not count:
+				writer.writerow(['Sr'] + get_labels(db_query.fields, doctype))
 
-		f = StringIO()
-		writer = csv.writer(f)
-		for r in data:
-			# encode only unicode type strings and not int, floats etc.
-			writer.writerow([handle_html(frappe.as_unicode(v)).encode('utf-8') \
-				if isinstance(v, string_types) else v for v in r])
+			for row in batch:
+				count += 1
+				writer.writerow([count] + list(row))
+				if add_totals_row:
+					totals = add_to_totals(totals, row)
 
-		f.seek(0)
-		frappe.response['result'] = text_type(f.read(), 'utf-8')
-		frappe.response['type'] = 'csv'
-		frappe.response['doctype'] = doctype
+		if not count:
+			writer.writerow(['Sr'] + get_labels(db_query.fields, doctype))
 
-	elif file_format_type == "Excel":
+		if totals:
+			writer.writerow([count + 1] + totals)
 
-		from frappe.utils.xlsxutils import make_xlsx
-		xlsx_file = make_xlsx(data, doctype)
-
-		frappe.response['filename'] = doctype + '.xlsx'
-		frappe.response['filecontent'] = xlsx_file.getvalue()
-		frappe.response['type'] = 'binary'
+		writer.set_response(doctype)
 
 
 def append_totals_row(data):
 	if not data:
 		return data
 	data = list(data)
-	totals = []
-	totals.extend([""]*len(data[0]))
+	totals = None
 
 	for row in data:
-		for i in range(len(row)):
-			if isinstance(row[i], (float, int)):
-				totals[i] = (totals[i] or 0) + row[i]
+		totals = add_to_totals(totals, row)
 	data.append(totals)
 
 	return data
 
+def add_to_totals(totals, row):
+	"""Add numeric values of `row` to `totals` (a list, None for the first row)"""
+	if totals is None:
+		totals = [""] * len(row)
+
+	for i in range(len(row)):
+		if isinstance(row[i], (float, int)):
+			totals[i] = (totals[i] or 0) + row[i]
+
+	return totals
+
 def get_labels(fields, doctype):
 	"""get column labels based on column names"""
 	labels = []
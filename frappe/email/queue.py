@@ -4,19 +4,30 @@
 from __future__ import unicode_literals
 import frappe
 from six.moves import html_parser as HTMLParser
-import smtplib, quopri, json
+import smtplib, quopri, json, time
 from frappe import msgprint, throw, _, safe_decode
 from frappe.email.smtp import SMTPServer, get_outgoing_email_account
 from frappe.email.email_body import get_email, get_formatted_html, add_attachment
 from frappe.utils.verified_command import get_signed_params, verify_request
 from html2text import html2text
-from frappe.utils import get_url, nowdate, encode, now_datetime, add_days, split_emails, cstr, cint
+from frappe.utils import (get_url, nowdate, encode, now_datetime, add_days, add_to_date, split_emails,
+	cstr, cint)
 from rq.timeouts import JobTimeoutException
 from frappe.utils.scheduler import log
 from six import text_type, string_types
 
 class EmailLimitCrossedError(frappe.ValidationError): pass
 
+DEFAULT_FLUSH_WORKERS = 4
+DEFAULT_FLUSH_BATCH_SIZE = 50
+
+# seconds a flush job keeps claiming batches, within the timeout of the short queue
+FLUSH_TIME_LIMIT = 240
+
+# seconds an email claimed by a flush job is not claimed by other jobs, emails left in
+# 'Sending' for longer (e.g. the job was killed) are queued again
+EMAIL_LEASE_TTL = 600
+
 def send(recipients=None, sender=None, subject=None, message=None, text_content=None, reference_doctype=None,
 		reference_name=None, unsubscribe_method=None, unsubscribe_params=None, unsubscribe_message=None,
 		attachments=None, reply_to=None, cc=[], bcc=[], message_id=None, in_reply_to=None, send_after=None,
@@ -353,45 +364,292 @@ def return_unsubscribed_page(email, doctype, name):
 		indicator_color='green')
 
 def flush(from_test=False):
-	"""flush email queue, every time: called from scheduler"""
+	"""flush email queue, every time: called from scheduler.
+
+	Emails are sent by `email_flush_workers` (site config, default 4) background jobs
+	in parallel, see `send_queued_emails`."""
 	# additional check
 	check_email_limit([])
 
-	auto_commit = not from_test
 	if frappe.are_emails_muted():
 		msgprint(_("Emails are muted"))
-		from_test = True
-
-	smtpserver_dict = frappe._dict()
-
-	for email in get_queue():
+		return
 
-		if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
-			break
+	if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
+		return
 
-		if email.name:
-			smtpserver = smtpserver_dict.get(email.sender)
-			if not smtpserver:
-				smtpserver = SMTPServer()
-				smtpserver_dict[email.sender] = smtpserver
+	if from_test:
+		send_queued_emails(auto_commit=False)
+		return
 
-			send_one(email.name, smtpserver, auto_commit, from_test=from_test)
+	from frappe.utils.background_jobs import enqueue, is_job_queued
+	for i in range(cint(frappe.conf.email_flush_workers) or DEFAULT_FLUSH_WORKERS):
+		job_name = 'email_flush_worker|{0}'.format(i)
+		# started jobs are not in the queue, but mark themselves as running
+		if not (frappe.cache().get_value(get_worker_key(i), expires=True)
+			or is_job_queued(job_name, key='job_name')):
+			enqueue(send_queued_emails, 'short', job_name=job_name, worker=i)
 
-		# NOTE: removing commit here because we pass auto_commit
-		# finally:
-		# 	frappe.db.commit()
-def get_queue():
+def get_queue(limit=500):
 	return frappe.db.sql('''select
 			name, sender
 		from
 			`tabEmail Queue`
 		where
-			(status='Not Sent' or status='Partially Sent') and
+			(status='Not Sent' or status='Partially Sent'
+				or (status='Sending' and modified < %(lease_expired)s)) and
 			(send_after is null or send_after < %(now)s)
 		order
 			by priority desc, creation asc
-		limit 500''', { 'now': now_datetime() }, as_dict=True)
+		limit %(limit)s''', {
+			'now': now_datetime(),
+			'lease_expired': add_to_date(now_datetime(), seconds=-EMAIL_LEASE_TTL),
+			'limit': limit
+		}, as_dict=True)
+
+def send_queued_emails(auto_commit=True, time_limit=FLUSH_TIME_LIMIT, worker=None):
+	'''Claim and send batches of queued emails until the queue is empty, or for `time_limit`
+	seconds. SMTP connections are kept open across batches, one per outgoing email account.'''
+	start = time.time()
+	smtp_servers = {}
+	if worker is not None:
+		frappe.cache().set_value(get_worker_key(worker), 1, expires_in_sec=EMAIL_LEASE_TTL)
+
+	try:
+		while time.time() - start < time_limit:
+			if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
+				break
+
+			names = claim_batch()
+			if not names:
+				break
+
+			try:
+				sent = send_batch(names, smtp_servers, auto_commit)
+			finally:
+				release_batch(names)
+
+			if not sent:
+				# nothing could be sent (connection errors or rate limits), retry on the next flush
+				break
+	finally:
+		for smtpserver in smtp_servers.values():
+			try:
+				if smtpserver._sess:
+					smtpserver._sess.quit()
+			except Exception:
+				pass
+
+		if worker is not None:
+			frappe.cache().delete_value(get_worker_key(worker))
+
+def get_worker_key(worker):
+	return "email_flush_worker_running::{0}".format(worker)
+
+def claim_batch():
+	'''Returns names of up to `email_flush_batch_size` queued emails, leased to this job in
+	redis so that parallel jobs do not send the same email'''
+	batch_size = cint(frappe.conf.email_flush_batch_size) or DEFAULT_FLUSH_BATCH_SIZE
+	workers = cint(frappe.conf.email_flush_workers) or DEFAULT_FLUSH_WORKERS
+
+	# candidates for all workers, each worker leases the ones not taken by the others
+	candidates = [d.name for d in get_queue(batch_size * workers)]
+	if not candidates:
+		return []
+
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for name in candidates:
+		pipe.set(cache.make_key(get_lease_key(name)), 1, ex=EMAIL_LEASE_TTL, nx=True)
+
+	names = [name for name, leased in zip(candidates, pipe.execute()) if leased]
+	if len(names) > batch_size:
+		# leave the others for parallel jobs
+		release_batch(names[batch_size:])
+		names = names[:batch_size]
+
+	return names
+
+def release_batch(names):
+	frappe.cache().delete_value([get_lease_key(name) for name in names])
+
+def get_lease_key(name):
+	return "email_queue_lease::{0}".format(name)
+
+def send_batch(names, smtp_servers, auto_commit=True):
+	'''Send the leased emails, the status of each email (and its recipients) is written
+	(and committed) as soon as it is sent. Returns the number of emails sent.'''
+	if auto_commit:
+		# start a new transaction, so that emails sent by another job since the
+		# candidates were selected are seen as sent
+		frappe.db.commit()
+
+	placeholders = ', '.join(['%s'] * len(names))
+	emails = frappe.db.sql('''select
+			name, status, communication, message, sender, reference_doctype,
+			reference_name, unsubscribe_param, unsubscribe_method, expose_recipients,
+			show_as_cc, add_unsubscribe_link, attachments, retry
+		from
+			`tabEmail Queue`
+		where
+			name in ({0}) and (status='Not Sent' or status='Partially Sent'
+				or (status='Sending' and modified < %s))
+		order
+			by priority desc, creation asc'''.format(placeholders),
+		list(names) + [add_to_date(now_datetime(), seconds=-EMAIL_LEASE_TTL)], as_dict=True)
+
+	if not emails:
+		return 0
+
+	placeholders = ', '.join(['%s'] * len(emails))
+	recipients_by_email = {}
+	for recipient in frappe.db.sql('''select name, parent, recipient, status from
+		`tabEmail Queue Recipient` where parent in ({0})'''.format(placeholders),
+		[email.name for email in emails], as_dict=True):
+		recipients_by_email.setdefault(recipient.parent, []).append(recipient)
+
+	set_status([email.name for email in emails], 'Sending', auto_commit)
+
+	sent = 0
+	stop = False
+
+	for i, email in enumerate(emails):
+		recipients_list = recipients_by_email.get(email.name, [])
+		pending = [r for r in recipients_list if r.status == "Not Sent"]
+
+		email_account = get_outgoing_email_account(raise_exception_not_set=False,
+			append_to=email.reference_doctype, sender=email.sender)
+
+		if stop or not reserve_rate_limit(email_account, len(pending)):
+			# leave them for the next flush
+			names_by_status = {}
+			for skipped in emails[i:]:
+				status = 'Partially Sent' if any("Sent" == r.status
+					for r in recipients_by_email.get(skipped.name, [])) else 'Not Sent'
+				names_by_status.setdefault(status, []).append(skipped.name)
+
+			for status, skipped_names in names_by_status.items():
+				set_status(skipped_names, status)
+
+			if auto_commit:
+				frappe.db.commit()
+			break
+
+		sent_recipients = []
+		error = None
+		retry = False
+
+		try:
+			smtpserver = None
+			if not frappe.flags.in_test:
+				smtpserver = get_smtp_server(smtp_servers, email, email_account)
+
+			for recipient in pending:
+				message = prepare_message(email, recipient.recipient, recipients_list)
+				if not frappe.flags.in_test:
+					smtpserver.sess.sendmail(email.sender, recipient.recipient, encode(message))
+				else:
+					frappe.flags.sent_mail = message
+
+				recipient.status = "Sent"
+				sent_recipients.append(recipient.name)
+
+			#if all are sent set status
+			if any("Sent" == s.status for s in recipients_list):
+				status = 'Sent'
+				sent += 1
+			else:
+				status = 'Error'
+				error = "No recipients to send to"
+
+		except (smtplib.SMTPServerDisconnected,
+				smtplib.SMTPConnectError,
+				smtplib.SMTPHeloError,
+				smtplib.SMTPAuthenticationError,
+				JobTimeoutException):
+
+			# bad connection/timeout, retry later
+			if any("Sent" == s.status for s in recipients_list):
+				status = 'Partially Sent'
+			else:
+				status = 'Not Sent'
+
+			# no need to attempt further
+			stop = True
+
+		except Exception as e:
+			if email.retry < 3:
+				status = 'Not Sent'
+				retry = True
+			else:
+				if any("Sent" == s.status for s in recipients_list):
+					status = 'Partially Errored'
+				else:
+					status = 'Error'
+				error = text_type(e)
+
+			# log to Error Log
+			log('frappe.email.queue.flush', text_type(e))
+
+		set_sent_status(email, status, sent_recipients, error, retry, auto_commit)
+
+	return sent
+
+def set_sent_status(email, status, sent_recipients, error=None, retry=False, auto_commit=True):
+	'''Write the status of the email and its sent recipients, and commit'''
+	if sent_recipients:
+		frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent', modified=%s
+			where name in ({0})""".format(', '.join(['%s'] * len(sent_recipients))),
+			[now_datetime()] + sent_recipients)
+
+	if error:
+		frappe.db.sql("""update `tabEmail Queue` set status=%s, error=%s, modified=%s where name=%s""",
+			(status, error, now_datetime(), email.name))
+	else:
+		frappe.db.sql("""update `tabEmail Queue` set status=%s, retry=retry+%s, modified=%s
+			where name=%s""", (status, 1 if retry else 0, now_datetime(), email.name))
+
+	if email.communication:
+		frappe.get_doc('Communication', email.communication).set_delivery_status()
+
+	if auto_commit:
+		frappe.db.commit()
+
+def set_status(names, status, auto_commit=False):
+	frappe.db.sql("""update `tabEmail Queue` set status=%s, modified=%s where name in ({0})""".format(
+		', '.join(['%s'] * len(names))), [status, now_datetime()] + list(names), auto_commit=auto_commit)
+
+def get_smtp_server(smtp_servers, email, email_account):
+	'''Returns the open SMTP connection of the outgoing email account of this email'''
+	key = email_account.name if email_account else None
+
+	if key not in smtp_servers:
+		smtpserver = SMTPServer()
+		smtpserver.setup_email_account(email.reference_doctype, sender=email.sender)
+		smtp_servers[key] = smtpserver
+
+	return smtp_servers[key]
+
+def reserve_rate_limit(email_account, count):
+	'''Returns False if sending `count` more emails via the outgoing email account
+	would cross `email_rate_limit` (emails per minute per account, site config)'''
+	limit = cint(frappe.conf.email_rate_limit)
+	if not limit or not count:
+		return True
+
+	key = frappe.cache().make_key("email_rate_limit::{0}::{1}".format(
+		email_account.name if email_account else "", int(time.time() // 60)))
+
+	pipe = frappe.cache().pipeline()
+	pipe.incrby(key, count)
+	pipe.expire(key, 120)
+	sent = pipe.execute()[0]
+
+	if sent > limit:
+		frappe.cache().decr(key, count)
+		return False
 
+	return True
 
 def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=False):
 	'''Send Email Queue with given smtpserver'''
@@ -154,7 +154,8 @@ def upload_file():
 
 	if 'file' in files:
 		file = files['file']
-		content = file.stream.read()
+		# written to disk in chunks by File.save_file
+		content = file.stream.read() if method else file.stream
 		filename = file.filename
 
 	frappe.local.uploaded_file = content
@@ -9,6 +9,7 @@ import datetime
 from frappe import _
 from frappe.model import default_fields, table_fields
 from frappe.model.naming import set_new_name
+from frappe.database.statement_cache import statement_cache
 from frappe.model.utils.link_count import notify_link_count
 from frappe.modules import load_doctype_module
 from frappe.model import display_fieldtypes, data_fieldtypes
@@ -301,25 +302,18 @@ class BaseDocument(object):
 
 	def db_insert(self):
 		"""INSERT the document (with valid columns) in the database."""
-		if not self.name:
-			# name will be set by document class in most cases
-			set_new_name(self)
-
-		if not self.creation:
-			self.creation = self.modified = now()
-			self.created_by = self.modified_by = frappe.session.user
-
-		# if doctype is "DocType", don't insert null values as we don't know who is valid yet
-		d = self.get_valid_dict(convert_dates_to_str=True, ignore_nulls = self.doctype in ('DocType', 'DocField', 'DocPerm'))
+		d = self.get_valid_dict_for_insert()
 
 		columns = list(d)
 		try:
-			frappe.db.sql("""INSERT INTO `tab{doctype}` ({columns})
+			query = statement_cache.get(("insert", self.doctype, tuple(columns)),
+				lambda: """INSERT INTO `tab{doctype}` ({columns})
 					VALUES ({values})""".format(
 					doctype = self.doctype,
 					columns = ", ".join(["`"+c+"`" for c in columns]),
 					values = ", ".join(["%s"] * len(columns))
-				), list(d.values()))
+				))
+			frappe.db.sql(query, list(d.values()))
 		except Exception as e:
 			if frappe.db.is_primary_key_violation(e):
 				if self.meta.autoname=="hash":
@@ -340,7 +334,23 @@ class BaseDocument(object):
 
 		self.set("__islocal", False)
 
-	def db_update(self):
+	def get_valid_dict_for_insert(self):
+		"""Set name and timestamps if missing and return the values to be inserted."""
+		if not self.name:
+			# name will be set by document class in most cases
+			set_new_name(self)
+
+		if not self.creation:
+			self.creation = self.modified = now()
+			self.created_by = self.modified_by = frappe.session.user
+
+		# if doctype is "DocType", don't insert null values as we don't know who is valid yet
+		return self.get_valid_dict(convert_dates_to_str=True, ignore_nulls = self.doctype in ('DocType', 'DocField', 'DocPerm'))
+
+	def db_update(self, columns=None):
+		"""UPDATE the document in the database.
+
+		:param columns: [optional] Update only these columns."""
 		if self.get("__islocal") or not self.name:
 			self.db_insert()
 			return
@@ -351,20 +361,50 @@ class BaseDocument(object):
 		name = d['name']
 		del d['name']
 
+		if columns is not None:
+			d = frappe._dict((c, d[c]) for c in d if c in columns)
+			if not d:
+				return
+
 		columns = list(d)
 
 		try:
-			frappe.db.sql("""UPDATE `tab{doctype}`
+			query = statement_cache.get(("update", self.doctype, tuple(columns)),
+				lambda: """UPDATE `tab{doctype}`
 				SET {values} WHERE `name`=%s""".format(
 					doctype = self.doctype,
 					values = ", ".join(["`"+c+"`=%s" for c in columns])
-				), list(d.values()) + [name])
+				))
+			frappe.db.sql(query, list(d.values()) + [name])
 		except Exception as e:
 			if frappe.db.is_unique_key_violation(e):
 				self.show_unique_validation_message(e)
 			else:
 				raise
 
+	def get_changed_columns(self, other):
+		"""Returns columns whose values differ from `other` (the same document, as it was loaded
+		from the database). `modified` and `modified_by` are ignored as they change on every save."""
+		d = self.get_valid_dict(convert_dates_to_str=True)
+		other = other.get_valid_dict(convert_dates_to_str=True)
+
+		changed = []
+		for column, value in iteritems(d):
+			if column in ("modified", "modified_by"):
+				continue
+
+			old_value = other.get(column)
+			if value == old_value:
+				continue
+
+			# dates loaded from the database vs. string values set on the document
+			if value is not None and old_value is not None and cstr(value) == cstr(old_value):
+				continue
+
+			changed.append(column)
+
+		return changed
+
 	def show_unique_validation_message(self, e):
 		# TODO: Find a better way to extract fieldname
 		if frappe.db.db_type != 'postgres':
@@ -434,15 +474,12 @@ class BaseDocument(object):
 
 	def get_invalid_links(self, is_submittable=False):
 		'''Returns list of invalid links and also updates fetch values if not set'''
-		def get_msg(df, docname):
-			if self.parentfield:
-				return "{} #{}: {}: {}".format(_("Row"), self.idx, _(df.label), docname)
-			else:
-				return "{}: {}".format(_(df.label), docname)
-
-		invalid_links = []
-		cancelled_links = []
+		return get_invalid_links([self], is_submittable)
 
+	def get_links_to_validate(self):
+		'''Returns list of `(df, doctype, docname, fields_to_fetch)` for every Link and
+		Dynamic Link field that is set'''
+		links = []
 		for df in (self.meta.get_link_fields()
 				+ self.meta.get("fields", {"fieldtype": ('=', "Dynamic Link")})):
 			docname = self.get(df.fieldname)
@@ -457,8 +494,6 @@ class BaseDocument(object):
 					if not doctype:
 						frappe.throw(_("{0} must be set first").format(self.meta.get_label(df.options)))
 
-				# MySQL is case insensitive. Preserve case of the original docname in the Link Field.
-
 				# get a map of values ot fetch along with this link query
 				# that are mapped as link_fieldname.source_fieldname in Options of
 				# Readonly or Data or Text type fields
@@ -470,40 +505,56 @@ class BaseDocument(object):
 						or (_df.get('fetch_if_empty') and not self.get(_df.fieldname))
 				]
 
-				if not fields_to_fetch:
-					# cache a single value type
-					values = frappe._dict(name=frappe.db.get_value(doctype, docname,
-						'name', cache=True))
-				else:
-					values_to_fetch = ['name'] + [_df.fetch_from.split('.')[-1]
-						for _df in fields_to_fetch]
+				links.append((df, doctype, docname, fields_to_fetch))
+
+		return links
+
+	def get_link_values(self, doctype, docname, fields_to_fetch):
+		'''Returns `name` and the fetch values of the linked document, queried individually'''
+		if not fields_to_fetch:
+			# cache a single value type
+			values = frappe._dict(name=frappe.db.get_value(doctype, docname,
+				'name', cache=True))
+		else:
+			values_to_fetch = ['name'] + [_df.fetch_from.split('.')[-1]
+				for _df in fields_to_fetch]
 
-					# don't cache if fetching other values too
-					values = frappe.db.get_value(doctype, docname,
-						values_to_fetch, as_dict=True)
+			# don't cache if fetching other values too
+			values = frappe.db.get_value(doctype, docname,
+				values_to_fetch, as_dict=True)
 
-				if frappe.get_meta(doctype).issingle:
-					values.name = doctype
+		if frappe.get_meta(doctype).issingle:
+			values.name = doctype
 
-				if values:
-					setattr(self, df.fieldname, values.name)
+		if values and values.name and frappe.get_meta(doctype).is_submittable:
+			values.docstatus = frappe.db.get_value(doctype, docname, "docstatus")
 
-					for _df in fields_to_fetch:
-						if self.is_new() or self.docstatus != 1 or _df.allow_on_submit:
-							setattr(self, _df.fieldname, values[_df.fetch_from.split('.')[-1]])
+		return values
 
-					notify_link_count(doctype, docname)
+	def set_link_values(self, df, doctype, docname, fields_to_fetch, values, is_submittable=False):
+		'''Sets the link and fetch values and returns `(is_invalid, is_cancelled)`'''
+		if not values:
+			return False, False
 
-					if not values.name:
-						invalid_links.append((df.fieldname, docname, get_msg(df, docname)))
+		# MySQL is case insensitive. Preserve case of the original docname in the Link Field.
+		setattr(self, df.fieldname, values.name)
 
-					elif (df.fieldname != "amended_from"
-						and (is_submittable or self.meta.is_submittable) and frappe.get_meta(doctype).is_submittable
-						and cint(frappe.db.get_value(doctype, docname, "docstatus"))==2):
+		for _df in fields_to_fetch:
+			if self.is_new() or self.docstatus != 1 or _df.allow_on_submit:
+				setattr(self, _df.fieldname, values[_df.fetch_from.split('.')[-1]])
 
-						cancelled_links.append((df.fieldname, docname, get_msg(df, docname)))
+		notify_link_count(doctype, docname)
 
-		return invalid_links, cancelled_links
+		if not values.name:
+			return True, False
+
+		elif (df.fieldname != "amended_from"
+			and (is_submittable or self.meta.is_submittable) and frappe.get_meta(doctype).is_submittable
+			and cint(values.docstatus)==2):
+
+			return False, True
+
+		return False, False
 
 	def _validate_selects(self):
 		if frappe.flags.in_import:
@@ -853,3 +904,109 @@ def _filter(data, filters, limit=None):
 				break
 
 	return out
+
+def bulk_db_insert(docs, chunk_size=1000):
+	"""INSERT documents of the same DocType using multi-row `INSERT` statements.
+
+	If a chunk fails because of a duplicate name or a unique constraint, it is rolled
+	back to a savepoint (on Postgres, the failed statement aborts the transaction) and
+	its documents are inserted one by one via `db_insert`, so that errors are raised
+	(and hash collisions retried) exactly as when inserting a single document.
+
+	:param docs: List of `BaseDocument` objects of the same DocType.
+	:param chunk_size: Maximum number of rows in one statement."""
+	if not docs:
+		return
+
+	doctype = docs[0].doctype
+	if len(docs) == 1 or doctype in ('DocType', 'DocField', 'DocPerm'):
+		# null values are not inserted for these, so columns can differ per row
+		for d in docs:
+			d.db_insert()
+		return
+
+	for start in range(0, len(docs), chunk_size):
+		chunk = docs[start:start + chunk_size]
+		rows = [d.get_valid_dict_for_insert() for d in chunk]
+		columns = list(rows[0])
+
+		frappe.db.sql("SAVEPOINT bulk_db_insert")
+		try:
+			frappe.db.bulk_insert(doctype, columns, [[r[c] for c in columns] for r in rows],
+				chunk_size=chunk_size)
+		except Exception as e:
+			if frappe.db.is_primary_key_violation(e) or frappe.db.is_unique_key_violation(e):
+				frappe.db.sql("ROLLBACK TO SAVEPOINT bulk_db_insert")
+				for d in chunk:
+					d.db_insert()
+			else:
+				raise
+		else:
+			frappe.db.sql("RELEASE SAVEPOINT bulk_db_insert")
+
+		for d in chunk:
+			d.set("__islocal", False)
+
+def get_invalid_links(docs, is_submittable=False):
+	"""Returns `(invalid_links, cancelled_links)` for the Link and Dynamic Link fields of
+	all the given documents, and also updates fetch values if not set.
+
+	Links are resolved with one `name in (...)` query per linked DocType, that also
+	returns the values to fetch and `docstatus`.
+
+	:param docs: List of documents, e.g. a document and all its children.
+	:param is_submittable: Check for cancelled links even if the document's DocType
+		is not submittable (for children of submittable documents)."""
+	def get_msg(doc, df, docname):
+		if doc.parentfield:
+			return "{} #{}: {}: {}".format(_("Row"), doc.idx, _(df.label), docname)
+		else:
+			return "{}: {}".format(_(df.label), docname)
+
+	links = [(doc, link) for doc in docs for link in doc.get_links_to_validate()]
+	values_by_doctype = get_link_values_by_doctype([link for doc, link in links])
+
+	invalid_links = []
+	cancelled_links = []
+
+	for doc, (df, doctype, docname, fields_to_fetch) in links:
+		values = values_by_doctype.get(doctype, {}).get(docname)
+		if values is None:
+			# single doctypes and names that only match case insensitively
+			values = doc.get_link_values(doctype, docname, fields_to_fetch)
+
+		is_invalid, is_cancelled = doc.set_link_values(df, doctype, docname, fields_to_fetch,
+			values, is_submittable)
+
+		if is_invalid:
+			invalid_links.append((df.fieldname, docname, get_msg(doc, df, docname)))
+		elif is_cancelled:
+			cancelled_links.append((df.fieldname, docname, get_msg(doc, df, docname)))
+
+	return invalid_links, cancelled_links
+
+def get_link_values_by_doctype(links):
+	"""Returns `{doctype: {name: values}}` for the given `(df, doctype, docname, fields_to_fetch)`
+	links, with one query per (non single) DocType. Names that are not found are not in the result."""
+	names_by_doctype = {}
+	fields_by_doctype = {}
+	for df, doctype, docname, fields_to_fetch in links:
+		names_by_doctype.setdefault(doctype, set()).add(docname)
+		fields_by_doctype.setdefault(doctype, set()).update(_df.fetch_from.split('.')[-1]
+			for _df in fields_to_fetch)
+
+	out = {}
+	for doctype, names in iteritems(names_by_doctype):
+		meta = frappe.get_meta(doctype)
+		if meta.issingle:
+			continue
+
+		fields = ['name'] + list(fields_by_doctype[doctype])
+		if meta.is_submittable:
+			fields.append('docstatus')
+
+		out[doctype] = {}
+		for values in frappe.db.get_values(doctype, {'name': ('in', list(names))}, fields, as_dict=True):
+			out[doctype][values.name] = values
+
+	return out
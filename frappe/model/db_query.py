@@ -29,6 +29,7 @@ class DatabaseQuery(object):
 		self.ignore_ifnull = False
 		self.flags = frappe._dict()
 		self.reference_doctype = None
+		self.keyset_condition = None
 
 	def execute(self, query=None, fields=None, filters=None, or_filters=None,
 		docstatus=None, group_by=None, order_by=None, limit_start=False,
@@ -104,6 +105,113 @@ class DatabaseQuery(object):
 
 		return result
 
+	def iterate(self, batch_size=1000, **kwargs):
+		"""Yields results of `execute` in batches of `batch_size` rows, for exports.
+
+		Rows of the DocType sorted by its standard columns (`modified`, `creation`, `name`,
+		`idx`, `docstatus`) are paged by keyset (rows after the last row of the previous
+		batch), other results by offset. Results with `group_by` or `distinct` are not paged."""
+		for key in ("limit_start", "start", "limit_page_length", "page_length", "limit"):
+			kwargs.pop(key, None)
+
+		if kwargs.get("query") or kwargs.get("group_by") or kwargs.get("distinct"):
+			yield self.execute(**kwargs)
+			return
+
+		order_by = kwargs.get("order_by") or get_order_by(self.doctype, frappe.get_meta(self.doctype))
+		keys = self.get_keyset(order_by)
+		if keys:
+			order_by = ", ".join("`tab{0}`.`{1}` {2}".format(self.doctype, column,
+				"desc" if descending else "asc") for column, descending in keys)
+		else:
+			# a stable order for offsets
+			order_by = "{0}, `tab{1}`.`name` asc".format(order_by, self.doctype)
+		kwargs["order_by"] = order_by
+
+		fields = kwargs.pop("fields", None) or ["`tab{0}`.`name`".format(self.doctype)]
+		if isinstance(fields, string_types):
+			fields = [fields]
+		if keys:
+			fields = list(fields) + ["`tab{0}`.`{1}` as `_keyset_{1}`".format(self.doctype, column)
+				for column, descending in keys]
+
+		start = 0
+		while True:
+			batch = self.execute(fields=list(fields), limit_start=start, limit_page_length=batch_size, **kwargs)
+			kwargs["save_user_settings"] = False
+
+			if keys:
+				last = batch[-1] if batch else None
+				batch = self.strip_keyset(batch, keys)
+				self.fields = [f for f in self.fields if "`_keyset_" not in f]
+
+				if len(self.tables) > 1 or self.or_conditions:
+					# rows of child tables, or conditions that can't be combined with a keyset
+					fields = fields[:-len(keys)]
+					keys = None
+					start = len(batch)
+
+				elif last:
+					self.keyset_condition = self.get_keyset_condition(keys,
+						last[-len(keys):] if self.as_list else [last["_keyset_" + c] for c, d in keys])
+
+			else:
+				start += len(batch)
+
+			if batch:
+				yield batch
+
+			if len(batch) < batch_size:
+				break
+
+		self.keyset_condition = None
+
+	def get_keyset(self, order_by):
+		"""Returns `(column, descending)` of `order_by`, ending with `name`, if all columns
+		are standard columns of the DocType that are never null, else None"""
+		keys = []
+		for part in order_by.split(","):
+			match = re.match(r"^\s*(?:`tab{0}`\.)?`?(\w+)`?(?:\s+(asc|desc))?\s*$".format(re.escape(self.doctype)),
+				part, re.I)
+			if not match or match.group(1) not in ("name", "modified", "creation", "idx", "docstatus"):
+				return None
+
+			keys.append((match.group(1), (match.group(2) or "asc").lower() == "desc"))
+			if match.group(1) == "name":
+				return keys
+
+		return keys + [("name", keys[-1][1])]
+
+	def get_keyset_condition(self, keys, values):
+		"""Returns the condition for rows after `values` in the order of `keys`"""
+		conditions = []
+		for i, (column, descending) in enumerate(keys):
+			parts = ["`tab{0}`.`{1}` = {2}".format(self.doctype, c, self.escape_keyset_value(c, v))
+				for (c, d), v in zip(keys[:i], values[:i])]
+			parts.append("`tab{0}`.`{1}` {2} {3}".format(self.doctype, column, "<" if descending else ">",
+				self.escape_keyset_value(column, values[i])))
+			conditions.append("({0})".format(" and ".join(parts)))
+
+		return "({0})".format(" or ".join(conditions))
+
+	@staticmethod
+	def escape_keyset_value(column, value):
+		if column in ("idx", "docstatus"):
+			return cstr(cint(value))
+
+		return frappe.db.escape(cstr(value), percent=False)
+
+	def strip_keyset(self, batch, keys):
+		"""Remove columns added for the keyset from the results"""
+		if self.as_list:
+			return [row[:-len(keys)] for row in batch]
+
+		for row in batch:
+			for column, descending in keys:
+				row.pop("_keyset_" + column, None)
+
+		return batch
+
 	def build_and_run(self):
 		args = self.prepare_args()
 		args.limit = self.add_limit()
@@ -130,6 +238,9 @@ class DatabaseQuery(object):
 		self.set_optional_columns()
 		self.build_conditions()
 
+		if self.keyset_condition:
+			self.conditions.append(self.keyset_condition)
+
 		args = frappe._dict()
 
 		if self.with_childnames:
@@ -93,6 +93,7 @@ def delete_doc(doctype=None, name=None, force=0, ignore_doctypes=None, for_reloa
 			update_naming_series(doc)
 			delete_from_table(doctype, name, ignore_doctypes, doc)
 			doc.run_method("after_delete")
+			doc.invalidate_report_cache()
 
 			# delete attachments
 			remove_all(doctype, name, from_delete=True)
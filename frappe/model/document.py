@@ -7,14 +7,16 @@ import time
 from frappe import _, msgprint
 from frappe.utils import flt, cstr, now, get_datetime_str, file_lock, date_diff
 from frappe.utils.background_jobs import enqueue
-from frappe.model.base_document import BaseDocument, get_controller
+from frappe.model.base_document import BaseDocument, get_controller, bulk_db_insert, get_invalid_links
 from frappe.model.naming import set_new_name
 from six import iteritems, string_types
 from werkzeug.exceptions import NotFound, Forbidden
-import hashlib, json
+import hashlib, json, copy
+from collections import OrderedDict
 from frappe.model import optional_fields, table_fields
 from frappe.model.workflow import validate_workflow
 from frappe.utils.global_search import update_global_search
+from frappe.desk.report_cache import invalidate as invalidate_report_cache
 from frappe.integrations.doctype.webhook import run_webhooks
 from frappe.desk.form.document_follow import follow_document
 
@@ -70,6 +72,77 @@ def get_doc(*args, **kwargs):
 
 	raise ImportError(doctype)
 
+def get_docs(doctype, names):
+	"""Returns a list of `Document` objects of the given DocType and names.
+
+	Parents are loaded in one query and children in one query per child DocType,
+	instead of the query per document and table field of `get_doc`. Names that
+	do not exist are skipped.
+
+	:param doctype: DocType name.
+	:param names: List of document names."""
+	meta = frappe.get_meta(doctype)
+	if meta.issingle:
+		return [get_doc(doctype, doctype)]
+
+	names = list(names)
+	table_fields = meta.get_table_fields()
+	docs = {}
+
+	for start in range(0, len(names), 1000):
+		batch = names[start:start + 1000]
+		parents = frappe.db.get_values(doctype, {"name": ("in", batch)}, "*", as_dict=True)
+		children = get_children(doctype, [d.name for d in parents], table_fields)
+
+		for d in parents:
+			d.doctype = doctype
+			for df in table_fields:
+				d[df.fieldname] = children.get(d.name, {}).get(df.fieldname, [])
+			docs[d.name] = get_doc(d)
+
+	return [docs[name] for name in names if name in docs]
+
+def get_children(parenttype, parents, table_fields):
+	"""Returns child rows of the given parents, as `{parent: {parentfield: [rows]}}`,
+	sorted by `idx`. Runs one query per child DocType, for any number of parents.
+
+	:param parenttype: DocType of the parents.
+	:param parents: List of parent names.
+	:param table_fields: Table fields (`DocField`) of the parent DocType."""
+	out = {}
+	if not parents:
+		return out
+
+	# rows are grouped by the names as queried, MariaDB matches them
+	# regardless of case and trailing spaces
+	if frappe.db.db_type == "postgres":
+		get_key = lambda value: value
+	else:
+		get_key = lambda value: cstr(value).rstrip(" ").lower()
+
+	parents_by_key = {}
+	for parent in parents:
+		parents_by_key.setdefault(get_key(parent), []).append(parent)
+
+	parentfields_by_doctype = OrderedDict()
+	for df in table_fields:
+		parentfields_by_doctype.setdefault(df.options, []).append(df.fieldname)
+
+	for child_doctype, parentfields in iteritems(parentfields_by_doctype):
+		rows = frappe.db.get_values(child_doctype, {
+				"parent": ("in", parents),
+				"parenttype": parenttype,
+				"parentfield": ("in", parentfields)
+			}, "*", as_dict=True, order_by="idx asc")
+
+		parentfield_by_key = dict((get_key(fieldname), fieldname) for fieldname in parentfields)
+		for row in rows:
+			parentfield = parentfield_by_key.get(get_key(row.parentfield), row.parentfield)
+			for parent in parents_by_key.get(get_key(row.parent), ()):
+				out.setdefault(parent, {}).setdefault(parentfield, []).append(row)
+
+	return out
+
 class Document(BaseDocument):
 	"""All controllers inherit from `Document`."""
 	def __init__(self, *args, **kwargs):
@@ -154,14 +227,9 @@ class Document(BaseDocument):
 		else:
 			table_fields = self.meta.get_table_fields()
 
+		children = get_children(self.doctype, [self.name], table_fields).get(self.name, {})
 		for df in table_fields:
-			children = frappe.db.get_values(df.options,
-				{"parent": self.name, "parenttype": self.doctype, "parentfield": df.fieldname},
-				"*", as_dict=True, order_by="idx asc")
-			if children:
-				self.set(df.fieldname, children)
-			else:
-				self.set(df.fieldname, [])
+			self.set(df.fieldname, children.get(df.fieldname, []))
 
 		# sometimes __setup__ can depend on child values, hence calling again at the end
 		if hasattr(self, "__setup__"):
@@ -245,9 +313,9 @@ class Document(BaseDocument):
 				if not ignore_if_duplicate:
 					raise e
 
-		# children
-		for d in self.get_all_children():
-			d.db_insert()
+		# children, one multi-row INSERT per child DocType
+		for children in self.get_children_by_doctype().values():
+			bulk_db_insert(children)
 
 		self.run_method("after_insert")
 		self.flags.in_insert = True
@@ -354,6 +422,10 @@ class Document(BaseDocument):
 		if not df:
 			df = self.meta.get_field(fieldname)
 
+		if self.get_doc_before_save():
+			self.sync_child_table_changes(df)
+			return
+
 		for d in self.get(df.fieldname):
 			d.db_update()
 			rows.append(d.name)
@@ -380,6 +452,44 @@ class Document(BaseDocument):
 				and parenttype=%s and parentfield=%s""".format(df.options),
 				(self.name, self.doctype, fieldname))
 
+	def sync_child_table_changes(self, df):
+		'''sync child table using the difference from `_doc_before_save` (or from the rows as
+		synced earlier in this save, e.g. if `on_update` updates children again): UPDATE only
+		changed rows (and columns), INSERT new rows and DELETE removed rows in one query'''
+		synced_rows = self.__dict__.setdefault('_synced_child_rows', {})
+		if df.fieldname in synced_rows:
+			rows_before_save = dict(synced_rows[df.fieldname])
+		else:
+			rows_before_save = dict((d.name, d) for d in self._doc_before_save.get(df.fieldname))
+
+		new_rows = []
+		for d in self.get(df.fieldname):
+			row_before_save = rows_before_save.pop(d.name, None)
+			if d.get("__islocal") or not row_before_save:
+				new_rows.append(d)
+				continue
+
+			columns = d.get_changed_columns(row_before_save)
+			if columns:
+				d.db_update(columns + ["modified", "modified_by"])
+
+		bulk_db_insert(new_rows)
+
+		# copies, so that later changes to the rows are seen as changes
+		synced_rows[df.fieldname] = dict((d.name, copy.copy(d)) for d in self.get(df.fieldname))
+
+		if df.options in (self.flags.ignore_children_type or []):
+			# do not delete rows for this because of flags
+			# hack for docperm :(
+			synced_rows[df.fieldname].update(rows_before_save)
+			return
+
+		if rows_before_save:
+			frappe.db.sql("""delete from `tab{0}` where parent=%s
+				and parenttype=%s and parentfield=%s and name in ({1})""".format(df.options,
+				','.join(['%s'] * len(rows_before_save))),
+				[self.name, self.doctype, df.fieldname] + list(rows_before_save))
+
 	def get_doc_before_save(self):
 		return getattr(self, '_doc_before_save', None)
 
@@ -742,12 +852,8 @@ class Document(BaseDocument):
 		if self.flags.ignore_links or self._action == "cancel":
 			return
 
-		invalid_links, cancelled_links = self.get_invalid_links()
-
-		for d in self.get_all_children():
-			result = d.get_invalid_links(is_submittable=self.meta.is_submittable)
-			invalid_links.extend(result[0])
-			cancelled_links.extend(result[1])
+		invalid_links, cancelled_links = get_invalid_links([self] + self.get_all_children(),
+			is_submittable=self.meta.is_submittable)
 
 		if invalid_links:
 			msg = ", ".join((each[2] for each in invalid_links))
@@ -771,6 +877,13 @@ class Document(BaseDocument):
 				ret.extend(value)
 		return ret
 
+	def get_children_by_doctype(self):
+		"""Returns all children documents grouped by DocType, in an ordered dict."""
+		children = OrderedDict()
+		for d in self.get_all_children():
+			children.setdefault(d.doctype, []).append(d)
+		return children
+
 	def run_method(self, method, *args, **kwargs):
 		"""run standard triggers, plus those in hooks"""
 		if "flags" in kwargs:
@@ -899,6 +1012,7 @@ class Document(BaseDocument):
 	def load_doc_before_save(self):
 		'''Save load document from db before saving'''
 		self._doc_before_save = None
+		self._synced_child_rows = {}
 		if not self.is_new():
 			try:
 				self._doc_before_save = frappe.get_doc(self.doctype, self.name)
@@ -928,6 +1042,7 @@ class Document(BaseDocument):
 
 		self.clear_cache()
 		self.notify_update()
+		self.invalidate_report_cache()
 
 		update_global_search(self)
 
@@ -942,6 +1057,9 @@ class Document(BaseDocument):
 	def clear_cache(self):
 		frappe.clear_document_cache(self.doctype, self.name)
 
+	def invalidate_report_cache(self):
+		invalidate_report_cache(self.doctype, *[df.options for df in self.meta.get_table_fields()])
+
 	def reset_seen(self):
 		'''Clear _seen property and set current user as seen'''
 		if getattr(self.meta, 'track_seen', False):
@@ -5,7 +5,9 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 from frappe.utils import now_datetime, cint, cstr
+from frappe.model import series_block
 import re
+import time
 from six import string_types
 
 
@@ -155,8 +157,17 @@ def parse_naming_series(parts, doctype='', doc=''):
 
 
 def getseries(key, digits):
+	# reserved in blocks ?
+	current = series_block.get_next(key)
+	if current is not None:
+		return ('%0'+str(digits)+'d') % current
+
 	# series created ?
+	started = time.time()
 	current = frappe.db.sql("SELECT `current` FROM `tabSeries` WHERE `name`=%s FOR UPDATE", (key,))
+	if frappe.local.conf.naming_series_stats:
+		series_block.record_stats(key, time.time() - started)
+
 	if current and current[0][0] is not None:
 		current = current[0][0]
 		# yes, update it
@@ -180,6 +191,10 @@ def revert_series_if_last(key, name):
 	if '.' in prefix:
 		prefix = parse_naming_series(prefix.split('.'))
 
+	# numbers reserved in blocks are not given back
+	if series_block.get_settings(prefix):
+		return
+
 	count = cint(name.replace(prefix, ""))
 	current = frappe.db.sql("SELECT `current` FROM `tabSeries` WHERE `name`=%s FOR UPDATE", (prefix,))
 
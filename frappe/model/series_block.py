@@ -0,0 +1,242 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Block allocation for naming series.
+
+`getseries` locks the row of the series in `tabSeries` until the transaction is
+committed, so concurrent inserts on the same series wait for each other. For series
+set in `naming_series_blocks` (site config), a block of numbers is instead reserved
+in a short transaction on a separate connection, and handed out without locking:
+
+	"naming_series_blocks": {
+		"SINV-": 100,
+		"POS-": {"size": 50, "ordered": 1},
+		"*": 20
+	}
+
+Keys match series (after date parts are replaced, e.g. `SINV-2019-`) by prefix, the
+longest key wins and `*` matches all series. The value is the size of the block:
+
+- by default, a block is handed out by the process that reserved it. Names given by
+  concurrent processes interleave out of order, and numbers left in a block are
+  skipped when the process exits.
+- with `ordered`, blocks are handed out via Redis to all processes of the site, so
+  names follow the order in which they were allocated. Numbers are only skipped if
+  the Redis cache is flushed.
+
+In both modes, numbers are not given back when the transaction is rolled back or
+the last document is deleted (`revert_series_if_last`).
+
+New blocks are only reserved while the request's transaction has no writes. After a
+write, the transaction may hold the row lock of the series (e.g. from `getseries` or
+`revert_series_if_last`), and the separate connection would wait for it forever.
+Numbers left in reserved blocks are still handed out, and once they run out
+`getseries` locks the row in the request's transaction as without blocks.
+
+Row lock waits while reserving blocks are recorded, and with `naming_series_stats`
+in site config, also those of `getseries` for other series. See `get_stats`.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import time
+import threading
+
+import redis
+
+import frappe
+from frappe.utils import cint, flt
+
+# hash of "{series}|{stat}" -> value
+STATS_KEY = "naming_series_stats"
+
+# shared blocks of a series: a list of reserved "start:end" blocks, and a hash with the
+# last number handed out of the current block and its end
+QUEUE_KEY = "naming_series_blocks::{0}"
+CURRENT_KEY = "naming_series_block::{0}"
+
+# attempts to get a number from shared blocks before falling back to a row lock
+MAX_ATTEMPTS = 3
+
+TAKE_SCRIPT = """
+local last = tonumber(redis.call('HGET', KEYS[1], 'last'))
+if last then
+	local value = redis.call('HINCRBY', KEYS[1], 'next', 1)
+	if value <= last then
+		return value
+	end
+end
+
+local block = redis.call('LPOP', KEYS[2])
+if not block then
+	return false
+end
+
+local first, final = string.match(block, '(%d+):(%d+)')
+redis.call('HMSET', KEYS[1], 'next', first, 'last', final)
+return tonumber(first)
+"""
+
+# blocks of this process: (site, series) -> [next, last]
+_blocks = {}
+_pid = [None]
+_lock = threading.Lock()
+
+def get_settings(key):
+	"""Returns `size` and `ordered` if numbers of the series are allocated in blocks, else None"""
+	conf = frappe.local.conf.naming_series_blocks
+	if not conf:
+		return None
+
+	match = None
+	for series in conf:
+		if series == "*" and match is None:
+			match = series
+		elif series != "*" and key.startswith(series) and (match in (None, "*") or len(series) > len(match)):
+			match = series
+
+	if match is None:
+		return None
+
+	settings = conf[match]
+	if not isinstance(settings, dict):
+		settings = {"size": settings}
+
+	size = cint(settings.get("size"))
+	if size <= 1:
+		return None
+
+	return frappe._dict(size=size, ordered=cint(settings.get("ordered")))
+
+def get_next(key):
+	"""Returns the next number of the series from a block, or None if the series is not
+	allocated in blocks (or Redis is not reachable for an ordered series, or a new block
+	cannot be reserved in this transaction)"""
+	settings = get_settings(key)
+	if not settings:
+		return None
+
+	if settings.ordered:
+		return get_next_shared(key, settings.size)
+
+	return get_next_local(key, settings.size)
+
+def get_next_local(key, size):
+	block_key = (frappe.local.site, key)
+	with _lock:
+		check_pid()
+		block = _blocks.get(block_key)
+		if block and block[0] <= block[1]:
+			block[0] += 1
+			return block[0] - 1
+
+	if not can_reserve():
+		return None
+
+	first, last = reserve_block(key, size)
+	with _lock:
+		_blocks[block_key] = [first + 1, last]
+
+	return first
+
+def get_next_shared(key, size):
+	cache = frappe.cache()
+	keys = (cache.make_key(CURRENT_KEY.format(key)), cache.make_key(QUEUE_KEY.format(key)))
+
+	try:
+		for i in range(MAX_ATTEMPTS):
+			value = cache.eval(TAKE_SCRIPT, 2, *keys)
+			if value:
+				return cint(value)
+
+			if not can_reserve():
+				return None
+
+			first, last = reserve_block(key, size)
+			redis.Redis.rpush(cache, keys[1], "{0}:{1}".format(first, last))
+	except redis.exceptions.ConnectionError:
+		pass
+
+	return None
+
+def can_reserve():
+	"""Blocks are reserved on a separate connection, which would wait for a row lock held
+	by the request's transaction. Only safe if the transaction has not written yet."""
+	return not frappe.db.transaction_writes
+
+def reserve_block(key, size):
+	"""Reserves the next `size` numbers of the series in a separate transaction, and
+	returns the first and last of them"""
+	db = get_series_db()
+	try:
+		db.begin()
+		started = time.time()
+		current = db.sql("SELECT `current` FROM `tabSeries` WHERE `name`=%s FOR UPDATE", (key,))
+		waited = time.time() - started
+
+		if current and current[0][0] is not None:
+			first = cint(current[0][0]) + 1
+			db.sql("UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name`=%s", (size, key))
+		else:
+			first = 1
+			db.sql("INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)", (key, size))
+
+		db.sql("commit")
+	except Exception:
+		db.sql("rollback")
+		raise
+	finally:
+		db.close()
+
+	record_stats(key, waited, blocks=1)
+	return first, first + size - 1
+
+def get_series_db():
+	"""Returns a new connection, so that blocks are committed independently of the request"""
+	from frappe.database import get_db
+
+	db = get_db(user=frappe.conf.db_name)
+
+	# connecting resets rollback observers of the request
+	observers = frappe.local.rollback_observers
+	db.connect()
+	frappe.local.rollback_observers = observers
+
+	return db
+
+def check_pid():
+	"""Drop blocks inherited from the parent process, it hands them out"""
+	if _pid[0] != os.getpid():
+		_blocks.clear()
+		_pid[0] = os.getpid()
+
+def record_stats(key, lock_wait, blocks=0):
+	cache = frappe.cache()
+	stats_key = cache.make_key(STATS_KEY)
+	try:
+		pipe = cache.pipeline()
+		pipe.hincrby(stats_key, "{0}|locks".format(key), 1)
+		pipe.hincrbyfloat(stats_key, "{0}|lock_wait".format(key), lock_wait)
+		if blocks:
+			pipe.hincrby(stats_key, "{0}|blocks".format(key), blocks)
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
+
+def get_stats():
+	"""Returns for each series the number of row locks taken, the total and average time
+	waited for them (seconds), and the number of blocks reserved"""
+	cache = frappe.cache()
+	stats = {}
+	for field, value in redis.Redis.hgetall(cache, cache.make_key(STATS_KEY)).items():
+		key, stat = frappe.safe_decode(field).rsplit("|", 1)
+		stats.setdefault(key, frappe._dict(locks=0, lock_wait=0.0, blocks=0))[stat] = flt(value)
+
+	for key_stats in stats.values():
+		key_stats.average_lock_wait = key_stats.lock_wait / key_stats.locks if key_stats.locks else 0.0
+
+	return stats
+
+def clear_stats():
+	frappe.cache().delete_value(STATS_KEY)
@@ -61,6 +61,8 @@ frappe.views.QueryReport = class QueryReport extends frappe.views.BaseList {
 		this.refresh = frappe.utils.throttle(this.refresh, 300);
 
 		this.menu_items = [];
+		// rows fetched per "Load More" of a prepared report
+		this.prepared_report_page_length = 10000;
 	}
 
 	setup_events() {
@@ -335,6 +337,9 @@ frappe.views.QueryReport = class QueryReport extends frappe.views.BaseList {
 				}
 				this.add_prepared_report_buttons(data.doc);
 			}
+			// rows of large prepared reports after the first page are loaded on demand
+			this.prepared_report_doc = data.prepared_report ? data.doc : null;
+			this.total_rows = data.total_rows;
 			this.toggle_message(false);
 			if (data.result && data.result.length) {
 				this.prepare_report_data(data);
@@ -358,11 +363,44 @@ frappe.views.QueryReport = class QueryReport extends frappe.views.BaseList {
 				this.toggle_nothing_to_show(true);
 			}
 
+			this.toggle_load_more_rows();
 			this.show_footer_message();
 			frappe.hide_progress();
 		});
 	}
 
+	toggle_load_more_rows() {
+		this.page.wrapper.find('.load-more-rows').remove();
+		if (!this.prepared_report_doc || !this.total_rows || this.data.length >= this.total_rows) return;
+
+		const message = __('Showing {0} of {1} rows.',
+			[format_number(this.data.length, null, 0), format_number(this.total_rows, null, 0)]);
+		$(`<div class="load-more-rows text-center text-muted" style="padding: 15px;">
+			<span>${message}</span>
+			<button class="btn btn-xs btn-default">${__('Load More')}</button>
+		</div>`)
+			.insertAfter(this.$report)
+			.find('button').on('click', () => this.load_more_rows());
+	}
+
+	load_more_rows() {
+		return frappe.call({
+			method: 'frappe.core.doctype.prepared_report.prepared_report.get_prepared_report_rows',
+			args: {
+				dn: this.prepared_report_doc.name,
+				start: this.data.length,
+				page_length: this.prepared_report_page_length
+			},
+			freeze: true
+		}).then(r => {
+			const rows = this.prepare_data(r.message.result);
+			this.data = this.data.concat(rows);
+			this.total_rows = r.message.total_rows;
+			this.datatable.appendRows(rows);
+			this.toggle_load_more_rows();
+		});
+	}
+
 	add_prepared_report_buttons(doc) {
 		if(doc){
 			this.page.add_inner_button(__("Download Report"), function (){
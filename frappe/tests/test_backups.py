@@ -0,0 +1,16 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.utils.backups import get_table_groups
+
+class TestBackups(unittest.TestCase):
+	def test_table_groups(self):
+		groups = get_table_groups(frappe.conf.db_name, 3)
+		tables = [t for group in groups for t in group]
+
+		self.assertEqual(len(groups), 3)
+		self.assertEqual(len(tables), len(set(tables)))
+		self.assertIn('tabToDo', tables)
+		self.assertIn('tabDocType', tables)
@@ -65,3 +65,106 @@ class TestDB(unittest.TestCase):
 		self.assertIn('tabCustom Field', frappe.flags.touched_tables)
 		frappe.flags.in_migrate = False
 		frappe.flags.touched_tables.clear()
+
+	def test_bulk_insert(self):
+		frappe.db.delete("ToDo", {"description": ("like", "_Test Bulk Insert%")})
+		names = [frappe.generate_hash(length=10) for i in range(25)]
+		frappe.db.bulk_insert("ToDo", ["name", "description", "status"],
+			[[name, "_Test Bulk Insert " + name, "Open"] for name in names], chunk_size=10)
+
+		self.assertEqual(frappe.db.count("ToDo", {"description": ("like", "_Test Bulk Insert%")}), 25)
+
+		# duplicates are skipped
+		frappe.db.bulk_insert("ToDo", ["name", "description", "status"],
+			[[names[0], "_Test Bulk Insert duplicate", "Open"]], ignore_duplicates=True)
+		self.assertEqual(frappe.db.get_value("ToDo", names[0], "description"), "_Test Bulk Insert " + names[0])
+
+	def test_statement_cache(self):
+		from frappe.database.statement_cache import statement_cache
+
+		statement_cache.reset_stats()
+		for i in range(3):
+			frappe.db.sql("select ifnull(name, '') from tabUser where name=%s", "Administrator")
+
+		stats = statement_cache.get_stats()
+		self.assertTrue(stats.hits >= 2)
+		self.assertTrue(stats.time_saved >= 0)
+
+		todo = frappe.get_doc({'doctype': 'ToDo', 'description': 'Statement Cache'}).insert()
+		statement_cache.reset_stats()
+		todo.description = 'Statement Cache Updated'
+		todo.db_update()
+		todo.db_update()
+		self.assertTrue(statement_cache.get_stats().hits >= 1)
+		self.assertEqual(frappe.db.get_value('ToDo', todo.name, 'description'), 'Statement Cache Updated')
+		todo.delete()
+
+		# long statements are built, but not kept
+		from frappe.database.statement_cache import StatementCache, MAX_QUERY_LENGTH
+		cache = StatementCache()
+		cache.get("long", lambda: "x" * (MAX_QUERY_LENGTH + 1))
+		self.assertNotIn("long", cache.statements)
+
+	def test_read_replica_routing(self):
+		from frappe.database.replica import route_reads_to_replica, close_replica_connections
+
+		# use the primary itself as replica, its lag is unknown as it is not replicating
+		conf = frappe.local.conf
+		conf.update(read_from_replica=1, replica_host=frappe.db.host)
+		frappe.db.has_writes = False
+
+		try:
+			with route_reads_to_replica():
+				frappe.db.sql("select name from tabUser where name='Administrator'")
+				self.assertIn(frappe.db.host, frappe.local.replica_dbs)
+				# chosen once for the request
+				self.assertEqual(frappe.local.replica_host, frappe.db.host)
+				replica = frappe.local.replica_dbs[frappe.db.host]
+				self.assertTrue(replica._conn)
+
+				# reads after a write stay on the primary
+				frappe.db.sql("update tabUser set modified=modified where name='Administrator'")
+				self.assertTrue(frappe.db.has_writes)
+				replica.close()
+				frappe.db.sql("select name from tabUser where name='Administrator'")
+				self.assertFalse(replica._conn)
+		finally:
+			for key in ("read_from_replica", "replica_host"):
+				conf.pop(key, None)
+			close_replica_connections()
+			frappe.db.has_writes = False
+
+	def test_unreachable_replica(self):
+		from frappe.database.replica import route_reads_to_replica, close_replica_connections
+
+		conf = frappe.local.conf
+		conf.update(read_from_replica=1, replica_host="_test_replica_not_found")
+		frappe.db.has_writes = False
+
+		try:
+			# reads fall back to the primary
+			with route_reads_to_replica():
+				self.assertEqual(frappe.db.sql("select name from tabUser where name='Administrator'")[0][0],
+					"Administrator")
+				self.assertEqual(frappe.local.replica_host, "")
+		finally:
+			for key in ("read_from_replica", "replica_host"):
+				conf.pop(key, None)
+			close_replica_connections()
+
+	def test_connection_pool(self):
+		from frappe.database import pool
+
+		frappe.db.commit()
+		frappe.local.conf.db_connection_pool = 1
+		try:
+			frappe.db.close()
+			stats = pool.get_stats()
+			self.assertEqual(sum(stats.idle.values()), 1)
+
+			# reconnects from the pool
+			self.assertEqual(frappe.db.sql("select 1")[0][0], 1)
+			self.assertEqual(pool.get_stats().reused, stats.reused + 1)
+		finally:
+			frappe.local.conf.pop("db_connection_pool", None)
+			pool.close_all()
@@ -349,6 +349,24 @@ class TestReportview(unittest.TestCase):
 		self.assertTrue({'name': 'Prepared Report'} in res)
 		self.assertFalse({'name': 'Property Setter'} in res)
 
+	def test_iterate(self):
+		expected = DatabaseQuery('DocType').execute(fields=['name', 'module'],
+			order_by='modified desc, name desc', limit_page_length=None, as_list=True)
+
+		# keyset
+		query = DatabaseQuery('DocType')
+		batches = list(query.iterate(batch_size=7, fields=['name', 'module'], order_by='modified desc',
+			as_list=True))
+		self.assertTrue(all(len(batch) <= 7 for batch in batches))
+		self.assertEqual([row for batch in batches for row in batch], [tuple(row) for row in expected])
+		self.assertEqual(query.fields, ['name', 'module'])
+
+		# offset, ordered by a custom column
+		expected = DatabaseQuery('DocType').execute(fields=['name'], order_by='module asc, name asc',
+			limit_page_length=None)
+		batches = DatabaseQuery('DocType').iterate(batch_size=7, fields=['name'], order_by='module asc')
+		self.assertEqual([row for batch in batches for row in batch], expected)
+
 
 def create_event(subject="_Test Event", starts_on=None):
 	""" create a test event """
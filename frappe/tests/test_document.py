@@ -20,6 +20,29 @@ class TestDocument(unittest.TestCase):
 		self.assertTrue(isinstance(d.permissions, list))
 		self.assertTrue(filter(lambda d: d.fieldname=="email", d.fields))
 
+	def test_get_docs(self):
+		docs = frappe.get_docs("DocType", ["User", "ToDo", "_Test Does Not Exist"])
+		self.assertEqual([d.name for d in docs], ["User", "ToDo"])
+
+		for d in docs:
+			loaded = frappe.get_doc("DocType", d.name)
+			self.assertEqual([f.fieldname for f in d.fields], [f.fieldname for f in loaded.fields])
+			self.assertEqual(len(d.permissions), len(loaded.permissions))
+			self.assertFalse(d.is_new())
+
+	def test_load_children_of_differently_cased_parent(self):
+		if frappe.db.db_type == "postgres":
+			return
+
+		# MariaDB matches the parent regardless of case and trailing spaces
+		frappe.db.sql("""update `tabHas Role` set parent=%s where parent=%s""",
+			("TEST@EXAMPLE.COM ", "test@example.com"))
+		try:
+			self.assertTrue(frappe.get_doc("User", "test@example.com").roles)
+			self.assertTrue(frappe.get_docs("User", ["test@example.com"])[0].roles)
+		finally:
+			frappe.db.rollback()
+
 	def test_load_single(self):
 		d = frappe.get_doc("Website Settings", "Website Settings")
 		self.assertEqual(d.name, "Website Settings")
@@ -54,6 +77,57 @@ class TestDocument(unittest.TestCase):
 		self.assertEqual(frappe.db.get_value("Event", d.name, "subject"),
 			"test-doc-test-event 2")
 
+	def test_insert_with_many_children(self):
+		if frappe.db.exists("Note", "_Test Note Many Children"):
+			frappe.delete_doc("Note", "_Test Note Many Children")
+
+		d = frappe.get_doc({
+			"doctype": "Note",
+			"title": "_Test Note Many Children",
+			"seen_by": [{"user": "Administrator"} for i in range(30)]
+		}).insert()
+
+		self.assertEqual(frappe.db.count("Note Seen By", {"parent": d.name}), 30)
+		self.assertTrue(all(not c.is_new() for c in d.seen_by))
+		self.assertEqual(len(set(c.name for c in d.seen_by)), 30)
+		d.delete()
+
+	def test_update_child_table_changes(self):
+		if frappe.db.exists("Note", "_Test Note Child Table Sync"):
+			frappe.delete_doc("Note", "_Test Note Child Table Sync")
+
+		d = frappe.get_doc({
+			"doctype": "Note",
+			"title": "_Test Note Child Table Sync",
+			"seen_by": [{"user": "Administrator"}, {"user": "Guest"}, {"user": "Administrator"}]
+		}).insert()
+
+		unchanged, removed = d.seen_by[0].name, d.seen_by[2].name
+		frappe.db.set_value("Note Seen By", unchanged, "modified", "2000-01-01 00:00:00", update_modified=False)
+
+		d = frappe.get_doc("Note", d.name)
+		d.seen_by[1].user = "Administrator"
+		d.remove(d.seen_by[2])
+		d.append("seen_by", {"user": "Guest"})
+		d.save()
+
+		rows = frappe.get_all("Note Seen By", fields=["name", "user", "modified"],
+			filters={"parent": d.name}, order_by="idx asc")
+		self.assertEqual([r.user for r in rows], ["Administrator", "Administrator", "Guest"])
+		self.assertNotIn(removed, [r.name for r in rows])
+
+		# unchanged rows are not written
+		self.assertEqual(str(rows[0].modified), "2000-01-01 00:00:00")
+
+		# syncing again after save (as in `on_update`) only writes the new changes
+		d.remove(d.seen_by[0])
+		d.append("seen_by", {"user": "Guest"})
+		d.update_children()
+
+		rows = frappe.get_all("Note Seen By", fields=["user"], filters={"parent": d.name}, order_by="idx asc")
+		self.assertEqual([r.user for r in rows], ["Administrator", "Guest", "Guest"])
+		d.delete()
+
 	def test_update(self):
 		d = self.test_insert()
 		d.subject = "subject changed"
@@ -0,0 +1,49 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.utils import document_cache
+
+class TestDocumentCache(unittest.TestCase):
+	def setUp(self):
+		document_cache.clear()
+		document_cache.reset_stats()
+
+	def tearDown(self):
+		frappe.local.conf.pop("document_cache_max_memory", None)
+		document_cache.clear()
+
+	def test_get_cached_doc(self):
+		frappe.local.document_cache = {}
+		frappe.get_cached_doc("User", "Administrator")
+		self.assertTrue(document_cache.get_doc("User", "Administrator"))
+
+		stats = document_cache.get_stats()
+		self.assertEqual(stats.documents, 1)
+		self.assertEqual(stats.hits, 1)
+		self.assertEqual(stats.misses, 1)
+
+	def test_get_doc_is_not_cached(self):
+		frappe.get_doc("User", "Guest")
+		self.assertFalse(document_cache.get_doc("User", "Guest"))
+
+	def test_clear_document_cache(self):
+		frappe.get_cached_doc("User", "Administrator")
+		frappe.clear_document_cache("User", "Administrator")
+		self.assertFalse(document_cache.get_doc("User", "Administrator"))
+		self.assertEqual(document_cache.get_stats().memory, 0)
+
+	def test_eviction(self):
+		document_cache.set_doc("ToDo", "a", {"description": "a" * 1000})
+		document_cache.set_doc("ToDo", "b", {"description": "b" * 1000})
+		document_cache.get_doc("ToDo", "a")
+
+		# budget only fits one document, least recently used ("b") goes
+		frappe.local.conf.document_cache_max_memory = 1500
+		document_cache.set_doc("ToDo", "c", {"description": "c" * 10})
+
+		self.assertTrue(document_cache.get_doc("ToDo", "a"))
+		self.assertFalse(document_cache.get_doc("ToDo", "b"))
+		self.assertTrue(document_cache.get_stats().evictions >= 1)
+		self.assertTrue(document_cache.get_stats().memory <= 1500)
@@ -51,6 +51,50 @@ class TestEmail(unittest.TestCase):
 		self.assertEqual(len(queue_recipients), 2)
 		self.assertTrue('Unsubscribe' in frappe.safe_decode(frappe.flags.sent_mail))
 
+	def test_flush_leased_and_rate_limited(self):
+		from frappe.email.queue import flush, get_lease_key
+		self.test_email_queue()
+		name = frappe.db.get_value('Email Queue', {'status': 'Not Sent'})
+
+		# claimed by another flush job
+		frappe.cache().set_value(get_lease_key(name), 1)
+		flush(from_test=True)
+		self.assertEqual(frappe.db.get_value('Email Queue', name, 'status'), 'Not Sent')
+		frappe.cache().delete_value(get_lease_key(name))
+
+		# two recipients, one allowed per minute
+		frappe.local.conf.email_rate_limit = 1
+		try:
+			flush(from_test=True)
+		finally:
+			frappe.local.conf.pop('email_rate_limit')
+		self.assertEqual(frappe.db.get_value('Email Queue', name, 'status'), 'Not Sent')
+
+		flush(from_test=True)
+		self.assertEqual(frappe.db.get_value('Email Queue', name, 'status'), 'Sent')
+
+	def test_flush_recovers_sending(self):
+		from frappe.email.queue import flush
+		from frappe.utils import add_to_date, now_datetime
+		self.test_email_queue()
+		name = frappe.db.get_value('Email Queue', {'status': 'Not Sent'})
+
+		# left in 'Sending' by a job that was killed, after sending to one recipient
+		frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent'
+			where parent=%s and recipient='test@example.com'""", name)
+		frappe.db.sql("""update `tabEmail Queue` set status='Sending', modified=%s where name=%s""",
+			(now_datetime(), name))
+		flush(from_test=True)
+		self.assertEqual(frappe.db.get_value('Email Queue', name, 'status'), 'Sending')
+
+		# sent to the other recipient once the lease has expired
+		frappe.db.sql("""update `tabEmail Queue` set modified=%s where name=%s""",
+			(add_to_date(now_datetime(), hours=-1), name))
+		frappe.flags.sent_mail = None
+		flush(from_test=True)
+		self.assertEqual(frappe.db.get_value('Email Queue', name, 'status'), 'Sent')
+		self.assertIn('test1@example.com', frappe.safe_decode(frappe.flags.sent_mail))
+
 	def test_cc_header(self):
 		#test if sending with cc's makes it into header
 		frappe.sendmail(recipients=['test@example.com'],
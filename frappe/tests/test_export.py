@@ -0,0 +1,21 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import os
+import unittest
+import frappe
+
+from frappe.utils.export import ExportWriter
+
+class TestExportWriter(unittest.TestCase):
+	def test_file_removed_on_error(self):
+		for file_type in ("CSV", "Excel"):
+			try:
+				with ExportWriter(file_type, "Test") as writer:
+					writer.writerow(["a", 1])
+					raise frappe.ValidationError
+			except frappe.ValidationError:
+				pass
+
+			self.assertFalse(os.path.exists(writer.path))
@@ -94,6 +94,57 @@ class TestGlobalSearch(unittest.TestCase):
 		results = global_search.search(test_subject)
 		self.assertEqual(len(results), 0)
 
+	def test_sync_queue_in_batches(self):
+		frappe.db.sql('DELETE FROM `__global_search`')
+		frappe.cache().delete_value('global_search_queue')
+
+		value = dict(doctype='Event', published=0, title='', route='')
+		for i in range(3):
+			global_search.sync_value_in_queue(dict(value, name='_Test Batch 1', content='version {0}'.format(i)))
+		global_search.sync_value_in_queue(dict(value, name='_Test Batch 2', content='deleted later'))
+		global_search.sync_value_in_queue(dict(doctype='Event', name='_Test Batch 2', deleted=1))
+
+		global_search.sync_global_search()
+		self.assertEqual(frappe.cache().llen('global_search_queue'), 0)
+
+		# the last value of each document wins
+		rows = frappe.db.sql('SELECT `name`, `content` FROM `__global_search` WHERE `doctype`=%s',
+			'Event', as_dict=True)
+		self.assertEqual([(r.name, r.content) for r in rows], [('_Test Batch 1', 'version 2')])
+
+	def test_ranking_and_pagination(self):
+		self.insert_test_events()
+		results = global_search.search('extinction', limit=1)
+		self.assertEqual(len(results), 1)
+		self.assertTrue(results[0].relevance > 0)
+
+		after = [results[0].relevance, results[0].doctype, results[0].name]
+		next_page = global_search.search('extinction', limit=10, after=frappe.as_json(after))
+		self.assertEqual(len(next_page), 1)
+		self.assertNotEqual(next_page[0].name, results[0].name)
+
+	def test_search_index(self):
+		frappe.local.conf.global_search_engine = 'index'
+		frappe.local.conf.global_search_index_path = frappe.get_site_path('_test_global_search_index.sqlite')
+		try:
+			self.insert_test_events()
+			global_search.rebuild_search_index()
+
+			results = global_search.search('awakens & alien')
+			self.assertEqual(len(results), 1)
+			self.assertTrue('After Mulder awakens' in results[0].content)
+
+			# short words only match whole words
+			self.assertEqual(global_search.search('aw'), [])
+			self.assertEqual(len(global_search.search('awa')), len(global_search.search('awakens')))
+
+			frappe.delete_doc('Event', results[0].name)
+			self.assertEqual(global_search.search('awakens'), [])
+		finally:
+			global_search.get_search_index().clear()
+			frappe.local.conf.pop('global_search_engine')
+			frappe.local.conf.pop('global_search_index_path')
+
 	def test_insert_child_table(self):
 		frappe.db.sql('delete from tabEvent')
 		phrases = ['Hydrus is a small constellation in the deep southern sky. ',
@@ -94,3 +94,34 @@ class TestNaming(unittest.TestCase):
 
 		self.assertEqual(count.get('current'), 2)
 		frappe.db.sql("""delete from `tabSeries` where name = %s""", series)
+
+	def test_series_block(self):
+		from frappe.model import series_block
+
+		series = '_TEST-BLOCK-'
+		frappe.db.sql("""delete from `tabSeries` where name = %s""", series)
+		frappe.cache().delete_value(['naming_series_block::' + series, 'naming_series_blocks::' + series])
+		# blocks are reserved on a separate connection
+		frappe.db.commit()
+
+		frappe.local.conf.naming_series_blocks = {series: 10}
+		try:
+			self.assertEqual([getseries(series, 3) for i in range(12)], ['{0:03d}'.format(i) for i in range(1, 13)])
+			count = frappe.db.sql("""SELECT current from `tabSeries` where name = %s""", series)[0][0]
+			self.assertEqual(count, 20)
+
+			frappe.local.conf.naming_series_blocks = {series: {'size': 5, 'ordered': 1}}
+			self.assertEqual([getseries(series, 3) for i in range(6)], ['{0:03d}'.format(i) for i in range(21, 27)])
+			self.assertTrue(series_block.get_stats()[series].blocks >= 4)
+
+			# after a write (here holding the row lock of the series), blocks are not
+			# reserved on the other connection, the number is taken in this transaction
+			frappe.local.conf.naming_series_blocks = {series: 10}
+			series_block._blocks.clear()
+			frappe.db.sql("""UPDATE `tabSeries` SET `current` = `current` WHERE `name` = %s""", series)
+			self.assertEqual(getseries(series, 3), '031')
+		finally:
+			frappe.local.conf.pop('naming_series_blocks')
+			series_block._blocks.clear()
+			frappe.db.sql("""delete from `tabSeries` where name = %s""", series)
+			frappe.db.commit()
@@ -0,0 +1,88 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest, time
+import frappe.defaults
+from six.moves import cPickle as pickle
+from frappe.utils.process_cache import ProcessCache, process_cache
+
+class TestProcessCache(unittest.TestCase):
+	def tearDown(self):
+		frappe.local.conf.pop("process_cache", None)
+		frappe.local.conf.pop("process_cache_max_size", None)
+
+	def test_lru_eviction(self):
+		cache = ProcessCache()
+		a, b, c = (pickle.dumps(value * 30) for value in ("a", "b", "c"))
+		frappe.local.conf.process_cache_max_size = len(a) * 2 + 1
+
+		cache.set("a", None, a, cache.generation)
+		cache.set("b", None, b, cache.generation)
+		cache.get("a")
+		cache.set("c", None, c, cache.generation)
+
+		self.assertEqual(cache.get("a"), (True, "a" * 30))
+		self.assertEqual(cache.get("b"), (False, None))
+		self.assertEqual(cache.size, len(a) + len(c))
+
+	def test_invalidate(self):
+		cache = ProcessCache()
+		cache.set("meta", "User", pickle.dumps(1), cache.generation)
+		cache.set("meta", "ToDo", pickle.dumps(2), cache.generation)
+
+		cache.invalidate("meta", "User")
+		self.assertEqual(cache.get("meta", "User"), (False, None))
+		self.assertEqual(cache.get("meta", "ToDo"), (True, 2))
+
+		cache.invalidate("meta")
+		self.assertEqual(cache.get("meta", "ToDo"), (False, None))
+
+		# value read before an invalidation is not cached
+		generation = cache.generation
+		cache.invalidate("meta", "User")
+		cache.set("meta", "User", pickle.dumps(1), generation)
+		self.assertEqual(cache.get("meta", "User"), (False, None))
+
+	def start_listener(self):
+		frappe.local.conf.process_cache = 1
+		frappe.cache().hget("meta", "User")
+		for i in range(50):
+			if process_cache.listening:
+				break
+			time.sleep(0.1)
+
+		self.assertTrue(process_cache.listening)
+
+	def test_redis_wrapper(self):
+		self.start_listener()
+
+		frappe.cache().hset("meta", "_Test Process Cache", "value")
+		# let the listener receive our own invalidation
+		time.sleep(0.5)
+		frappe.local.cache = {}
+		self.assertEqual(frappe.cache().hget("meta", "_Test Process Cache"), "value")
+		self.assertTrue(process_cache.get(frappe.cache().make_key("meta"), "_Test Process Cache")[0])
+
+		frappe.cache().hdel("meta", "_Test Process Cache")
+		self.assertFalse(process_cache.get(frappe.cache().make_key("meta"), "_Test Process Cache")[0])
+
+	def test_defaults_of_users(self):
+		self.start_listener()
+		frappe.defaults.set_user_default("_test_process_cache", "value", "Administrator")
+		user = frappe.session.user
+		try:
+			for i in range(2):
+				# new requests, the second one reads the defaults from the process cache
+				frappe.local.cache = {}
+				frappe.set_user("Administrator")
+				self.assertEqual(frappe.defaults.get_defaults().get("_test_process_cache"), "value")
+
+				frappe.local.cache = {}
+				frappe.set_user("test@example.com")
+				defaults = frappe.defaults.get_defaults()
+				self.assertEqual(defaults.owner, "test@example.com")
+				self.assertFalse(defaults.get("_test_process_cache"))
+		finally:
+			frappe.set_user(user)
+			frappe.defaults.clear_user_default("_test_process_cache", "Administrator")
@@ -42,3 +42,37 @@ class TestQueryReport(unittest.TestCase):
 
 		for row in xlsx_data:
 			self.assertEqual(type(row), list)
+
+	def test_report_cache(self):
+		from frappe.desk.query_report import run
+		from frappe.desk.report_cache import invalidate
+
+		report_name = 'Permitted Documents For User'
+		filters = {'user': 'Administrator', 'doctype': 'DocType'}
+		frappe.local.conf.report_cache = {report_name: 60}
+		try:
+			invalidate('User')
+			self.assertFalse(run(report_name, filters)['cached'])
+
+			result = run(report_name, filters)
+			self.assertTrue(result['cached'])
+			self.assertTrue('User' in [d[0] for d in result['result']])
+
+			# different filters
+			self.assertFalse(run(report_name, dict(filters, doctype='Role'))['cached'])
+
+			# documents of ref_doctype changed
+			frappe.get_doc('User', 'Administrator').save()
+			self.assertFalse(run(report_name, filters)['cached'])
+		finally:
+			frappe.local.conf.pop('report_cache')
+
+	def test_existing_link_values(self):
+		from frappe.desk.query_report import get_existing_values
+
+		data = [["Administrator", "Guest"], ["_Test Missing User", "Guest"], []]
+		linked_doctypes = {"User": 0, "Role": 1}
+		match_filters = {"User": [{"User": ["Guest"]}]}
+
+		self.assertEqual(get_existing_values(linked_doctypes, match_filters, data),
+			{"User": set(["Administrator"])})
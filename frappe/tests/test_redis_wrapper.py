@@ -0,0 +1,41 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.utils import redis_wrapper
+
+class TestRedisWrapper(unittest.TestCase):
+	def tearDown(self):
+		redis_wrapper.DELETE_BATCH_SIZE = 1000
+
+	def test_delete_keys(self):
+		cache = frappe.cache()
+		for i in range(25):
+			cache.set_value("_test_scan:{0}".format(i), i)
+		cache.set_value("_test_scan_other", 1)
+
+		self.assertEqual(len(cache.get_keys("_test_scan:")), 25)
+
+		# multiple batches
+		redis_wrapper.DELETE_BATCH_SIZE = 10
+		cache.delete_keys("_test_scan:")
+
+		self.assertEqual(cache.get_keys("_test_scan:"), [])
+		self.assertEqual(cache.get_value("_test_scan:1"), None)
+		self.assertEqual(cache.get_value("_test_scan_other"), 1)
+		cache.delete_value("_test_scan_other")
+
+	def test_delete_user_keys(self):
+		cache = frappe.cache()
+		cache.set_value("_test_key", 1, user="test@example.com")
+		cache.set_value("_test_key", 2, user="test@example.com.au")
+		cache.set_value("_test_expiring_key", 3, user="test@example.com", expires_in_sec=600)
+
+		cache.delete_user_keys("test@example.com")
+		frappe.local.cache = {}
+
+		self.assertEqual(cache.get_value("_test_key", user="test@example.com"), None)
+		self.assertEqual(cache.get_value("_test_expiring_key", user="test@example.com", expires=True), None)
+		self.assertEqual(cache.get_value("_test_key", user="test@example.com.au"), 2)
+		cache.delete_user_keys("test@example.com.au")
@@ -5,7 +5,8 @@ from dateutil.relativedelta import relativedelta
 from frappe.utils.scheduler import (enqueue_applicable_events, restrict_scheduler_events_if_dormant,
 	get_enabled_scheduler_events, disable_scheduler_on_expiry)
 from frappe import _dict
-from frappe.utils.background_jobs import enqueue
+from frappe.utils.background_jobs import (enqueue, add_to_job_index, is_job_queued,
+	get_job_index_key, get_redis_conn)
 from frappe.utils import now_datetime, today, add_days, add_to_date
 from frappe.limits import update_limits, clear_limit
 
@@ -117,5 +118,22 @@ class TestScheduler(TestCase):
 
 		self.assertTrue(job.is_failed)
 
+	def test_job_index(self):
+		site = frappe.local.site
+		add_to_job_index(_dict(id='_test_job_index'), 'short', {
+			'site': site,
+			'method': 'frappe.utils.background_jobs.test_job',
+			'job_name': '_test_job_index',
+			'event': None,
+			'is_async': True
+		})
+		self.assertTrue(get_redis_conn().hexists(get_job_index_key(site), '_test_job_index'))
+
+		# no such job in the queue, removed from the index when checked
+		self.assertFalse(is_job_queued('_test_job_index', key='job_name'))
+		self.assertFalse(get_redis_conn().hexists(get_job_index_key(site), '_test_job_index'))
+		self.assertFalse(get_redis_conn().smembers(get_job_index_key(site, 'method',
+			'frappe.utils.background_jobs.test_job')))
+
 	def tearDown(self):
 		frappe.flags.ran_schedulers = []
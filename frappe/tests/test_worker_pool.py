@@ -0,0 +1,82 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+from __future__ import unicode_literals
+
+import os
+import time
+import signal
+import tempfile
+import unittest
+
+import frappe
+from frappe.utils import worker_pool, background_jobs
+
+def failing_worker(spawn_log, spawns_before_stop):
+	'''Fails, until it has been spawned `spawns_before_stop` times, then stops the pool'''
+	def run_worker(*args):
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		with open(spawn_log, 'a') as f:
+			f.write('{0}\n'.format(os.getpid()))
+
+		with open(spawn_log) as f:
+			if len(f.readlines()) < spawns_before_stop:
+				raise Exception('Worker failed')
+
+		os.kill(os.getppid(), signal.SIGTERM)
+		time.sleep(30)
+
+	return run_worker
+
+class TestWorkerPool(unittest.TestCase):
+	def test_site_kept_between_jobs(self):
+		site = frappe.local.site
+		background_jobs.keep_site_warm = True
+		try:
+			worker_pool.init_site(site)
+			db = frappe.local.db
+			frappe.flags.warm_job_ran = True
+			frappe.local.conf.warm_job_conf = 1
+
+			# the connection is kept, per-job state and config are reset
+			worker_pool.end_job()
+			worker_pool.init_site(site)
+			self.assertIs(frappe.local.db, db)
+			self.assertFalse(frappe.flags.warm_job_ran)
+			self.assertFalse(frappe.local.conf.warm_job_conf)
+			self.assertEqual(frappe.session.user, 'Administrator')
+		finally:
+			background_jobs.keep_site_warm = False
+			worker_pool._warm_site.clear()
+			frappe.destroy()
+			frappe.init(site=site)
+			frappe.connect()
+
+	def test_respawn_delay(self):
+		self.assertEqual(worker_pool.get_respawn_delay(1), worker_pool.RESPAWN_DELAY)
+		self.assertEqual(worker_pool.get_respawn_delay(3), worker_pool.RESPAWN_DELAY * 4)
+		self.assertEqual(worker_pool.get_respawn_delay(100), worker_pool.RESPAWN_MAX_DELAY)
+
+	def test_respawn_and_shutdown(self):
+		fd, spawn_log = tempfile.mkstemp()
+		os.close(fd)
+
+		run_worker = worker_pool.run_worker
+		handlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+		worker_pool.run_worker = failing_worker(spawn_log, 3)
+		try:
+			started = time.time()
+			worker_pool.start_worker_pool(None, ['default'], 1)
+
+			with open(spawn_log) as f:
+				spawned = f.read().split()
+
+			# failed processes are replaced with a delay, and the pool stops on SIGTERM
+			self.assertEqual(len(set(spawned)), 3)
+			self.assertTrue(time.time() - started >= worker_pool.get_respawn_delay(1)
+				+ worker_pool.get_respawn_delay(2))
+		finally:
+			worker_pool.run_worker = run_worker
+			signal.signal(signal.SIGTERM, handlers[0])
+			signal.signal(signal.SIGINT, handlers[1])
+			os.remove(spawn_log)
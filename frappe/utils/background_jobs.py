@@ -1,6 +1,8 @@
 from __future__ import unicode_literals, print_function
 import redis
-from rq import Connection, Queue, Worker
+import json
+from rq import Connection, Queue, Worker, get_current_job
+from rq.job import Job, JobStatus
 from rq.logutils import setup_loghandlers
 from frappe.utils import cstr
 from collections import defaultdict
@@ -21,6 +23,16 @@ queue_timeout = {
 
 redis_connection = None
 
+# jobs waiting in a queue are indexed per site, so that checking if a method is
+# already queued does not need to load every job in every queue
+job_index_fields = ('method', 'job_name', 'event', 'queue')
+job_index_lookup_fields = ('method', 'job_name')
+job_index_sites_key = 'frappe:job_index:sites'
+
+# set in pre-forked workers, that keep the site initialised between jobs (see
+# `frappe.utils.worker_pool`)
+keep_site_warm = False
+
 def enqueue(method, queue='default', timeout=None, event=None,
 	is_async=True, job_name=None, now=False, enqueue_after_commit=False, **kwargs):
 	'''
@@ -65,8 +77,10 @@ def enqueue(method, queue='default', timeout=None, event=None,
 		})
 		return frappe.flags.enqueue_after_commit
 	else:
-		return q.enqueue_call(execute_job, timeout=timeout,
+		job = q.enqueue_call(execute_job, timeout=timeout,
 			kwargs=queue_args)
+		add_to_job_index(job, queue, queue_args)
+		return job
 
 def enqueue_doc(doctype, name=None, method=None, queue='default', timeout=300,
 	now=False, **kwargs):
@@ -82,10 +96,19 @@ def execute_job(site, method, event, job_name, kwargs, user=None, is_async=True,
 	from frappe.utils.scheduler import log
 
 	if is_async:
-		frappe.connect(site)
+		if keep_site_warm:
+			from frappe.utils.worker_pool import init_site
+			init_site(site)
+		else:
+			frappe.connect(site)
 		if os.environ.get('CI'):
 			frappe.flags.in_test = True
 
+		job = get_current_job()
+		if job:
+			# no longer waiting in the queue
+			remove_from_job_index(site, [job.id])
+
 		if user:
 			frappe.set_user(user)
 
@@ -128,22 +151,40 @@ def execute_job(site, method, event, job_name, kwargs, user=None, is_async=True,
 
 	finally:
 		if is_async:
-			frappe.destroy()
+			if keep_site_warm:
+				from frappe.utils.worker_pool import end_job
+				end_job()
+			else:
+				frappe.destroy()
+
+def start_worker(queue=None, quiet = False, processes=None, max_jobs=None, max_memory=None):
+	'''Wrapper to start rq worker. Connects to redis and monitors these queues.
 
-def start_worker(queue=None, quiet = False):
-	'''Wrapper to start rq worker. Connects to redis and monitors these queues.'''
+	If `processes` is set, starts that many pre-forked workers that run jobs without
+	forking (see `frappe.utils.worker_pool`).'''
 	with frappe.init_site():
 		# empty init is required to get redis_queue from common_site_config.json
 		redis_connection = get_redis_conn()
+		conf = frappe.local.conf
+		processes = processes or conf.worker_processes
+		max_jobs = max_jobs or conf.worker_max_jobs
+		max_memory = max_memory or conf.worker_max_memory
 
 	if os.environ.get('CI'):
 		setup_loghandlers('ERROR')
 
+	queues = get_queue_list(queue)
+	logging_level = "INFO"
+	if quiet:
+		logging_level = "WARNING"
+
+	if processes:
+		from frappe.utils.worker_pool import start_worker_pool
+		start_worker_pool(redis_connection, queues, int(processes), max_jobs=max_jobs,
+			max_memory=max_memory, logging_level=logging_level)
+		return
+
 	with Connection(redis_connection):
-		queues = get_queue_list(queue)
-		logging_level = "INFO"
-		if quiet:
-			logging_level = "WARNING"
 		Worker(queues, name=get_worker_name(queue)).work(logging_level = logging_level)
 
 def get_worker_name(queue):
@@ -161,6 +202,25 @@ def get_worker_name(queue):
 
 def get_jobs(site=None, queue=None, key='method'):
 	'''Gets jobs per queue or per site or both'''
+	if key not in job_index_fields:
+		return get_jobs_from_queues(site, queue, key)
+
+	queues = get_queue_list(queue)
+	if site:
+		sites = [site]
+	else:
+		sites = [frappe.safe_decode(s) for s in get_redis_conn().smembers(job_index_sites_key)]
+
+	jobs_per_site = defaultdict(list)
+	for site in sites:
+		for job in get_queued_jobs(site):
+			if job['queue'] in queues:
+				jobs_per_site[site].append(job[key])
+
+	return jobs_per_site
+
+def get_jobs_from_queues(site=None, queue=None, key='method'):
+	'''Gets jobs per queue or per site or both, by loading every job in the queues'''
 	jobs_per_site = defaultdict(list)
 	for queue in get_queue_list(queue):
 		q = get_queue(queue)
@@ -180,6 +240,109 @@ def get_jobs(site=None, queue=None, key='method'):
 
 	return jobs_per_site
 
+def is_job_queued(value, key='method', site=None):
+	'''Returns True if a job with this method (or job name) is waiting in a queue'''
+	site = site or frappe.local.site
+	if key not in job_index_lookup_fields:
+		return value in get_jobs(site=site, key=key)[site]
+
+	lookup_key = get_job_index_key(site, key, value)
+	job_ids = [frappe.safe_decode(job_id) for job_id in get_redis_conn().smembers(lookup_key)]
+	queued = verify_queued_jobs(site, job_ids)
+
+	if len(queued) < len(job_ids):
+		# ids without info are not removed from the set by `remove_from_job_index`
+		queued_ids = set(job['id'] for job in queued)
+		get_redis_conn().srem(lookup_key, *[job_id for job_id in job_ids if job_id not in queued_ids])
+
+	return bool(queued)
+
+def get_queued_jobs(site, page_length=1000):
+	'''Yields id, method, job name, event and queue of the jobs of the site waiting in a queue,
+	reading the index `page_length` jobs at a time'''
+	page = []
+	for job_id, info in get_redis_conn().hscan_iter(get_job_index_key(site), count=page_length):
+		page.append((frappe.safe_decode(job_id), info))
+		if len(page) >= page_length:
+			for job in verify_queued_jobs(site, page):
+				yield job
+			page = []
+
+	for job in verify_queued_jobs(site, page):
+		yield job
+
+def verify_queued_jobs(site, jobs):
+	'''Returns the info of indexed jobs that are still waiting in a queue, and removes the
+	others (finished, failed or deleted) from the index. `jobs` is a list of job ids or
+	(job id, info) tuples'''
+	if not jobs:
+		return []
+
+	if not isinstance(jobs[0], tuple):
+		infos = get_redis_conn().hmget(get_job_index_key(site), jobs)
+		jobs = list(zip(jobs, infos))
+
+	pipe = get_redis_conn().pipeline()
+	for job_id, info in jobs:
+		pipe.hget(Job.key_for(job_id), 'status')
+
+	queued, stale = [], []
+	for (job_id, info), status in zip(jobs, pipe.execute()):
+		if info and frappe.safe_decode(status) == JobStatus.QUEUED:
+			info = json.loads(frappe.safe_decode(info))
+			info['id'] = job_id
+			queued.append(info)
+		else:
+			stale.append(job_id)
+
+	if stale:
+		remove_from_job_index(site, stale)
+
+	return queued
+
+def get_job_index_key(site, key=None, value=None):
+	'''Returns the key of the hash of job id -> info of the queued jobs of a site, or of the
+	set of ids of the queued jobs with the given method or job name'''
+	if key:
+		return 'frappe:job_index:{0}:{1}:{2}'.format(site, key, value)
+
+	return 'frappe:job_index:{0}'.format(site)
+
+def add_to_job_index(job, queue, queue_args):
+	if not queue_args.get('is_async'):
+		# already executed
+		return
+
+	site = queue_args['site']
+	method = queue_args['method']
+	info = {
+		'method': method if isinstance(method, string_types) else
+			'{0}.{1}'.format(method.__module__, method.__name__),
+		'job_name': queue_args['job_name'],
+		'event': queue_args['event'],
+		'queue': queue
+	}
+
+	pipe = get_redis_conn().pipeline()
+	pipe.hset(get_job_index_key(site), job.id, json.dumps(info))
+	for key in job_index_lookup_fields:
+		pipe.sadd(get_job_index_key(site, key, info[key]), job.id)
+	pipe.sadd(job_index_sites_key, site)
+	pipe.execute()
+
+def remove_from_job_index(site, job_ids):
+	conn = get_redis_conn()
+	infos = conn.hmget(get_job_index_key(site), job_ids)
+
+	pipe = conn.pipeline()
+	pipe.hdel(get_job_index_key(site), *job_ids)
+	for job_id, info in zip(job_ids, infos):
+		if info:
+			info = json.loads(frappe.safe_decode(info))
+			for key in job_index_lookup_fields:
+				pipe.srem(get_job_index_key(site, key, info[key]), job_id)
+	pipe.execute()
+
 def get_queue_list(queue_list=None):
 	'''Defines possible queues. Also wraps a given queue in a list after validating.'''
 	default_queue_list = list(queue_timeout)
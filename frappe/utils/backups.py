@@ -8,12 +8,21 @@ from __future__ import unicode_literals, print_function
 #Imports
 from frappe import _
 import os, frappe
+import json
+import time
+import shutil
+from subprocess import Popen
 from datetime import datetime
-from frappe.utils import cstr, get_url, now_datetime
+from frappe.utils import cstr, cint, get_url, now_datetime
+from six.moves import shlex_quote
 
 #Global constants
 verbose = 0
 from frappe import conf
+
+# the last full files backup: the archives and the time it was started, incremental files
+# backups include files modified since then
+LAST_FILES_BACKUP = ".last_files_backup"
 #-------------------------------------------------------------------------------
 class BackupGenerator:
 	"""
@@ -32,10 +41,13 @@ class BackupGenerator:
 		self.backup_path_db = backup_path_db
 		self.backup_path_private_files = backup_path_private_files
 
-	def get_backup(self, older_than=24, ignore_files=False, force=False):
+	def get_backup(self, older_than=24, ignore_files=False, force=False, incremental_files=False):
 		"""
 			Takes a new dump if existing file is old
 			and sends the link to the file as email
+
+			With `incremental_files`, file backups only include files modified
+			since the last full files backup
 		"""
 		#Check if file exists and is less than a day old
 		#If not Take Dump
@@ -44,28 +56,30 @@ class BackupGenerator:
 		else:
 			last_db, last_file, last_private_file = False, False, False
 
+		incremental_since = get_last_files_backup().time if incremental_files and not ignore_files else None
 		if not (self.backup_path_files and self.backup_path_db and self.backup_path_private_files):
-			self.set_backup_file_name()
+			self.set_backup_file_name(incremental=bool(incremental_since))
 
 		if not (last_db and last_file and last_private_file):
 			self.take_dump()
 			if not ignore_files:
-				self.zip_files()
+				self.zip_files(since=incremental_since)
 
 		else:
 			self.backup_path_files = last_file
 			self.backup_path_db = last_db
 			self.backup_path_private_files = last_private_file
 
-	def set_backup_file_name(self):
+	def set_backup_file_name(self, incremental=False):
 		todays_date = now_datetime().strftime('%Y%m%d_%H%M%S')
 		site = frappe.local.site or frappe.generate_hash(length=8)
 		site = site.replace('.', '_')
+		suffix = "-incremental" if incremental else ""
 
 		#Generate a random name using today's date and a 8 digit random number
 		for_db = todays_date + "-" + site + "-database.sql"
-		for_public_files = todays_date + "-" + site + "-files.tar"
-		for_private_files = todays_date + "-" + site + "-private-files.tar"
+		for_public_files = todays_date + "-" + site + "-files" + suffix + ".tar"
+		for_private_files = todays_date + "-" + site + "-private-files" + suffix + ".tar"
 		backup_path = get_backup_path()
 
 		if not self.backup_path_db:
@@ -94,16 +108,31 @@ class BackupGenerator:
 
 		return (backup_path_db, backup_path_files, backup_path_private_files)
 
-	def zip_files(self):
+	def zip_files(self, since=None):
+		"""Archive public and private files at the same time. If `since` (a timestamp), only
+		files modified since then are included, else this is the new full files backup"""
+		started = int(time.time())
+		processes = []
 		for folder in ("public", "private"):
 			files_path = frappe.get_site_path(folder, "files")
 			backup_path = self.backup_path_files if folder=="public" else self.backup_path_private_files
 
 			cmd_string = """tar -cf %s %s""" % (backup_path, files_path)
-			err, out = frappe.utils.execute_in_shell(cmd_string)
+			if since:
+				cmd_string += " --newer-mtime=@%s" % since
 
+			processes.append((Popen(cmd_string, shell=True), backup_path))
+
+		failed = [backup_path for process, backup_path in processes if process.wait() != 0]
+		if failed:
+			frappe.throw(_("Backup of files failed: {0}").format(", ".join(failed)))
+
+		for process, backup_path in processes:
 			print('Backed up files', os.path.abspath(backup_path))
 
+		if not since:
+			set_last_files_backup(started, [self.backup_path_files, self.backup_path_private_files])
+
 	def take_dump(self):
 		import frappe.utils
 
@@ -111,14 +140,45 @@ class BackupGenerator:
 		args = dict([item[0], frappe.utils.esc(item[1], '$ ')]
 			for item in self.__dict__.copy().items())
 
-		cmd_string = """mysqldump --single-transaction --quick --lock-tables=false -u %(user)s -p%(password)s %(db_name)s -h %(db_host)s > %(backup_path_db)s """ % args
-		err, out = frappe.utils.execute_in_shell(cmd_string)
+		processes = cint(conf.backup_dump_processes)
+		if processes > 1:
+			self.take_parallel_dump(args, processes)
 
-		cmd_string = 'gzip %(backup_path_db)s '% args
-		err, out = frappe.utils.execute_in_shell(cmd_string)
+		else:
+			# compressed while dumping, without an uncompressed copy on disk
+			cmd_string = """mysqldump --single-transaction --quick --lock-tables=false -u %(user)s -p%(password)s %(db_name)s -h %(db_host)s | gzip > %(backup_path_db)s.gz """ % args
+			err, out = frappe.utils.execute_in_shell(cmd_string)
 
 		self.backup_path_db = "{0}.gz".format(self.backup_path_db)
 
+	def take_parallel_dump(self, args, processes):
+		"""Dump groups of tables of about the same size at the same time, each compressed
+		into a part, and join the parts (a gzip file can have many members). Tables of
+		different groups are not dumped from the same snapshot."""
+		parts = []
+		running = []
+		for i, tables in enumerate(get_table_groups(self.db_name, processes)):
+			part = "{0}.gz.{1}".format(self.backup_path_db, i)
+			cmd_string = """mysqldump --single-transaction --quick --lock-tables=false -u %(user)s -p%(password)s -h %(db_host)s %(db_name)s """ % args
+			cmd_string += " ".join(shlex_quote(table) for table in tables)
+			cmd_string += " | gzip > {0}".format(part)
+
+			parts.append(part)
+			# fail if mysqldump fails, not only gzip
+			running.append(Popen("set -o pipefail; " + cmd_string, shell=True, executable="/bin/bash"))
+
+		if [process.wait() for process in running] != [0] * len(running):
+			for part in parts:
+				if os.path.exists(part):
+					os.remove(part)
+			frappe.throw(_("Database backup failed"))
+
+		with open("{0}.gz".format(self.backup_path_db), "wb") as dump:
+			for part in parts:
+				with open(part, "rb") as f:
+					shutil.copyfileobj(f, dump, 1024 * 1024)
+				os.remove(part)
+
 	def send_email(self):
 		"""
 			Sends the link to backup file located at erpnext/backups
@@ -163,31 +223,70 @@ def get_backup():
 	recipient_list = odb.send_email()
 	frappe.msgprint(_("Download link for your backup will be emailed on the following email address: {0}").format(', '.join(recipient_list)))
 
-def scheduled_backup(older_than=6, ignore_files=False, backup_path_db=None, backup_path_files=None, backup_path_private_files=None, force=False):
+def scheduled_backup(older_than=6, ignore_files=False, backup_path_db=None, backup_path_files=None, backup_path_private_files=None, force=False, incremental_files=False):
 	"""this function is called from scheduler
 		deletes backups older than 7 days
 		takes backup"""
-	odb = new_backup(older_than, ignore_files, backup_path_db=backup_path_db, backup_path_files=backup_path_files, force=force)
+	odb = new_backup(older_than, ignore_files, backup_path_db=backup_path_db, backup_path_files=backup_path_files, force=force, incremental_files=incremental_files)
 	return odb
 
-def new_backup(older_than=6, ignore_files=False, backup_path_db=None, backup_path_files=None, backup_path_private_files=None, force=False):
+def new_backup(older_than=6, ignore_files=False, backup_path_db=None, backup_path_files=None, backup_path_private_files=None, force=False, incremental_files=False):
 	delete_temp_backups(older_than = frappe.conf.keep_backups_for_hours or 24)
 	odb = BackupGenerator(frappe.conf.db_name, frappe.conf.db_name,\
 						  frappe.conf.db_password,
 						  backup_path_db=backup_path_db, backup_path_files=backup_path_files,
 						  backup_path_private_files=backup_path_private_files,
 						  db_host = frappe.db.host)
-	odb.get_backup(older_than, ignore_files, force=force)
+	odb.get_backup(older_than, ignore_files, force=force, incremental_files=incremental_files)
 	return odb
 
+def get_table_groups(db_name, count):
+	"""Returns tables of the database in up to `count` groups of about the same size"""
+	groups = [[0, []] for i in range(count)]
+	for table, size in frappe.db.sql("""select table_name, coalesce(data_length, 0) + coalesce(index_length, 0)
+		from information_schema.tables where table_schema = %s and table_type = 'BASE TABLE'
+		order by 2 desc""", db_name):
+		group = min(groups, key=lambda g: g[0])
+		group[0] += size
+		group[1].append(table)
+
+	return [tables for size, tables in groups if tables]
+
+def get_last_files_backup():
+	"""Returns `time` and `archives` of the last full files backup, time is None if there is
+	none or its archives were deleted"""
+	state_path = os.path.join(get_backup_path(), LAST_FILES_BACKUP)
+	state = frappe._dict(time=None, archives=[])
+	if os.path.exists(state_path):
+		with open(state_path) as f:
+			try:
+				state.update(json.loads(f.read()))
+			except ValueError:
+				# written before full backups were recorded
+				return state
+
+	if not all(os.path.exists(os.path.join(get_backup_path(), name)) for name in state.archives):
+		state.time = None
+
+	return state
+
+def set_last_files_backup(started, archives):
+	with open(os.path.join(get_backup_path(), LAST_FILES_BACKUP), "w") as f:
+		f.write(json.dumps({"time": started, "archives": [os.path.basename(a) for a in archives]}))
+
 def delete_temp_backups(older_than=24):
 	"""
-		Cleans up the backup_link_path directory by deleting files older than 24 hours
+		Cleans up the backup_link_path directory by deleting files older than 24 hours.
+		Archives of the last full files backup are kept, incremental backups need them.
 	"""
 	backup_path = get_backup_path()
 	if os.path.exists(backup_path):
 		file_list = os.listdir(get_backup_path())
+		keep = [LAST_FILES_BACKUP] + get_last_files_backup().archives
 		for this_file in file_list:
+			if this_file in keep:
+				continue
+
 			this_file_path = os.path.join(get_backup_path(), this_file)
 			if is_file_old(this_file_path, older_than):
 				os.remove(this_file_path)
@@ -0,0 +1,210 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""Bounded document cache in Redis.
+
+Every cached document is stored as its own key with a TTL. Two hashes keep
+the bookkeeping required to stay within a memory budget:
+
+- `document_cache_size`: cache key -> pickled size in bytes
+- `document_cache_usage`: cache key -> last access time (lru) or hit count (lfu)
+
+When the tracked size crosses `document_cache_max_memory` (bytes), the least
+recently (or least frequently) used documents are evicted. Hits, misses and
+evictions are counted in the `document_cache_stats` hash.
+
+Site config options:
+
+- `document_cache_ttl`: seconds a document is kept (default 3600)
+- `document_cache_max_memory`: memory budget in bytes (default 64 MB)
+- `document_cache_eviction`: `lru` (default) or `lfu`
+- `document_cache_doctypes`: DocTypes that are cached on every `frappe.get_doc`,
+  others are only cached via `frappe.get_cached_doc`
+"""
+
+from __future__ import unicode_literals
+
+import time
+import redis
+import frappe
+from six.moves import cPickle as pickle
+from frappe.utils import cint
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+
+# after an eviction pass the cache is trimmed to this fraction of the budget
+# so that the very next insert does not trigger another pass
+EVICTION_TARGET = 0.9
+
+SIZE_KEY = "document_cache_size"
+USAGE_KEY = "document_cache_usage"
+TOTAL_KEY = "document_cache_total_size"
+STATS_KEY = "document_cache_stats"
+
+def get_cache_key(doctype, name):
+	return "document_cache::{0}::{1}".format(doctype, name)
+
+def is_cached_doctype(doctype):
+	"""Returns True if documents of this DocType are cached on every `frappe.get_doc`"""
+	return doctype in (frappe.local.conf.document_cache_doctypes or ())
+
+def get_ttl():
+	return cint(frappe.local.conf.document_cache_ttl) or DEFAULT_TTL
+
+def get_max_memory():
+	return cint(frappe.local.conf.document_cache_max_memory) or DEFAULT_MAX_MEMORY
+
+def get_eviction_policy():
+	return "lfu" if frappe.local.conf.document_cache_eviction == "lfu" else "lru"
+
+def get_doc(doctype, name):
+	"""Returns the cached document dict or None"""
+	cache = frappe.cache()
+	key = cache.make_key(get_cache_key(doctype, name))
+
+	try:
+		value = cache.get(key)
+	except redis.exceptions.ConnectionError:
+		return None
+
+	if value is None:
+		incr_stat("misses")
+		return None
+
+	incr_stat("hits")
+	touch(key)
+	return pickle.loads(value)
+
+def set_doc(doctype, name, doc_dict):
+	"""Cache the document dict with a TTL and evict if the memory budget is exceeded"""
+	cache = frappe.cache()
+	key = cache.make_key(get_cache_key(doctype, name))
+	value = pickle.dumps(doc_dict)
+	size = len(value)
+
+	if size > get_max_memory():
+		return
+
+	try:
+		old_size = cint(redis.Redis.hget(cache, cache.make_key(SIZE_KEY), key))
+		pipe = cache.pipeline()
+		pipe.setex(key, value, get_ttl())
+		pipe.hset(cache.make_key(SIZE_KEY), key, size)
+		pipe.incrby(cache.make_key(TOTAL_KEY), size - old_size)
+		pipe.execute()
+		touch(key)
+
+		if cint(cache.get(cache.make_key(TOTAL_KEY))) > get_max_memory():
+			evict()
+	except redis.exceptions.ConnectionError:
+		pass
+
+def delete_doc(doctype, name):
+	cache = frappe.cache()
+	try:
+		remove_keys(cache, [cache.make_key(get_cache_key(doctype, name))])
+	except redis.exceptions.ConnectionError:
+		pass
+
+def clear():
+	"""Remove all cached documents and bookkeeping"""
+	cache = frappe.cache()
+	try:
+		# the size index lists every cached document, no need to scan for them
+		cache.unlink_keys(redis.Redis.hkeys(cache, cache.make_key(SIZE_KEY)))
+		# `document_cache` is the unbounded hash used by older versions
+		cache.delete_value([SIZE_KEY, USAGE_KEY, TOTAL_KEY, "document_cache"])
+	except redis.exceptions.ConnectionError:
+		pass
+
+def touch(key):
+	cache = frappe.cache()
+	try:
+		if get_eviction_policy() == "lfu":
+			redis.Redis.hincrby(cache, cache.make_key(USAGE_KEY), key, 1)
+		else:
+			redis.Redis.hset(cache, cache.make_key(USAGE_KEY), key, time.time())
+	except redis.exceptions.ConnectionError:
+		pass
+
+def remove_keys(cache, keys):
+	"""Delete cached documents and their bookkeeping entries"""
+	if not keys:
+		return
+
+	sizes = redis.Redis.hmget(cache, cache.make_key(SIZE_KEY), keys)
+	freed = sum(cint(s) for s in sizes)
+
+	pipe = cache.pipeline()
+	pipe.delete(*keys)
+	pipe.hdel(cache.make_key(SIZE_KEY), *keys)
+	pipe.hdel(cache.make_key(USAGE_KEY), *keys)
+	if freed:
+		pipe.decr(cache.make_key(TOTAL_KEY), freed)
+	pipe.execute()
+
+def evict():
+	"""Evict documents until the cache fits in `EVICTION_TARGET` of the memory budget.
+
+	Entries whose key has already expired are dropped first and the total size is
+	recomputed from the size index, so the counter cannot drift because of TTLs."""
+	cache = frappe.cache()
+	sizes = {k: cint(v) for k, v in redis.Redis.hgetall(cache, cache.make_key(SIZE_KEY)).items()}
+	usage = redis.Redis.hgetall(cache, cache.make_key(USAGE_KEY))
+
+	keys = list(sizes)
+	pipe = cache.pipeline()
+	for key in keys:
+		pipe.exists(key)
+	expired = [key for key, exists in zip(keys, pipe.execute()) if not exists]
+
+	for key in expired:
+		sizes.pop(key)
+
+	target = get_max_memory() * EVICTION_TARGET
+	total = sum(sizes.values())
+
+	to_evict = []
+	for key in sorted(sizes, key=lambda k: float(usage.get(k) or 0)):
+		if total <= target:
+			break
+		to_evict.append(key)
+		total -= sizes[key]
+
+	pipe = cache.pipeline()
+	if expired or to_evict:
+		pipe.delete(*(expired + to_evict))
+		pipe.hdel(cache.make_key(SIZE_KEY), *(expired + to_evict))
+		pipe.hdel(cache.make_key(USAGE_KEY), *(expired + to_evict))
+	pipe.set(cache.make_key(TOTAL_KEY), total)
+	pipe.execute()
+
+	if to_evict:
+		incr_stat("evictions", len(to_evict))
+
+def incr_stat(stat, amount=1):
+	cache = frappe.cache()
+	try:
+		redis.Redis.hincrby(cache, cache.make_key(STATS_KEY), stat, amount)
+	except redis.exceptions.ConnectionError:
+		pass
+
+def get_stats():
+	"""Returns hits, misses, evictions, hit ratio, cached document count and used memory"""
+	cache = frappe.cache()
+	stats = frappe._dict(hits=0, misses=0, evictions=0)
+	try:
+		for key, value in redis.Redis.hgetall(cache, cache.make_key(STATS_KEY)).items():
+			stats[frappe.safe_decode(key)] = cint(value)
+		stats.documents = redis.Redis.hlen(cache, cache.make_key(SIZE_KEY))
+		stats.memory = cint(cache.get(cache.make_key(TOTAL_KEY)))
+	except redis.exceptions.ConnectionError:
+		pass
+
+	lookups = stats.hits + stats.misses
+	stats.hit_ratio = (float(stats.hits) / lookups) if lookups else 0.0
+	stats.max_memory = get_max_memory()
+	return stats
+
+def reset_stats():
+	frappe.cache().delete_value(STATS_KEY)
@@ -0,0 +1,184 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Exports written to a temporary file row by row.
+
+Report Builder (`frappe.desk.reportview.export_query`) and Data Export read rows in
+batches (see `DatabaseQuery.iterate`) and write them with an `ExportWriter` to a CSV
+or Excel file (openpyxl in write-only mode), so memory does not grow with the number
+of rows. Files up to `INLINE_RESPONSE_SIZE` are sent as before (`csv` and `binary`
+responses), larger files are streamed from disk (`file` response).
+
+With `export_background_rows` in site config, exports of more rows are built by a
+background job instead. The file is attached to the User as a private File, and the
+user is notified with a link to it.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import csv
+import shutil
+import tempfile
+
+import openpyxl
+
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr, get_files_path
+from frappe.utils.xlsxutils import handle_html, ILLEGAL_CHARACTERS_RE
+from six import PY2, string_types
+
+# rows read per query
+BATCH_SIZE = 1000
+
+INLINE_RESPONSE_SIZE = 10 * 1024 * 1024
+
+class ExportWriter(object):
+	"""Writes rows to a temporary CSV or Excel file. Use as a context manager, the file
+	is removed if the export fails.
+
+	:param file_type: `CSV` or `Excel`
+	:param sheet_name: Name of the Excel sheet
+	:param quoting: Quoting of CSV values
+	:param strip_html: Convert HTML values to text
+	:param as_text: Write all values as text"""
+	def __init__(self, file_type, sheet_name, quoting=csv.QUOTE_MINIMAL, strip_html=True, as_text=False):
+		self.extension = "xlsx" if file_type == "Excel" else "csv"
+		self.strip_html = strip_html
+		self.as_text = as_text
+
+		fd, self.path = tempfile.mkstemp(suffix="." + self.extension)
+		if self.extension == "xlsx":
+			os.close(fd)
+			self.workbook = openpyxl.Workbook(write_only=True)
+			self.sheet = self.workbook.create_sheet(sheet_name, 0)
+		else:
+			self.file = os.fdopen(fd, "wb") if PY2 else io.open(fd, "w", encoding="utf-8", newline="")
+			self.writer = csv.writer(self.file, quoting=quoting)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		if type:
+			self.discard()
+
+	def writerow(self, row):
+		row = [self.clean(value) for value in row]
+		if self.extension == "xlsx":
+			self.sheet.append(row)
+		else:
+			self.writer.writerow(row)
+
+	def clean(self, value):
+		if self.as_text:
+			value = cstr(value)
+
+		if not isinstance(value, string_types):
+			return value
+
+		if self.strip_html:
+			value = handle_html(value)
+
+		if self.extension == "xlsx":
+			value = ILLEGAL_CHARACTERS_RE.sub("", value)
+		elif PY2:
+			value = value.encode("utf-8")
+
+		return value
+
+	def close(self):
+		if self.extension == "xlsx":
+			self.workbook.save(self.path)
+		else:
+			self.file.close()
+
+	def discard(self):
+		"""Close and remove the file"""
+		if self.extension == "csv" and not self.file.closed:
+			self.file.close()
+
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+	def set_response(self, name):
+		"""Set the file as the response, `name` is the filename without extension"""
+		self.close()
+		filename = "{0}.{1}".format(name, self.extension)
+
+		if frappe.flags.export_to_file or os.path.getsize(self.path) > INLINE_RESPONSE_SIZE:
+			frappe.response['type'] = 'file'
+			frappe.response['filename'] = filename
+			frappe.response['filepath'] = self.path
+			return
+
+		with open(self.path, "rb") as f:
+			content = f.read()
+		os.remove(self.path)
+
+		if self.extension == "csv":
+			frappe.response['result'] = content.decode("utf-8")
+			frappe.response['type'] = 'csv'
+			frappe.response['doctype'] = name
+		else:
+			frappe.response['filename'] = filename
+			frappe.response['filecontent'] = content
+			frappe.response['type'] = 'binary'
+
+def enqueue_export(method, doctype, filters=None, or_filters=None):
+	"""Enqueue the export request if it has more than `export_background_rows` rows (site
+	config), and respond with a message. Returns True if enqueued."""
+	from frappe.model.db_query import DatabaseQuery
+
+	limit = cint(frappe.local.conf.export_background_rows)
+	if not limit or frappe.flags.export_to_file or frappe.local.form_dict.cmd != method:
+		return False
+
+	count = DatabaseQuery(doctype).execute(fields=["count(*)"], filters=filters,
+		or_filters=or_filters, as_list=True)[0][0]
+	if count <= limit:
+		return False
+
+	frappe.enqueue("frappe.utils.export.export_in_background", queue="long", timeout=3600,
+		method=method, form_dict=dict(frappe.local.form_dict))
+
+	frappe.respond_as_web_page(_("Export Started"),
+		_("{0} rows are being exported, you will be notified when the file is ready.").format(count),
+		indicator_color="blue")
+	return True
+
+def export_in_background(method, form_dict):
+	"""Run the export request and attach the file to the User"""
+	frappe.local.form_dict = frappe._dict(form_dict)
+	frappe.flags.export_to_file = True
+	frappe.call(method, **form_dict)
+
+	if frappe.response.get("type") != "file":
+		return
+
+	# moved instead of saved from content, exports are not limited by `max_file_size`
+	name, extension = os.path.splitext(frappe.response.filename)
+	file_name = "{0}-{1}{2}".format(name.replace(" ", "_"), frappe.generate_hash(length=10), extension)
+	path = get_files_path(file_name, is_private=1)
+	shutil.move(frappe.response.filepath, path)
+
+	try:
+		_file = frappe.get_doc({
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": "/private/files/" + file_name,
+			"file_size": os.path.getsize(path),
+			"is_private": 1,
+			"attached_to_doctype": "User",
+			"attached_to_name": frappe.session.user
+		}).insert(ignore_permissions=True)
+		frappe.db.commit()
+	except Exception:
+		os.remove(path)
+		raise
+
+	frappe.publish_realtime("msgprint", _("Your export is ready: {0}").format(
+		'<a href="{0}" target="_blank">{1}</a>'.format(_file.file_url, _file.file_name)),
+		user=frappe.session.user)
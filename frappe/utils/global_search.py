@@ -11,7 +11,11 @@ import os
 from bs4 import BeautifulSoup
 from frappe.utils import cint, strip_html_tags
 from frappe.model.base_document import get_controller
-from six import text_type
+from six import text_type, string_types
+
+# values read from `global_search_queue` at a time, and rows per statement
+SYNC_BATCH_SIZE = 10000
+SYNC_CHUNK_SIZE = 500
 
 def setup_global_search_table():
 	"""
@@ -28,6 +32,10 @@ def reset():
 	"""
 	frappe.db.sql('DELETE FROM `__global_search`')
 
+	index = get_search_index()
+	if index:
+		index.clear()
+
 
 def get_doctypes_with_global_search(with_child_tables=True):
 	"""
@@ -143,6 +151,10 @@ def rebuild_for_doctype(doctype):
 	if all_contents:
 		insert_values_for_multiple_docs(all_contents)
 
+	index = get_search_index()
+	if index:
+		index.reindex(doctype)
+
 
 def delete_global_search_records_for_doctype(doctype):
 	frappe.db.sql('''DELETE
@@ -358,9 +370,25 @@ def sync_global_search():
 	:param flags:
 	:return:
 	"""
-	while frappe.cache().llen('global_search_queue') > 0:
-		value = json.loads(frappe.cache().lpop('global_search_queue').decode('utf-8'))
-		sync_value(value)
+	while True:
+		values = pop_from_queue(SYNC_BATCH_SIZE)
+		if not values:
+			break
+
+		sync_values(values)
+
+def pop_from_queue(count):
+	"""Returns up to `count` of the oldest values in `global_search_queue`, oldest first"""
+	cache = frappe.cache()
+	key = cache.make_key('global_search_queue')
+
+	# values are pushed on the left, so the oldest are on the right
+	pipe = cache.pipeline()
+	pipe.lrange(key, -count, -1)
+	pipe.ltrim(key, 0, -count - 1)
+	values = pipe.execute()[0]
+
+	return [json.loads(frappe.safe_decode(value)) for value in reversed(values)]
 
 def sync_value_in_queue(value):
 	try:
@@ -370,32 +398,61 @@ def sync_value_in_queue(value):
 		# not connected, sync directly
 		sync_value(value)
 
+def sync_values(values):
+	"""
+	Sync values (oldest first) to global search. Only the last value of each document
+	is written, with multi-row upserts and deletes.
+	:param values: list of dicts of { doctype, name, content, published, title, route },
+		or { doctype, name, deleted } for deleted documents
+	"""
+	latest = {}
+	for value in values:
+		latest[(value['doctype'], value['name'])] = value
+
+	to_delete = [key for key, value in latest.items() if value.get('deleted')]
+	to_upsert = [value for value in latest.values() if not value.get('deleted')]
+
+	for i in range(0, len(to_delete), SYNC_CHUNK_SIZE):
+		chunk = to_delete[i:i + SYNC_CHUNK_SIZE]
+		frappe.db.sql('''DELETE FROM `__global_search` WHERE {0}'''.format(
+			" OR ".join(["(`doctype`=%s AND `name`=%s)"] * len(chunk))),
+			[v for key in chunk for v in key])
+
+	fields = ('doctype', 'name', 'content', 'published', 'title', 'route')
+	for i in range(0, len(to_upsert), SYNC_CHUNK_SIZE):
+		chunk = to_upsert[i:i + SYNC_CHUNK_SIZE]
+		placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))
+		frappe.db.multisql({
+			'mariadb': '''INSERT INTO `__global_search`
+				(`doctype`, `name`, `content`, `published`, `title`, `route`)
+				VALUES {0}
+				ON DUPLICATE key UPDATE
+					`content`=VALUES(`content`),
+					`published`=VALUES(`published`),
+					`title`=VALUES(`title`),
+					`route`=VALUES(`route`)
+			'''.format(placeholders),
+			'postgres': '''INSERT INTO `__global_search`
+				(`doctype`, `name`, `content`, `published`, `title`, `route`)
+				VALUES {0}
+				ON CONFLICT("doctype", "name") DO UPDATE SET
+					`content`=EXCLUDED.`content`,
+					`published`=EXCLUDED.`published`,
+					`title`=EXCLUDED.`title`,
+					`route`=EXCLUDED.`route`
+			'''.format(placeholders)
+		}, [value.get(field) for value in chunk for field in fields])
+
+	index = get_search_index()
+	if index:
+		index.update(list(latest.values()))
+
 def sync_value(value):
 	'''
 	Sync a given document to global search
 	:param value: dict of { doctype, name, content, published, title, route }
 	'''
-
-	frappe.db.multisql({
-		'mariadb': '''INSERT INTO `__global_search`
-			(`doctype`, `name`, `content`, `published`, `title`, `route`)
-			VALUES (%(doctype)s, %(name)s, %(content)s, %(published)s, %(title)s, %(route)s)
-			ON DUPLICATE key UPDATE
-				`content`=%(content)s,
-				`published`=%(published)s,
-				`title`=%(title)s,
-				`route`=%(route)s
-		''',
-		'postgres': '''INSERT INTO `__global_search`
-			(`doctype`, `name`, `content`, `published`, `title`, `route`)
-			VALUES (%(doctype)s, %(name)s, %(content)s, %(published)s, %(title)s, %(route)s)
-			ON CONFLICT("doctype", "name") DO UPDATE SET
-				`content`=%(content)s,
-				`published`=%(published)s,
-				`title`=%(title)s,
-				`route`=%(route)s
-		'''
-	}, value)
+	sync_values([value])
 
 def delete_for_document(doc):
 	"""
@@ -409,52 +466,137 @@ def delete_for_document(doc):
 		WHERE doctype = %s
 		AND name = %s''', (doc.doctype, doc.name), as_dict=True)
 
+	index = get_search_index()
+	if index:
+		index.update([dict(doctype=doc.doctype, name=doc.name, deleted=1)])
+
+	# so that updates still in the queue do not add it again
+	try:
+		if frappe.cache().llen('global_search_queue'):
+			frappe.cache().lpush('global_search_queue',
+				json.dumps(dict(doctype=doc.doctype, name=doc.name, deleted=1)))
+	except redis.exceptions.ConnectionError:
+		pass
+
 
 @frappe.whitelist()
-def search(text, start=0, limit=20, doctype=""):
+def search(text, start=0, limit=20, doctype="", after=None):
 	"""
-	Search for given text in __global_search
-	:param text: phrase to be searched
+	Search for given text in __global_search, ranked by relevance
+	:param text: phrase to be searched, all terms separated by `&` must match
 	:param start: start results at, default 0
 	:param limit: number of results to return, default 20
+	:param after: `[relevance, doctype, name]` of the last result of the previous page,
+		to get the next page (instead of `start`)
 	:return: Array of result objects
 	"""
-	results = []
-	texts = text.split('&')
-	for text in texts:
-		mariadb_conditions = ''
-		postgres_conditions = ''
-		if doctype:
-			mariadb_conditions = postgres_conditions = '`doctype` = {} AND '.format(frappe.db.escape(doctype))
+	terms = [t.strip() for t in text.split('&') if t.strip()]
+	if not terms:
+		return []
 
-		mariadb_conditions += 'MATCH(`content`) AGAINST ({} IN BOOLEAN MODE)'.format(frappe.db.escape('+' + text + '*'))
-		postgres_conditions += 'TO_TSVECTOR("content") @@ PLAINTO_TSQUERY({})'.format(frappe.db.escape(text))
+	if after and isinstance(after, string_types):
+		after = json.loads(after)
 
-		common_query = '''SELECT `doctype`, `name`, `content`
-					FROM `__global_search`
-					WHERE {conditions}
-					LIMIT {limit} OFFSET {start}'''
+	results = get_search_engine().search(terms, doctype=doctype, start=cint(start),
+		limit=cint(limit), after=after)
 
-		result = frappe.db.multisql({
-				'mariadb': common_query.format(conditions=mariadb_conditions, limit=limit, start=start),
-				'postgres': common_query.format(conditions=postgres_conditions, limit=limit, start=start)
-			}, as_dict=True)
+	set_title_and_image(results)
+	return results
 
-		tmp_result=[]
-		for i in result:
-			if i in results or not results:
-				tmp_result.append(i)
-		results += tmp_result
+def get_search_engine():
+	return get_search_index() or DatabaseSearch()
+
+def get_search_index():
+	"""Returns the on-disk inverted index, if it is the search engine of the site"""
+	if frappe.local.conf.global_search_engine == 'index':
+		from frappe.utils.search_index import SearchIndex
+		return SearchIndex(frappe.local.conf.global_search_index_path
+			or frappe.get_site_path('global_search_index.sqlite'))
+
+def rebuild_search_index():
+	"""Build the on-disk inverted index from __global_search"""
+	index = get_search_index()
+	if index:
+		index.reindex()
+
+class DatabaseSearch(object):
+	"""Search using the fulltext index of __global_search"""
+	def search(self, terms, doctype=None, published=False, start=0, limit=20, after=None):
+		values = {'query': ' '.join('+{0}*'.format(term) for term in terms)}
+		for i, term in enumerate(terms):
+			values['term{0}'.format(i)] = term
+		tsquery = ' && '.join('PLAINTO_TSQUERY(%(term{0})s)'.format(i) for i in range(len(terms)))
+
+		relevance = {
+			'mariadb': 'CAST(MATCH(`content`) AGAINST (%(query)s IN BOOLEAN MODE) AS DECIMAL(20, 6))',
+			'postgres': 'ROUND(TS_RANK(TO_TSVECTOR("content"), {0})::NUMERIC, 6)'.format(tsquery)
+		}
+		# compared as decimals, not floats
+		after_relevance = {
+			'mariadb': 'CAST(%(after_relevance)s AS DECIMAL(20, 6))',
+			'postgres': 'CAST(%(after_relevance)s AS NUMERIC)'
+		}
+		match = {
+			'mariadb': 'MATCH(`content`) AGAINST (%(query)s IN BOOLEAN MODE)',
+			'postgres': 'TO_TSVECTOR("content") @@ ({0})'.format(tsquery)
+		}
 
+		conditions = []
+		if doctype:
+			conditions.append('`doctype` = %(doctype)s')
+			values['doctype'] = doctype
+		if published:
+			conditions.append('`published` = 1')
+
+		limit_condition = 'LIMIT {0} OFFSET {1}'.format(cint(limit), cint(start))
+		if after:
+			# keyset pagination, rows ranked below the last row of the previous page
+			conditions.append('''({relevance} < {after} OR ({relevance} = {after}
+				AND (`doctype` > %(after_doctype)s OR (`doctype` = %(after_doctype)s AND `name` > %(after_name)s))))''')
+			values.update(after_relevance=text_type(after[0]), after_doctype=after[1], after_name=after[2])
+			limit_condition = 'LIMIT {0}'.format(cint(limit))
+
+		query = '''SELECT `doctype`, `name`, `content`, `title`, `route`, {relevance} AS `relevance`
+			FROM `__global_search`
+			WHERE {match} {conditions}
+			ORDER BY `relevance` DESC, `doctype`, `name`
+			{limit}'''
+
+		return frappe.db.multisql(dict((db_type, query.format(
+			match=match[db_type],
+			conditions=''.join(' AND ' + c for c in conditions).format(relevance=relevance[db_type],
+				after=after_relevance[db_type]),
+			relevance=relevance[db_type],
+			limit=limit_condition)) for db_type in ('mariadb', 'postgres')), values, as_dict=True)
+
+def set_title_and_image(results):
+	"""Set `image` (if the DocType has an image field) and missing titles, one query per DocType"""
+	by_doctype = {}
 	for r in results:
+		by_doctype.setdefault(r.doctype, []).append(r)
+
+	for doctype, doctype_results in by_doctype.items():
 		try:
-			if frappe.get_meta(r.doctype).image_field:
-				r.image = frappe.db.get_value(r.doctype, r.name, frappe.get_meta(r.doctype).image_field)
+			meta = frappe.get_meta(doctype)
+			fields = [meta.image_field] if meta.image_field else []
+			if meta.title_field and any(not r.title for r in doctype_results):
+				fields.append(meta.title_field)
+
+			if not fields:
+				continue
+
+			values = dict((d.name, d) for d in frappe.get_all(doctype, fields=['name'] + fields,
+				filters={'name': ('in', [r.name for r in doctype_results])}))
+
+			for r in doctype_results:
+				d = values.get(r.name) or {}
+				if meta.image_field:
+					r.image = d.get(meta.image_field)
+				if not r.title and meta.title_field:
+					r.title = d.get(meta.title_field)
 		except Exception:
 			frappe.clear_messages()
 
-	return results
-
 
 @frappe.whitelist(allow_guest=True)
 def web_search(text, scope=None, start=0, limit=20):
@@ -22,6 +22,9 @@ class NestedSetMultipleRootsError(frappe.ValidationError): pass
 class NestedSetChildExistsError(frappe.ValidationError): pass
 class NestedSetInvalidMergeError(frappe.ValidationError): pass
 
+# nodes written per query by bulk updates
+BATCH_SIZE = 500
+
 # called in the on_update method
 def update_nsm(doc):
 	# get fields, data from the DocType
@@ -35,8 +38,18 @@ def update_nsm(doc):
 
 	p, op = doc.get(pf) or None, doc.get(opf) or None
 
+	bulk = (frappe.flags.nestedset_bulk_update or {}).get(doc.doctype)
+	if bulk is not None:
+		# lft, rgt are set when the bulk update ends
+		bulk.parent_field = pf
+		if not doc.lft and not doc.rgt:
+			bulk.added.append(doc.name)
+		elif op != p:
+			validate_parent_chain(doc.doctype, doc.name, p, pf)
+			bulk.moved = True
+
 	# has parent changed (?) or parent is None (root)
-	if not doc.lft and not doc.rgt:
+	elif not doc.lft and not doc.rgt:
 		update_add_node(doc, p or '', pf)
 	elif op != p:
 		update_move_node(doc, pf)
@@ -45,7 +58,48 @@ def update_nsm(doc):
 	doc.set(opf, p)
 	frappe.db.set_value(doc.doctype, doc.name, opf, p or '', update_modified=False)
 
-	doc.reload()
+	if bulk is None:
+		doc.reload()
+
+class bulk_update(object):
+	"""Context manager that defers updates of lft, rgt of nodes of `doctype` that are
+	inserted or moved within it to a single update when it ends:
+
+		with bulk_update("Item Group"):
+			for d in item_groups:
+				frappe.get_doc(d).insert()
+
+	If nodes were only added, existing nodes are shifted once per parent of the new
+	nodes (`update_add_nodes`), else the whole tree is rebuilt (`rebuild_tree`). lft, rgt
+	of the tree are not valid until the end of the block."""
+	def __init__(self, doctype, parent_field=None):
+		self.doctype = doctype
+		self.parent_field = parent_field or "parent_" + frappe.scrub(doctype)
+
+	def __enter__(self):
+		if frappe.flags.nestedset_bulk_update is None:
+			frappe.flags.nestedset_bulk_update = {}
+
+		# nested in a bulk update of the same doctype
+		self.nested = self.doctype in frappe.flags.nestedset_bulk_update
+		if not self.nested:
+			frappe.flags.nestedset_bulk_update[self.doctype] = frappe._dict(parent_field=None,
+				added=[], moved=False)
+
+	def __exit__(self, type, value, traceback):
+		if self.nested:
+			return
+
+		bulk = frappe.flags.nestedset_bulk_update.pop(self.doctype)
+		if type:
+			# the transaction is rolled back
+			return
+
+		parent_field = bulk.parent_field or self.parent_field
+		if bulk.moved:
+			rebuild_tree(self.doctype, parent_field)
+		elif bulk.added:
+			update_add_nodes(self.doctype, parent_field, bulk.added)
 
 def update_add_node(doc, parent, parent_field):
 	"""
@@ -85,6 +139,54 @@ def update_add_node(doc, parent, parent_field):
 	return right
 
 
+def update_add_nodes(doctype, parent_field, names):
+	"""
+		set lft, rgt of new nodes (saved with lft, rgt = 0), shifting the nodes on the
+		right once per parent instead of once per node
+	"""
+	# keep the order of insertion, a node may have been saved more than once
+	order = {}
+	for name in names:
+		order.setdefault(name, len(order))
+
+	children = {}
+	names = list(order)
+	for i in range(0, len(names), BATCH_SIZE):
+		batch = names[i:i + BATCH_SIZE]
+		for name, parent in frappe.db.sql("select name, `{0}` from `tab{1}` where name in ({2})"
+			.format(parent_field, doctype, ", ".join(["%s"] * len(batch))), batch):
+			children.setdefault(parent or '', []).append(name)
+
+	for nodes in children.values():
+		nodes.sort(key=lambda name: order[name])
+
+	n = now()
+	# parents that are not new themselves
+	for parent in sorted(p for p in children if p not in order):
+		if parent:
+			values = frappe.db.sql("select lft, rgt from `tab{0}` where name=%s"
+				.format(doctype), parent)
+			if not values:
+				frappe.throw(_("{0} {1} not found").format(_(doctype), parent), frappe.DoesNotExistError)
+			right = values[0][1]
+		else: # roots
+			right = frappe.db.sql("""
+				SELECT COALESCE(MAX(rgt), 0) + 1 FROM `tab{0}`
+				WHERE COALESCE(`{1}`, '') = '' AND rgt > 0
+			""".format(doctype, parent_field))[0][0]
+		right = right or 1
+
+		positions, next_left = get_nested_set(children, children[parent], right)
+		width = next_left - right
+
+		# update all on the right
+		frappe.db.sql("update `tab{0}` set rgt = rgt+%s, modified=%s where rgt >= %s"
+			.format(doctype), (width, n, right))
+		frappe.db.sql("update `tab{0}` set lft = lft+%s, modified=%s where lft >= %s"
+			.format(doctype), (width, n, right))
+
+		set_nested_set(doctype, positions)
+
 def update_move_node(doc, parent_field):
 	n = now()
 	parent = doc.get(parent_field)
@@ -139,42 +241,78 @@ def update_move_node(doc, parent_field):
 
 def rebuild_tree(doctype, parent_field):
 	"""
-		call rebuild_node for all root nodes
+		set lft, rgt of all nodes, computed from the parent of each node
 	"""
-	# get all roots
 	frappe.db.auto_commit_on_many_writes = 1
 
-	right = 1
-	result = frappe.db.sql("SELECT name FROM `tab%s` WHERE `%s`='' or `%s` IS NULL ORDER BY name ASC" % (doctype, parent_field, parent_field))
-	for r in result:
-		right = rebuild_node(doctype, r[0], right, parent_field)
+	children, current = get_tree(doctype, parent_field)
+	positions, right = get_nested_set(children, children.get('', []), 1)
+	set_nested_set(doctype, positions, current)
 
 	frappe.db.auto_commit_on_many_writes = 0
 
 def rebuild_node(doctype, parent, left, parent_field):
 	"""
-		reset lft, rgt and recursive call for all children
+		reset lft, rgt of the node and all its descendants, starting at `left`
 	"""
-	from frappe.utils import now
-	n = now()
-
-	# the right value of this node is the left value + 1
-	right = left+1
+	children, current = get_tree(doctype, parent_field)
+	positions, right = get_nested_set(children, [parent], left)
+	set_nested_set(doctype, positions, current)
 
-	# get all children of this node
-	result = frappe.db.sql("SELECT name FROM `tab{0}` WHERE `{1}`=%s"
-		.format(doctype, parent_field), (parent))
-	for r in result:
-		right = rebuild_node(doctype, r[0], right, parent_field)
+	#return the right value of this node + 1
+	return right
 
-	# we've got the left value, and now that we've processed
-	# the children of this node we also know the right value
-	frappe.db.sql("""UPDATE `tab{0}` SET lft=%s, rgt=%s, modified=%s
-		WHERE name=%s""".format(doctype), (left,right,n,parent))
+def get_tree(doctype, parent_field):
+	"""Returns children of each node (roots under '') and current lft, rgt of each node,
+	read in one query"""
+	children, current = {}, {}
+	for name, parent, lft, rgt in frappe.db.sql("SELECT name, `{1}`, lft, rgt FROM `tab{0}` ORDER BY name ASC"
+		.format(doctype, parent_field)):
+		children.setdefault(parent or '', []).append(name)
+		current[name] = (lft, rgt)
+
+	return children, current
+
+def get_nested_set(children, nodes, left):
+	"""Returns lft, rgt of `nodes` and their descendants numbered from `left`, and the
+	value after the rgt of the last node"""
+	positions = {}
+	stack = [(name, False) for name in reversed(nodes)]
+	while stack:
+		name, visited = stack.pop()
+		if visited:
+			positions[name] = (positions[name], left)
+		else:
+			positions[name] = left
+			stack.append((name, True))
+			stack.extend((child, False) for child in reversed(children.get(name, [])))
+		left += 1
 
-	#return the right value of this node + 1
-	return right+1
+	return positions, left
 
+def set_nested_set(doctype, positions, current=None):
+	"""Update lft, rgt of nodes that have changed, in batches"""
+	n = now()
+	nodes = [(name, lft, rgt) for name, (lft, rgt) in positions.items()
+		if not current or current.get(name) != (lft, rgt)]
+
+	for i in range(0, len(nodes), BATCH_SIZE):
+		batch = nodes[i:i + BATCH_SIZE]
+		cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+		frappe.db.sql("""UPDATE `tab{0}` SET lft = CASE name {1} END, rgt = CASE name {1} END,
+			modified = %s WHERE name IN ({2})""".format(doctype, cases, ", ".join(["%s"] * len(batch))),
+			[v for name, lft, rgt in batch for v in (name, lft)]
+			+ [v for name, lft, rgt in batch for v in (name, rgt)]
+			+ [n] + [name for name, lft, rgt in batch])
+
+def validate_parent_chain(doctype, name, parent, parent_field):
+	"""check if item not an ancestor (loop), by following parents"""
+	ancestors = set()
+	while parent:
+		if parent == name or parent in ancestors:
+			frappe.throw(_("Item cannot be added to its own descendents"), NestedSetRecursionError)
+		ancestors.add(parent)
+		parent = frappe.db.get_value(doctype, parent, parent_field)
 
 def validate_loop(doctype, name, lft, rgt):
 	"""check if item not an ancestor (loop)"""
@@ -0,0 +1,182 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Process level LRU cache in front of Redis for hot keys.
+
+`RedisWrapper.get_value` and `hget` only memoize values in `frappe.local.cache`,
+which is discarded after every request. For the keys in `process_cache_keys`
+(site config, default: `meta`, `table_columns`, `defaults`, `user_permissions`)
+values are also kept in this process, within a budget of `process_cache_max_size`
+bytes (measured as pickled size, default 32 MB).
+
+Every write or delete of these keys is published on a Redis channel. Each process
+listens on it in a daemon thread and drops the changed keys. Values are only served
+from this cache while the listener is subscribed, and the cache is cleared whenever
+it (re)subscribes, so no invalidation can be missed.
+
+Enable with `process_cache` in site config. Values are kept pickled, as read from
+Redis, and every read returns a new copy, so callers may change the values they get
+(e.g. `frappe.defaults.get_defaults` updates the global defaults with the user's)
+without affecting other requests.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import frappe
+from six.moves import cPickle as pickle
+from frappe.utils import cint
+
+CHANNEL = "process_cache_invalidation"
+DEFAULT_KEYS = ("meta", "table_columns", "defaults", "user_permissions")
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+class ProcessCache(object):
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.values = OrderedDict()
+		self.fields_by_name = {}
+		self.size = 0
+		self.pid = None
+		self.listening = False
+		self.hits = self.misses = 0
+
+		# incremented on every invalidation, so that a value read from redis
+		# before a concurrent invalidation is not cached
+		self.generation = 0
+
+	def is_active(self, name):
+		"""Returns True if `name` (key without site prefix) is served from this cache"""
+		conf = getattr(frappe.local, "conf", None)
+		if not (conf and conf.process_cache):
+			return False
+
+		if name not in (conf.process_cache_keys or DEFAULT_KEYS):
+			return False
+
+		if self.pid != os.getpid():
+			# first use, or forked: the listener thread does not survive a fork
+			self.start_listener()
+
+		return self.listening
+
+	def get(self, name, field=None):
+		"""Returns `(found, value)`, the value is a new copy"""
+		with self.lock:
+			try:
+				data, size = self.values.pop((name, field))
+			except KeyError:
+				self.misses += 1
+				return False, None
+
+			# move to the end (most recently used)
+			self.values[(name, field)] = (data, size)
+			self.hits += 1
+
+		return True, pickle.loads(data)
+
+	def set(self, name, field, data, generation):
+		"""Cache the pickled value read from redis, unless an invalidation has happened
+		since `generation` was read (before reading from redis)"""
+		max_size = cint(frappe.local.conf.process_cache_max_size) or DEFAULT_MAX_SIZE
+		size = len(data)
+		if size > max_size:
+			return
+
+		with self.lock:
+			if generation != self.generation:
+				return
+
+			self.remove(name, field)
+			self.values[(name, field)] = (data, size)
+			self.fields_by_name.setdefault(name, set()).add(field)
+			self.size += size
+
+			while self.size > max_size:
+				(evicted_name, evicted_field), _ = next(iter(self.values.items()))
+				self.remove(evicted_name, evicted_field)
+
+	def remove(self, name, field=None):
+		with self.lock:
+			entry = self.values.pop((name, field), None)
+			if entry:
+				self.size -= entry[1]
+				fields = self.fields_by_name.get(name)
+				if fields:
+					fields.discard(field)
+					if not fields:
+						del self.fields_by_name[name]
+
+	def invalidate(self, name, field=None):
+		"""Drop the key, or the hash field. `field=None` drops the whole hash"""
+		with self.lock:
+			self.generation += 1
+			if field is not None:
+				self.remove(name, field)
+			else:
+				for _field in list(self.fields_by_name.get(name, ())):
+					self.remove(name, _field)
+
+	def clear(self):
+		with self.lock:
+			self.generation += 1
+			self.values.clear()
+			self.fields_by_name.clear()
+			self.size = 0
+
+	def publish(self, redis_server, name, field=None):
+		"""Invalidate the key here and in all other processes"""
+		self.invalidate(name, field)
+		try:
+			redis_server.publish(CHANNEL, pickle.dumps((name, field)))
+		except Exception:
+			# redis is not reachable, listeners of other processes have lost their
+			# connection too and will clear their cache when they resubscribe
+			self.clear()
+
+	def start_listener(self):
+		from frappe.utils.redis_wrapper import RedisWrapper
+
+		self.pid = os.getpid()
+		self.listening = False
+		self.clear()
+
+		# own connection, the listener blocks on it
+		redis_server = RedisWrapper.from_url(frappe.conf.get('redis_cache')
+			or "redis://localhost:11311")
+
+		thread = threading.Thread(target=self.listen, args=(redis_server, self.pid))
+		thread.daemon = True
+		thread.start()
+
+	def listen(self, redis_server, pid):
+		while self.pid == pid:
+			try:
+				pubsub = redis_server.pubsub()
+				pubsub.subscribe(CHANNEL)
+
+				for message in pubsub.listen():
+					if message.get("type") == "subscribe":
+						# values cached before (re)subscribing may be stale
+						self.clear()
+						self.listening = True
+						continue
+
+					if message.get("type") == "message":
+						self.invalidate(*pickle.loads(message["data"]))
+
+			except Exception:
+				pass
+
+			self.listening = False
+			time.sleep(1)
+
+	def get_stats(self):
+		return frappe._dict(hits=self.hits, misses=self.misses, keys=len(self.values),
+			size=self.size, listening=self.listening)
+
+process_cache = ProcessCache()
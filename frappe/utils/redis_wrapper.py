@@ -2,11 +2,24 @@
 # MIT License. See license.txt
 from __future__ import unicode_literals
 
-import redis, frappe, re
+import redis, frappe, re, time
 from six.moves import cPickle as pickle
 from frappe.utils import cstr
+from frappe.utils.process_cache import process_cache
 from six import iteritems
 
+# keys fetched per SCAN call, and deleted per UNLINK (or DEL) command
+SCAN_COUNT = 1000
+DELETE_BATCH_SIZE = 1000
+
+# registers a key that expires in the sorted set KEYS[1] (scored by expiry time), drops
+# entries of keys that have expired, and lets the set expire with its last key
+REGISTER_EXPIRING_KEY_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(last[2])))
+"""
 
 class RedisWrapper(redis.Redis):
 	"""Redis client that will automatically prefix conf.db_name"""
@@ -36,16 +49,30 @@ class RedisWrapper(redis.Redis):
 		:param user: Prepends key with User
 		:param expires_in_sec: Expire value of this key in X seconds
 		"""
+		original_key = key
 		key = self.make_key(key, user)
 
 		if not expires_in_sec:
 			frappe.local.cache[key] = val
 
 		try:
+			pipe = self.pipeline()
 			if expires_in_sec:
-				self.setex(key, pickle.dumps(val), expires_in_sec)
+				pipe.setex(key, pickle.dumps(val), expires_in_sec)
 			else:
-				self.set(key, pickle.dumps(val))
+				pipe.set(key, pickle.dumps(val))
+
+			if user and expires_in_sec:
+				# so that the keys of a user can be deleted without scanning
+				now = int(time.time())
+				pipe.eval(REGISTER_EXPIRING_KEY_SCRIPT, 1, self.get_user_registry(user, expiring=True),
+					now, now + int(expires_in_sec), key)
+			elif user:
+				pipe.sadd(self.get_user_registry(user), key)
+			pipe.execute()
+
+			if process_cache.is_active(original_key):
+				process_cache.publish(self, key)
 
 		except redis.exceptions.ConnectionError:
 			return None
@@ -61,17 +88,27 @@ class RedisWrapper(redis.Redis):
 		original_key = key
 		key = self.make_key(key, user)
 
+		use_process_cache = not expires and process_cache.is_active(original_key)
+		found, val = process_cache.get(key) if use_process_cache and key not in frappe.local.cache \
+			else (False, None)
+
 		if key in frappe.local.cache:
 			val = frappe.local.cache[key]
 
+		elif found:
+			frappe.local.cache[key] = val
+
 		else:
 			val = None
+			generation = process_cache.generation
 			try:
 				val = self.get(key)
 			except redis.exceptions.ConnectionError:
 				pass
 
 			if val is not None:
+				if use_process_cache:
+					process_cache.set(key, None, val, generation)
 				val = pickle.loads(val)
 
 			if not expires:
@@ -91,11 +128,15 @@ class RedisWrapper(redis.Redis):
 
 		return ret
 
+	def scan_keys(self, key, count=SCAN_COUNT):
+		"""Iterate over keys starting with `key`. Uses incremental `SCAN`, which
+		unlike `KEYS` does not block the server while the keyspace is walked."""
+		return self.scan_iter(match=self.make_key(key + "*"), count=count)
+
 	def get_keys(self, key):
 		"""Return keys starting with `key`."""
 		try:
-			key = self.make_key(key + "*")
-			return self.keys(key)
+			return list(self.scan_keys(key))
 
 		except redis.exceptions.ConnectionError:
 			regex = re.compile(cstr(key).replace("|", "\|").replace("*", "[\w]*"))
@@ -104,7 +145,37 @@ class RedisWrapper(redis.Redis):
 	def delete_keys(self, key):
 		"""Delete keys with wildcard `*`."""
 		try:
-			self.delete_value(self.get_keys(key), make_keys=False)
+			batch = []
+			for k in self.scan_keys(key):
+				batch.append(k)
+				if len(batch) >= DELETE_BATCH_SIZE:
+					self.unlink_keys(batch)
+					batch = []
+
+			self.unlink_keys(batch)
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def get_user_registry(self, user, expiring=False):
+		"""Returns the key of the set of all keys set for `user` via `set_value`. Keys
+		that expire are registered in a separate sorted set, trimmed as they expire."""
+		if user == True:
+			user = frappe.session.user
+
+		return self.make_key("key_registry::{0}user:{1}".format("expiring:" if expiring else "", user))
+
+	def delete_user_keys(self, user):
+		"""Delete all keys set for `user`. Uses the registry of the user's keys, and
+		only scans if there is none (keys set before the registry existed)."""
+		registry = self.get_user_registry(user)
+		expiring_registry = self.get_user_registry(user, expiring=True)
+		try:
+			keys = list(super(RedisWrapper, self).smembers(registry))
+			keys += super(RedisWrapper, self).zrange(expiring_registry, 0, -1)
+			if keys:
+				self.unlink_keys(keys + [registry, expiring_registry])
+			else:
+				self.delete_keys("user:{0}:".format(user))
 		except redis.exceptions.ConnectionError:
 			pass
 
@@ -116,17 +187,37 @@ class RedisWrapper(redis.Redis):
 		if not isinstance(keys, (list, tuple)):
 			keys = (keys, )
 
-		for key in keys:
-			if make_keys:
-				key = self.make_key(key, shared=shared)
+		if make_keys:
+			keys = [self.make_key(key, shared=shared) for key in keys]
 
+		try:
+			self.unlink_keys(keys)
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def unlink_keys(self, keys):
+		"""Delete (already prefixed) keys in batches of `DELETE_BATCH_SIZE`.
+
+		`UNLINK` frees the memory in a background thread, so deleting large values
+		does not block the server. Falls back to `DEL` on Redis < 4.0."""
+		for key in keys:
 			if key in frappe.local.cache:
 				del frappe.local.cache[key]
 
-			try:
-				self.delete(key)
-			except redis.exceptions.ConnectionError:
-				pass
+		for i in range(0, len(keys), DELETE_BATCH_SIZE):
+			batch = keys[i:i + DELETE_BATCH_SIZE]
+			if getattr(self, "unlink_supported", True):
+				try:
+					self.execute_command("UNLINK", *batch)
+				except redis.exceptions.ResponseError:
+					self.unlink_supported = False
+
+			if not getattr(self, "unlink_supported", True):
+				self.delete(*batch)
+
+			for key in batch:
+				if process_cache.is_active(cstr(key).split("|", 1)[-1]):
+					process_cache.publish(self, key)
 
 	def lpush(self, key, value):
 		super(RedisWrapper, self).lpush(self.make_key(key), value)
@@ -152,6 +243,9 @@ class RedisWrapper(redis.Redis):
 		try:
 			super(RedisWrapper, self).hset(_name,
 				key, pickle.dumps(value))
+
+			if process_cache.is_active(name):
+				process_cache.publish(self, _name, key)
 		except redis.exceptions.ConnectionError:
 			pass
 
@@ -167,13 +261,23 @@ class RedisWrapper(redis.Redis):
 		if key in frappe.local.cache[_name]:
 			return frappe.local.cache[_name][key]
 
+		use_process_cache = process_cache.is_active(name)
+		if use_process_cache:
+			found, value = process_cache.get(_name, key)
+			if found:
+				frappe.local.cache[_name][key] = value
+				return value
+
 		value = None
+		generation = process_cache.generation
 		try:
 			value = super(RedisWrapper, self).hget(_name, key)
 		except redis.exceptions.ConnectionError:
 			pass
 
 		if value:
+			if use_process_cache:
+				process_cache.set(_name, key, value, generation)
 			value = pickle.loads(value)
 			frappe.local.cache[_name][key] = value
 		elif generator:
@@ -192,6 +296,8 @@ class RedisWrapper(redis.Redis):
 				del frappe.local.cache[_name][key]
 		try:
 			super(RedisWrapper, self).hdel(_name, key)
+			if process_cache.is_active(name):
+				process_cache.publish(self, _name, key)
 		except redis.exceptions.ConnectionError:
 			pass
 
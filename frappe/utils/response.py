@@ -45,7 +45,8 @@ def build_response(response_type=None):
 		'pdf': as_pdf,
 		'page': as_page,
 		'redirect': redirect,
-		'binary': as_binary
+		'binary': as_binary,
+		'file': as_file
 	}
 
 	return response_type_map[frappe.response.get('type') or response_type]()
@@ -99,6 +100,18 @@ def as_binary():
 	response.data = frappe.response['filecontent']
 	return response
 
+def as_file():
+	"""Send the temporary file at `filepath` as attachment, it is removed once opened"""
+	filename = frappe.response['filename']
+	f = open(frappe.response['filepath'], 'rb')
+	os.remove(frappe.response['filepath'])
+
+	response = Response(wrap_file(frappe.local.request.environ, f), direct_passthrough=True)
+	response.content_length = os.fstat(f.fileno()).st_size
+	response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+	response.headers["Content-Disposition"] = ("attachment; filename=\"%s\"" % filename.replace(' ', '_')).encode("utf-8")
+	return response
+
 def make_logs(response = None):
 	"""make strings for msgprint and errprint"""
 	if not response:
@@ -162,11 +175,9 @@ def download_backup(path):
 
 def download_private_file(path):
 	"""Checks permissions and sends back private file"""
-	try:
-		_file = frappe.get_doc("File", {"file_url": path})
-		_file.is_downloadable()
+	from frappe.core.doctype.file.file import has_download_permission
 
-	except frappe.PermissionError:
+	if not has_download_permission(path):
 		raise Forbidden(_("You don't have permission to access this file"))
 
 	return send_private_file(path.split("/private", 1)[1])
@@ -176,7 +187,7 @@ def send_private_file(path):
 	path = os.path.join(frappe.local.conf.get('private_path', 'private'), path.strip("/"))
 	filename = os.path.basename(path)
 
-	if frappe.local.request.headers.get('X-Use-X-Accel-Redirect'):
+	if use_x_accel_redirect():
 		path = '/protected/' + path
 		response = Response()
 		response.headers['X-Accel-Redirect'] = quote(frappe.utils.encode(path))
@@ -188,7 +199,9 @@ def send_private_file(path):
 		except IOError:
 			raise NotFound
 
+		# sent with sendfile by servers that support `wsgi.file_wrapper`
 		response = Response(wrap_file(frappe.local.request.environ, f), direct_passthrough=True)
+		response.content_length = os.fstat(f.fileno()).st_size
 
 	# no need for content disposition and force download. let browser handle its opening.
 	# Except for those that can be injected with scripts.
@@ -203,6 +216,16 @@ def send_private_file(path):
 
 	return response
 
+def use_x_accel_redirect():
+	"""Let nginx send private files (from `/protected/`) if it sets the `X-Use-X-Accel-Redirect`
+	header, as in the nginx config generated by bench. `use_x_accel_redirect` in site config
+	sends them via nginx regardless of the header (1), or never (0)."""
+	conf = frappe.local.conf.get('use_x_accel_redirect')
+	if conf is not None:
+		return cint(conf) == 1
+
+	return bool(frappe.local.request.headers.get('X-Use-X-Accel-Redirect'))
+
 def handle_session_stopped():
 	frappe.respond_as_web_page(_("Updating"),
 		_("Your system is being updated. Please refresh again after a few moments"),
@@ -18,7 +18,7 @@ import frappe.utils
 import os
 from frappe.utils import get_sites
 from datetime import datetime
-from frappe.utils.background_jobs import enqueue, get_jobs, queue_timeout
+from frappe.utils.background_jobs import enqueue, is_job_queued, queue_timeout
 from frappe.limits import has_expired
 from frappe.utils.data import get_datetime, now_datetime
 from frappe.core.doctype.user.user import STANDARD_USERS
@@ -61,17 +61,16 @@ def enqueue_events_for_all_sites():
 		return
 
 	with frappe.init_site():
-		jobs_per_site = get_jobs()
 		sites = get_sites()
 
 	for site in sites:
 		try:
-			enqueue_events_for_site(site=site, queued_jobs=jobs_per_site[site])
+			enqueue_events_for_site(site=site)
 		except:
 			# it should try to enqueue other sites
 			print(frappe.get_traceback())
 
-def enqueue_events_for_site(site, queued_jobs):
+def enqueue_events_for_site(site, queued_jobs=None):
 	def log_and_raise():
 		frappe.logger(__name__).error('Exception in Enqueue Events for Site {0}'.format(site) +
 			'\n' + frappe.get_traceback())
@@ -103,7 +102,7 @@ def enqueue_events_for_site(site, queued_jobs):
 	finally:
 		frappe.destroy()
 
-def enqueue_events(site, queued_jobs):
+def enqueue_events(site, queued_jobs=None):
 	nowtime = frappe.utils.now_datetime()
 	last = frappe.db.get_value('System Settings', 'System Settings', 'scheduler_last_event')
 
@@ -146,8 +145,6 @@ def trigger(site, event, last=None, queued_jobs=(), now=False):
 
 	queue = 'long' if event.endswith('_long') else 'short'
 	timeout = queue_timeout[queue]
-	if not queued_jobs and not now:
-		queued_jobs = get_jobs(site=site, queue=queue)
 
 	if frappe.flags.in_test:
 		frappe.flags.ran_schedulers.append(event)
@@ -175,7 +172,8 @@ def trigger(site, event, last=None, queued_jobs=(), now=False):
 
 	for handler in events:
 		if not now:
-			if handler not in queued_jobs:
+			queued = (handler in queued_jobs) if queued_jobs else is_job_queued(handler, site=site)
+			if not queued:
 				enqueue(handler, queue, timeout, event)
 		else:
 			scheduler_task(site=site, event=event, handler=handler, now=True)
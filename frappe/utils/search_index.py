@@ -0,0 +1,222 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""On-disk inverted index for global search.
+
+With `"global_search_engine": "index"` in site config, `global_search.search` is
+served from this index instead of the fulltext index of `__global_search`, for
+hosts where fulltext search is slow or not tuned (minimum word length, stopwords).
+
+The index is kept in an SQLite file in the site folder (`global_search_index_path`
+in site config to change it). It is updated along with `__global_search` when the
+search queue is synced, and can be built from it with:
+
+	bench --site [site] execute frappe.utils.global_search.rebuild_search_index
+
+Words of the content are indexed in lower case. Every word of the query must match
+a word of the document as a prefix, and results are ranked by BM25 (prefix matches
+weighted lower). Query words shorter than `MIN_PREFIX_LENGTH` only match whole words,
+and at most `MAX_PREFIX_POSTINGS` postings of longer words are read for prefix matches,
+so that short prefixes typed into the search bar do not read the whole index.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import math
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from itertools import chain
+
+import frappe
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# weight of words that only start with a word of the query
+PREFIX_WEIGHT = 0.5
+
+# query words shorter than this only match whole words
+MIN_PREFIX_LENGTH = 3
+
+# postings read for the words that start with a query word
+MAX_PREFIX_POSTINGS = 10000
+
+POSTINGS_QUERY = '''SELECT p.token, p.document, p.frequency, d.doctype, d.name, d.published, d.length
+	FROM postings p JOIN documents d ON d.id = p.document'''
+
+SCHEMA = '''
+	CREATE TABLE IF NOT EXISTS documents (
+		id INTEGER PRIMARY KEY,
+		doctype TEXT NOT NULL,
+		name TEXT NOT NULL,
+		content TEXT,
+		published INTEGER NOT NULL DEFAULT 0,
+		title TEXT,
+		route TEXT,
+		length INTEGER NOT NULL,
+		UNIQUE (doctype, name)
+	);
+	CREATE TABLE IF NOT EXISTS postings (
+		token TEXT NOT NULL,
+		document INTEGER NOT NULL,
+		frequency INTEGER NOT NULL,
+		PRIMARY KEY (token, document)
+	) WITHOUT ROWID;
+	CREATE INDEX IF NOT EXISTS postings_document ON postings (document);
+	CREATE TABLE IF NOT EXISTS totals (
+		id INTEGER PRIMARY KEY CHECK (id = 1),
+		documents INTEGER NOT NULL,
+		length INTEGER NOT NULL
+	);
+	INSERT OR IGNORE INTO totals (id, documents, length) VALUES (1, 0, 0);
+'''
+
+word_pattern = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+	return word_pattern.findall((text or '').lower())
+
+class SearchIndex(object):
+	def __init__(self, path):
+		self.path = path
+
+	def connect(self):
+		conn = sqlite3.connect(self.path, timeout=30)
+		# readers are not blocked by the writer
+		conn.execute('PRAGMA journal_mode=WAL')
+		conn.executescript(SCHEMA)
+		return closing(conn)
+
+	def update(self, values):
+		"""Index or remove documents. `values` are dicts of doctype, name, content, published,
+		title, route or, for deleted documents, doctype, name, deleted"""
+		with self.connect() as conn, conn:
+			for value in values:
+				self.remove(conn, value['doctype'], value['name'])
+				if not value.get('deleted'):
+					self.add(conn, value)
+
+	def add(self, conn, value):
+		tokens = Counter(tokenize(value.get('content')))
+		length = sum(tokens.values())
+
+		document = conn.execute('''INSERT INTO documents
+			(doctype, name, content, published, title, route, length)
+			VALUES (?, ?, ?, ?, ?, ?, ?)''', (value['doctype'], value['name'], value.get('content'),
+			value.get('published') or 0, value.get('title'), value.get('route'), length)).lastrowid
+
+		conn.executemany('INSERT INTO postings (token, document, frequency) VALUES (?, ?, ?)',
+			[(token, document, frequency) for token, frequency in tokens.items()])
+		conn.execute('UPDATE totals SET documents = documents + 1, length = length + ?', (length,))
+
+	def remove(self, conn, doctype, name):
+		row = conn.execute('SELECT id, length FROM documents WHERE doctype = ? AND name = ?',
+			(doctype, name)).fetchone()
+		if row:
+			conn.execute('DELETE FROM postings WHERE document = ?', (row[0],))
+			conn.execute('DELETE FROM documents WHERE id = ?', (row[0],))
+			conn.execute('UPDATE totals SET documents = documents - 1, length = length - ?', (row[1],))
+
+	def delete_doctype(self, doctype):
+		with self.connect() as conn, conn:
+			conn.execute('''DELETE FROM postings WHERE document IN
+				(SELECT id FROM documents WHERE doctype = ?)''', (doctype,))
+			conn.execute('DELETE FROM documents WHERE doctype = ?', (doctype,))
+			conn.execute('''UPDATE totals SET
+				documents = (SELECT COUNT(*) FROM documents),
+				length = (SELECT COALESCE(SUM(length), 0) FROM documents)''')
+
+	def clear(self):
+		with self.connect() as conn, conn:
+			conn.execute('DELETE FROM postings')
+			conn.execute('DELETE FROM documents')
+			conn.execute('UPDATE totals SET documents = 0, length = 0')
+
+	def reindex(self, doctype=None):
+		"""Rebuild the index of `doctype` (or of all documents) from `__global_search`"""
+		if doctype:
+			self.delete_doctype(doctype)
+		else:
+			self.clear()
+
+		values = frappe.db.sql('''SELECT `doctype`, `name`, `content`, `published`, `title`, `route`
+			FROM `__global_search` {0}'''.format('WHERE `doctype` = %s' if doctype else ''),
+			(doctype,) if doctype else (), as_dict=True)
+
+		with self.connect() as conn, conn:
+			for value in values:
+				self.add(conn, value)
+
+	def search(self, terms, doctype=None, published=False, start=0, limit=20, after=None):
+		"""Returns documents that match all words of `terms`, ordered by relevance, doctype and name.
+		`after` is `[relevance, doctype, name]` of the last result of the previous page"""
+		tokens = set(token for term in terms for token in tokenize(term))
+		if not tokens:
+			return []
+
+		with self.connect() as conn:
+			total_documents, total_length = conn.execute(
+				'SELECT documents, length FROM totals').fetchone()
+			if not total_documents:
+				return []
+
+			average_length = float(total_length) / total_documents
+			scores, documents = None, {}
+
+			for token in tokens:
+				postings = {}
+				rows = conn.execute(POSTINGS_QUERY + ' WHERE p.token = ?', (token,))
+				if len(token) >= MIN_PREFIX_LENGTH:
+					rows = chain(rows, conn.execute(POSTINGS_QUERY + '''
+						WHERE p.token > ? AND p.token < ? LIMIT ?''',
+						(token, token + '\uffff', MAX_PREFIX_POSTINGS)))
+
+				for word, document, frequency, doc, name, is_published, length in rows:
+					postings.setdefault(word, []).append((document, frequency, length))
+					documents[document] = (doc, name, is_published)
+
+				token_scores = {}
+				for word, matches in postings.items():
+					idf = math.log(1 + (total_documents - len(matches) + 0.5) / (len(matches) + 0.5))
+					if word != token:
+						idf *= PREFIX_WEIGHT
+					for document, frequency, length in matches:
+						token_scores[document] = token_scores.get(document, 0) + idf * frequency * (K1 + 1) \
+							/ (frequency + K1 * (1 - B + B * length / average_length))
+
+				if scores is None:
+					scores = token_scores
+				else:
+					scores = dict((document, score + token_scores[document])
+						for document, score in scores.items() if document in token_scores)
+
+				if not scores:
+					return []
+
+			ranked = []
+			for document, score in scores.items():
+				doc, name, is_published = documents[document]
+				if (doctype and doc != doctype) or (published and not is_published):
+					continue
+				ranked.append((-round(score, 6), doc, name, document))
+
+			ranked.sort()
+			if after:
+				last = (-float(after[0]), after[1], after[2])
+				ranked = [r for r in ranked if r[:3] > last]
+			else:
+				ranked = ranked[start:]
+			ranked = ranked[:limit]
+
+			if not ranked:
+				return []
+
+			rows = dict((row[0], row[1:]) for row in conn.execute('''SELECT id, content, title, route
+				FROM documents WHERE id IN ({0})'''.format(', '.join(['?'] * len(ranked))),
+				[r[3] for r in ranked]))
+
+		return [frappe._dict(doctype=doc, name=name, content=rows[document][0], title=rows[document][1],
+			route=rows[document][2], relevance=-relevance) for relevance, doc, name, document in ranked]
@@ -0,0 +1,295 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Pre-forked background workers.
+
+A stock RQ worker forks a new work horse for every job, which then imports the
+job's modules and opens a new database connection before doing any work. With
+`bench worker --processes N` (or `worker_processes` in common site config), the
+worker instead forks N long lived processes that run jobs one after another in
+process, so imports stay loaded and database connections are pooled (see
+`frappe.database.pool`) across jobs.
+
+The site also stays initialised between jobs of the same site: its config (until
+the config files change), module map and database connection are kept, as is the
+DocType meta of earlier jobs, until `metadata_version` changes (see
+`frappe.clear_cache`). Other state of `frappe.local` is reset for every job (see
+`frappe.reset_local`). `bench worker-benchmark` compares this with `frappe.init`
+and `frappe.destroy` for every job.
+
+Jobs still run via `execute_job`, so retries on deadlocks and timeouts are the
+same. A process is replaced by a fresh one:
+
+- after `worker_max_jobs` jobs (default 1000)
+- when its memory (RSS) exceeds `worker_max_memory` MB after a job
+
+If the memory limit is exceeded while a job is running, the process is replaced
+once the job is done, and killed if the job does not finish within
+`MEMORY_KILL_GRACE` seconds.
+
+A process that fails (e.g. cannot connect to redis) logs the exception and exits
+non-zero, and is respawned after a delay that doubles with every consecutive failure,
+up to `RESPAWN_MAX_DELAY` seconds.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import copy
+import time
+import random
+import signal
+import traceback
+
+from rq import Connection, SimpleWorker
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_MAX_JOBS = 1000
+
+# seconds given to a process to finish its job after exceeding the memory limit
+MEMORY_KILL_GRACE = 60
+
+# seconds after which a connection kept between jobs is returned to the pool, and
+# checked when it is taken again
+MAX_IDLE_CONNECTION = 60
+
+# seconds before respawning a failed process, doubled for every consecutive failure
+RESPAWN_DELAY = 1
+RESPAWN_MAX_DELAY = 60
+
+# the site initialised by the previous job of this process
+_warm_site = {}
+
+class PreforkedWorker(SimpleWorker):
+	"""RQ worker that runs jobs in its own process, and stops after `max_jobs` jobs or
+	when it uses more than `max_memory` bytes, to be replaced by its parent"""
+	def __init__(self, *args, **kwargs):
+		self.max_jobs = kwargs.pop('max_jobs', None) or DEFAULT_MAX_JOBS
+		self.max_memory = kwargs.pop('max_memory', None)
+		self.jobs_done = 0
+		super(PreforkedWorker, self).__init__(*args, **kwargs)
+
+	def _install_signal_handlers(self):
+		super(PreforkedWorker, self)._install_signal_handlers()
+		signal.signal(signal.SIGUSR1, self.handle_memory_limit)
+
+	def handle_memory_limit(self, signum, frame):
+		# not raised here, the job could be anywhere (e.g. in a commit)
+		self.log.info('Recycling after the current job, memory limit exceeded')
+		self._stop_requested = True
+
+	def execute_job(self, job, queue):
+		self.perform_job(job, queue)
+
+		self.jobs_done += 1
+		if self.jobs_done >= self.max_jobs:
+			self.log.info('Recycling after {0} jobs'.format(self.jobs_done))
+			self._stop_requested = True
+
+		elif self.max_memory and get_memory_usage(os.getpid()) > self.max_memory:
+			self.log.info('Recycling, memory limit exceeded')
+			self._stop_requested = True
+
+def start_worker_pool(redis_connection, queues, processes, max_jobs=None, max_memory=None,
+	logging_level="INFO"):
+	"""Fork `processes` workers and replace them when they exit, until stopped by SIGINT or SIGTERM"""
+	max_memory = cint(max_memory) * 1024 * 1024
+	children = {}
+	stopping = []
+	# times at which to spawn a replacement
+	respawn_at = []
+	failures = 0
+
+	def spawn():
+		pid = os.fork()
+		if pid == 0:
+			exit_code = 1
+			try:
+				run_worker(redis_connection, queues, max_jobs, max_memory, logging_level)
+				exit_code = 0
+			except Exception:
+				traceback.print_exc()
+			finally:
+				# never return to the parent's loop in the forked process
+				os._exit(exit_code)
+
+		children[pid] = None
+
+	def stop(signum, frame):
+		stopping.append(signum)
+		if signum != signal.SIGTERM:
+			# SIGINT from the terminal is received by the whole process group,
+			# a second signal would make the workers abort their job
+			return
+
+		for pid in children:
+			try:
+				# warm shutdown, the running job is completed
+				os.kill(pid, signal.SIGTERM)
+			except OSError:
+				pass
+
+	signal.signal(signal.SIGTERM, stop)
+	signal.signal(signal.SIGINT, stop)
+
+	for i in range(processes):
+		spawn()
+
+	while children or (respawn_at and not stopping):
+		if not stopping:
+			while respawn_at and respawn_at[0] <= time.time():
+				respawn_at.pop(0)
+				spawn()
+
+		if not children:
+			time.sleep(1)
+			continue
+
+		try:
+			pid, status = os.waitpid(-1, os.WNOHANG)
+		except OSError:
+			break
+
+		if pid:
+			children.pop(pid, None)
+			if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+				failures = 0
+				respawn_at.append(time.time())
+			else:
+				failures += 1
+				respawn_at.append(time.time() + get_respawn_delay(failures))
+			respawn_at.sort()
+			continue
+
+		if max_memory:
+			check_memory(children, max_memory)
+
+		time.sleep(1)
+
+def get_respawn_delay(failures):
+	"""Returns seconds to wait before respawning after `failures` consecutive failures"""
+	return min(RESPAWN_DELAY * 2 ** (failures - 1), RESPAWN_MAX_DELAY)
+
+def run_worker(redis_connection, queues, max_jobs, max_memory, logging_level):
+	from frappe.database import pool
+	from frappe.utils import background_jobs
+
+	# the worker installs its own handlers
+	signal.signal(signal.SIGTERM, signal.SIG_DFL)
+	signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+	# do not share the random state with the parent and siblings
+	random.seed()
+
+	pool.enable_for_process()
+	background_jobs.keep_site_warm = True
+
+	with Connection(redis_connection):
+		worker = PreforkedWorker(queues, max_jobs=max_jobs, max_memory=max_memory)
+		worker.work(logging_level=logging_level)
+
+def init_site(site):
+	"""Initialise `site` for a job. If the previous job of this process was for the same
+	site, the site stays initialised and only the state of the previous job is reset"""
+	config_mtime = get_config_mtime(site)
+	if not (getattr(frappe.local, "initialised", False) and _warm_site.get("site") == site
+		and _warm_site.get("config_mtime") == config_mtime):
+		frappe.destroy()
+		frappe.connect(site)
+		_warm_site.update(site=site, config_mtime=config_mtime, idle_since=None,
+			conf=copy.deepcopy(frappe.local.conf),
+			metadata_version=frappe.cache().get_value("metadata_version"))
+		return
+
+	meta_cache = frappe.local.meta_cache
+	# in case the previous job changed it
+	frappe.local.conf = copy.deepcopy(_warm_site["conf"])
+	frappe.reset_local()
+	frappe.set_user("Administrator")
+	frappe.db.value_cache = {}
+	frappe.db.has_writes = False
+
+	# meta of earlier jobs, if no DocType has changed since
+	metadata_version = frappe.cache().get_value("metadata_version")
+	if metadata_version == _warm_site.get("metadata_version"):
+		frappe.local.meta_cache = meta_cache
+	_warm_site["metadata_version"] = metadata_version
+
+	if time.time() - (_warm_site.get("idle_since") or time.time()) > MAX_IDLE_CONNECTION:
+		# checked by the pool when connecting again
+		frappe.db.close()
+
+def end_job():
+	"""Called after every job instead of `frappe.destroy`"""
+	from frappe.database.replica import close_replica_connections
+
+	close_replica_connections()
+	_warm_site["idle_since"] = time.time()
+
+def get_config_mtime(site):
+	"""Returns the last modification time of the site's config files"""
+	mtime = 0
+	for path in ("common_site_config.json", os.path.join(site, "site_config.json")):
+		try:
+			mtime = max(mtime, os.path.getmtime(path))
+		except OSError:
+			pass
+
+	return mtime
+
+def check_memory(children, max_memory):
+	"""Ask processes over the memory limit to stop after their job, and kill them if they
+	do not within `MEMORY_KILL_GRACE` seconds"""
+	for pid, signalled_at in list(children.items()):
+		if get_memory_usage(pid) <= max_memory:
+			children[pid] = None
+			continue
+
+		try:
+			if signalled_at is None:
+				os.kill(pid, signal.SIGUSR1)
+				children[pid] = time.time()
+
+			elif time.time() - signalled_at > MEMORY_KILL_GRACE:
+				os.kill(pid, signal.SIGKILL)
+		except OSError:
+			pass
+
+def get_memory_usage(pid):
+	"""Returns resident memory of the process in bytes (0 if unknown, outside Linux)"""
+	try:
+		with open('/proc/{0}/statm'.format(pid)) as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (IOError, OSError, ValueError, IndexError):
+		return 0
+
+def benchmark(site, jobs=1000, method="frappe.utils.worker_pool.benchmark_job"):
+	"""Runs `jobs` jobs of `method` via `execute_job` in this process, with the site
+	initialised for every job (`cold`) and kept between jobs (`warm`, as in pre-forked
+	workers). Returns jobs per second of each."""
+	from frappe.database import pool
+	from frappe.utils import background_jobs
+
+	pool.enable_for_process()
+	results = frappe._dict()
+	for warm in (False, True):
+		background_jobs.keep_site_warm = warm
+		try:
+			start = time.time()
+			for i in range(jobs):
+				background_jobs.execute_job(site, method, None, "benchmark", {})
+			results["warm" if warm else "cold"] = jobs / (time.time() - start)
+		finally:
+			background_jobs.keep_site_warm = False
+			frappe.destroy()
+			_warm_site.clear()
+
+	return results
+
+def benchmark_job():
+	"""A short job, reads hooks, meta and a value"""
+	frappe.get_hooks("doc_events")
+	frappe.get_meta("ToDo")
+	frappe.db.get_value("User", "Administrator", "enabled")